@@ -3,52 +3,390 @@ from datetime import datetime
 from io import BytesIO
 import base64
 import json
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 from PIL import Image
 import requests
+from urllib3.util.retry import Retry
+
+from cancellable_http import AbortableHTTPAdapter, abortable
+from heightfield import save_heightfield
+from procedural import generate_heightfield_array
+from rate_limiter import RequestScheduler
+from request_body import StreamingJSONBody
+from response_cache import ResponseCache
+from tiled_heightfield import TiledHeightfield, erode_store
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+IMAGE_MODEL = "gemini-3-pro-image-preview"
+TEXT_MODEL = "gemini-2.0-flash"
+
+# Tile border of the scratch store a heightmap is saved through; erode_tiled's default, wide
+# enough that tiled erosion matches eroding the whole map
+STORE_OVERLAP = 48
+# Longest edge of the preview PNG saved next to each heightfield
+PREVIEW_SIZE = 512
+
+# Appended to the heightmap/texture prompts when generating one tile of a larger map
+CONTEXT_PROMPT = """
+        **SEAMLESS TILE**: One extra attached image is a CONTEXT CANVAS the same size as your output.
+        Its flat mid-grey area is unknown; every other band (along the left and/or top edge) is the
+        edge of an already generated neighbouring {kind}. Reproduce those bands exactly in the same
+        position and continue them smoothly into the rest of your {kind}, so the tiles join without
+        a visible seam.
+        """
+
+# Prompts keep their original indentation: it is part of every cached request's key
+HEIGHTMAP_PROMPT = """
+        You are an expert Terrain Artist AI.
+        **TASK**: Generate a **Heightmap** based on the attached reference images.
+        **REQUIREMENTS**:
+        1. **View**: Strictly TOP-DOWN ORTHOGRAPHIC (satellite/nadir, 0° tilt). No side, oblique, or perspective mixes; horizon must never appear.
+        2. **Format**: 1:1 Square aspect ratio.
+        3. **Style**: 16-bit style grayscale heightmap. White = High, Black = Low.
+        4. **Content**: Hallucinate realistic terrain details (erosion, mountains) implied by the references.
+        5. **Consistency**: If any angled/side view would appear, regenerate to keep strict top-down.
+        **OUTPUT**: Return ONLY the heightmap image.
+        """
+
+TEXTURE_PROMPT = """
+        You are an expert Terrain Artist AI.
+        **INPUT**: 
+        1. The first image attached is a **Heightmap** you just generated.
+        2. The other images are reference photos for style/colors.
+        
+        **TASK**: Generate a **Texture Map** that perfectly matches the provided Heightmap.
+        **REQUIREMENTS**:
+        1. **View**: Strictly TOP-DOWN ORTHOGRAPHIC (satellite/nadir, 0° tilt). No side, oblique, or perspective mixes; horizon must never appear. Must align 1:1 with the heightmap.
+        2. **Format**: 1:1 Square aspect ratio.
+        3. **Style**: Realistic satellite texture (rock, snow, grass) based on the elevation in the heightmap and style from references.
+        4. **Consistency**: If any angled/side view would appear, regenerate to keep strict top-down.
+        **OUTPUT**: Return ONLY the texture map image.
+        """
+
+SUN_PROMPT = """
+        You are a lighting TD. From the attached sky photo, estimate the sun direction.
+        Return ONLY compact JSON with keys: sun_azimuth_deg (0-360, clockwise from North) and sun_elevation_deg (-10 to 90).
+        Example: {"sun_azimuth_deg": 215, "sun_elevation_deg": 14}
+        Do not include any extra text.
+        """
+
+ATMOSPHERE_PROMPT = """
+        You are an expert Terragen TD. Analyze the attached sky/cloud reference and return **concise JSON only** describing the atmosphere and clouds. 
+        Provide specific Terragen 4 parameter values where possible.
+        Schema:
+        {
+          "sun": {
+            "azimuth_deg": number, 
+            "elevation_deg": number
+          },
+          "cloud_layers": [
+            {
+              "type": "cumulus|stratocumulus|cirrus|altocumulus|altostratus|cumulonimbus|nimbus|fog|haze|other",
+              "coverage_pct": number,
+              "density": "low|medium|high",
+              "softness": "soft|medium|crisp",
+              "base_alt_km": number,
+              "top_alt_km": number,
+              "thickness_m": number,
+              "notes": "short free text"
+            }
+          ],
+          "atmosphere": {
+            "haze": "low|medium|high",
+            "visibility_km": number,
+            "tint": "short color hint",
+            "light_level": "low|medium|high",
+            "terragen_params": {
+                "haze_density": number (0.0-10.0, default ~2.0),
+                "bluesky_density": number (0.0-10.0, default ~2.0),
+                "bluesky_horizon_colour": "R G B" (e.g. "0.2 0.4 0.6"),
+                "haze_horizon_colour": "R G B" (e.g. "0.5 0.5 0.5")
+            }
+          }
+        }
+        Keep under 120 words; return valid JSON only, no extra text.
+        """
+
+
+class PayloadBudget:
+    """
+    Size budget for reference images sent to Gemini. Images are downscaled to
+    ``max_long_edge`` and re-encoded, stepping quality down (then size) until the
+    encoded bytes fit ``max_bytes``.
+    """
+
+    def __init__(self, max_long_edge=2048, max_bytes=1500 * 1024, quality=90, min_quality=60,
+                 quality_step=10, min_long_edge=512, use_webp=False):
+        self.max_long_edge = max_long_edge
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.min_quality = min_quality
+        self.quality_step = quality_step
+        self.min_long_edge = min_long_edge
+        self.use_webp = use_webp
+
+    @property
+    def image_format(self):
+        return "WEBP" if self.use_webp else "JPEG"
+
+    @property
+    def mime_type(self):
+        return "image/webp" if self.use_webp else "image/jpeg"
+
+    def settings_key(self):
+        return (self.image_format, self.max_long_edge, self.max_bytes, self.quality,
+                self.min_quality, self.quality_step, self.min_long_edge)
+
 
 class TerrainGeneratorAPI:
-    def __init__(self):
+    def __init__(self, session=None, base_url=GEMINI_BASE_URL, pool_connections=4, pool_maxsize=16,
+                 timeout=(10, 300), text_timeout=(10, 60), max_call_seconds=600, max_retries=3,
+                 response_cache=None, encode_workers=4, encode_cache_bytes=256 * 1024 * 1024,
+                 payload_budget=None, scheduler=None):
+        """
+        All Gemini calls share one pooled ``requests.Session`` so steps reuse kept-alive
+        TLS connections. Pass ``session``/``base_url`` to point the client at a stub server.
+        ``pool_maxsize`` caps connections per host. ``timeout`` is (connect, read) seconds for
+        image generation and ``text_timeout`` for text analysis; since the read timeout only
+        bounds the gap between bytes, ``max_call_seconds`` also caps each request's total time.
+        Calls given a ``cancel_token`` abort their in-flight request as soon as it is cancelled.
+        ``response_cache`` defaults to an on-disk ``ResponseCache``; pass one with
+        ``enabled=False`` to always hit the API. Encoded reference payloads are memoized
+        in memory (up to ``encode_cache_bytes``) and encoded on ``encode_workers`` threads.
+        ``payload_budget`` (a ``PayloadBudget``) bounds the size of every uploaded image.
+        ``scheduler`` (a ``RequestScheduler``) enforces per-model quotas and retries 429/503;
+        share one instance between APIs that draw on the same key.
+        """
         # Try to get API key from environment variable
         self.api_key = os.getenv("GOOGLE_API_KEY")
-        
-    def _prepare_image_payload(self, image_source):
-        """Helper to convert PIL Image or file path to API payload"""
-        try:
-            if isinstance(image_source, str):
-                img = Image.open(image_source)
-            else:
-                img = image_source
-                
-            if img.mode != 'RGB': img = img.convert('RGB')
-            buffered = BytesIO()
-            img.save(buffered, format="JPEG")
-            img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            return {"inline_data": {"mime_type": "image/jpeg", "data": img_str}}
-        except Exception as e:
-            print(f"Failed to process image: {e}")
-            return None
-
-    def _call_gemini(self, content_parts, log_callback):
-        """Helper to send request to Gemini and parse images"""
-        model_name = "gemini-3-pro-image-preview" 
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={self.api_key}"
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.text_timeout = text_timeout
+        self.max_call_seconds = max_call_seconds
+        self._owns_session = session is None
+        self.session = session or self._create_session(pool_connections, pool_maxsize, max_retries)
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.scheduler = scheduler or RequestScheduler()
+        self.payload_budget = payload_budget or PayloadBudget()
+        self.encode_workers = encode_workers
+        self.encode_cache_bytes = encode_cache_bytes
+        self._encode_cache = OrderedDict()
+        self._encode_cache_size = 0
+        self._encode_cache_lock = threading.Lock()
+
+    def _create_session(self, pool_connections, pool_maxsize, max_retries):
+        """Build a keep-alive session with a bounded connection pool and retrying adapter."""
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            backoff_factor=1.0,
+            # 429/503 are quota signals; RequestScheduler retries those with shared backoff
+            status_forcelist=(500, 502, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = AbortableHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        """Release pooled connections (only when the session was created here)."""
+        if self._owns_session and self.session is not None:
+            self.session.close()
+
+    @staticmethod
+    def _estimate_tokens(payload):
+        """Rough input-token estimate for TPM budgeting (~4 chars/token, ~258 tokens per image tile)."""
+        tokens = 0
+        for content in payload.get("contents", []):
+            for part in content.get("parts", []):
+                if "inline_data" in part:
+                    tokens += 258
+                else:
+                    tokens += len(part.get("text", "")) // 4
+        return tokens
+
+    def _post_generate(self, model_name, payload, log_callback=print, timeout=None, cancel_token=None):
+        """POST a generateContent request through the scheduler and shared session, streaming the JSON body."""
+        url = f"{self.base_url}/models/{model_name}:generateContent"
+        body = StreamingJSONBody(payload)
+
+        def send():
+            if cancel_token:
+                cancel_token.check()
+            with abortable(cancel_token, deadline=self.max_call_seconds):
+                # Set per request: an injected session need not carry it, and a streamed body gets no default
+                return self.session.post(
+                    url,
+                    params={"key": self.api_key},
+                    data=body,
+                    headers={"Content-Type": "application/json"},
+                    timeout=timeout or self.timeout,
+                )
+
+        return self.scheduler.submit(model_name, send, self._estimate_tokens(payload), log_callback, cancel_token)
+
+    def _generate_content(self, model_name, content_parts, log_callback, use_cache=True, label="", timeout=None,
+                          cancel_token=None):
+        """Send a generateContent request, or serve it from the response cache; return the JSON or None."""
         payload = {"contents": [{"parts": content_parts}]}
-        
-        log_callback(f"Sending request to {model_name}...")
-        response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
-        
+        cache_key, cached = self._cached_response(model_name, payload, log_callback, use_cache, label)
+        if cached is not None:
+            return cached
+
+        log_callback(f"Sending request to {model_name}{label}...")
+        response = self._post_generate(model_name, payload, log_callback, timeout, cancel_token)
+        return self._finish_response(response, model_name, cache_key, log_callback)
+
+    def _cached_response(self, model_name, payload, log_callback, use_cache=True, label=""):
+        """(cache key, cached JSON or None); the key is None when caching is off."""
+        if not (use_cache and self.response_cache.enabled):
+            return None, None
+        cache_key = self.response_cache.make_key(model_name, payload)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            log_callback(f"Using cached {model_name} response{label}.")
+        return cache_key, cached
+
+    def _finish_response(self, response, model_name, cache_key, log_callback):
+        """Decode a generateContent response (requests or httpx), raising on HTTP errors, and cache it."""
         try:
             # print(f"DEBUG STATUS: {response.status_code}") # Reduced debug noise
             result_json = response.json()
         except Exception as e:
             log_callback(f"Failed to decode response: {e}")
-            return []
+            return None
 
         if response.status_code != 200:
             log_callback(f"API Error {response.status_code}: {result_json}")
             response.raise_for_status()
 
+        # Only cache usable answers so a blocked/empty response is retried next time
+        if cache_key and result_json.get('candidates'):
+            self.response_cache.put(cache_key, result_json, model_name)
+        return result_json
+
+    def _encode_settings(self):
+        """Everything that changes the encoded bytes of a reference; part of the encode cache key."""
+        return self.payload_budget.settings_key()
+
+    def _encode_cache_key(self, path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size, self._encode_settings())
+
+    def _encode_cache_get(self, key):
+        with self._encode_cache_lock:
+            payload = self._encode_cache.get(key)
+            if payload is not None:
+                self._encode_cache.move_to_end(key)
+            return payload
+
+    def _encode_cache_put(self, key, payload):
+        size = len(payload["inline_data"]["data"])
+        if size > self.encode_cache_bytes:
+            return
+        with self._encode_cache_lock:
+            if key in self._encode_cache:
+                return
+            self._encode_cache[key] = payload
+            self._encode_cache_size += size
+            while self._encode_cache_size > self.encode_cache_bytes:
+                _, old = self._encode_cache.popitem(last=False)
+                self._encode_cache_size -= len(old["inline_data"]["data"])
+
+    def _encode_within_budget(self, img):
+        """Downscale/re-encode an image until it fits the payload budget; return (bytes, size, quality)."""
+        budget = self.payload_budget
+        if img.mode != 'RGB': img = img.convert('RGB')
+
+        long_edge = max(img.size)
+        if budget.max_long_edge and long_edge > budget.max_long_edge:
+            scale = budget.max_long_edge / long_edge
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS, reducing_gap=2.0)
+
+        quality = budget.quality
+        while True:
+            buffered = BytesIO()
+            img.save(buffered, format=budget.image_format, quality=quality)
+            data = buffered.getvalue()
+            if not budget.max_bytes or len(data) <= budget.max_bytes:
+                break
+            if quality - budget.quality_step >= budget.min_quality:
+                quality -= budget.quality_step
+                continue
+            if max(img.size) * 0.75 < budget.min_long_edge:
+                break
+            # Quality floor reached; shrink and start again from the top quality
+            img = img.resize((max(1, int(img.width * 0.75)), max(1, int(img.height * 0.75))), Image.LANCZOS)
+            quality = budget.quality
+        return data, img.size, quality
+
+    def _prepare_image_payload(self, image_source, log_callback=print):
+        """Helper to convert PIL Image or file path to API payload"""
+        try:
+            cache_key = None
+            if isinstance(image_source, str):
+                cache_key = self._encode_cache_key(image_source)
+                cached = self._encode_cache_get(cache_key)
+                if cached is not None:
+                    return cached
+                source_bytes = os.path.getsize(image_source)
+                # Closed before returning: parallel encodes must not hold file handles open
+                with Image.open(image_source) as img:
+                    original_size = img.size
+                    # JPEG sources can decode straight at a reduced DCT scale, skipping most of the pixels
+                    edge = self.payload_budget.max_long_edge
+                    if edge:
+                        img.draft('RGB', (edge, edge))
+                    data, size, quality = self._encode_within_budget(img)
+                change = (source_bytes - len(data)) // 1024
+                log_callback(
+                    f"Encoded {os.path.basename(image_source)}: {original_size[0]}x{original_size[1]} -> {size[0]}x{size[1]} "
+                    f"q{quality}, {source_bytes // 1024} KB -> {len(data) // 1024} KB "
+                    + (f"(saved {change} KB)" if change >= 0 else f"({-change} KB larger)")
+                )
+            else:
+                data, size, quality = self._encode_within_budget(image_source)
+
+            # Keep raw encoded bytes; StreamingJSONBody base64s them chunk by chunk at send time
+            payload = {"inline_data": {"mime_type": self.payload_budget.mime_type, "data": data}}
+            if cache_key:
+                self._encode_cache_put(cache_key, payload)
+            return payload
+        except Exception as e:
+            log_callback(f"Failed to process image: {e}")
+            return None
+
+    def _prepare_image_payloads(self, image_sources, log_callback=print):
+        """Encode several references concurrently (Pillow releases the GIL); keeps order, drops failures."""
+        if len(image_sources) <= 1 or self.encode_workers <= 1:
+            payloads = [self._prepare_image_payload(src, log_callback) for src in image_sources]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.encode_workers, len(image_sources))) as pool:
+                payloads = list(pool.map(lambda src: self._prepare_image_payload(src, log_callback), image_sources))
+        return [p for p in payloads if p]
+
+    def _call_gemini(self, content_parts, log_callback, use_cache=True, cancel_token=None):
+        """Helper to send request to Gemini and parse images"""
+        result_json = self._generate_content(IMAGE_MODEL, content_parts, log_callback, use_cache,
+                                             cancel_token=cancel_token)
+        return self._images_from_response(result_json, log_callback)
+
+    @staticmethod
+    def _images_from_response(result_json, log_callback):
+        if result_json is None:
+            return []
+
         generated_images = []
         try:
             candidates = result_json.get('candidates', [])
@@ -74,23 +412,18 @@ class TerrainGeneratorAPI:
             
         return generated_images
 
-    def _call_gemini_text(self, content_parts, log_callback, model_name="gemini-2.0-flash"):
+    def _call_gemini_text(self, content_parts, log_callback, model_name=TEXT_MODEL, use_cache=True,
+                          cancel_token=None):
         """Helper to send request to Gemini and return concatenated text"""
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={self.api_key}"
-        payload = {"contents": [{"parts": content_parts}]}
-        log_callback(f"Sending request to {model_name} for text analysis...")
-        response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
+        result_json = self._generate_content(model_name, content_parts, log_callback, use_cache, label=" for text analysis",
+                                             timeout=self.text_timeout, cancel_token=cancel_token)
+        return self._text_from_response(result_json, log_callback)
 
-        try:
-            result_json = response.json()
-        except Exception as e:
-            log_callback(f"Failed to decode response: {e}")
+    @staticmethod
+    def _text_from_response(result_json, log_callback):
+        if result_json is None:
             return ""
 
-        if response.status_code != 200:
-            log_callback(f"API Error {response.status_code}: {result_json}")
-            response.raise_for_status()
-
         try:
             candidates = result_json.get('candidates', [])
             if not candidates:
@@ -106,29 +439,24 @@ class TerrainGeneratorAPI:
             log_callback(f"Failed to extract text: {e}")
             return ""
 
-    def analyze_sun_angles(self, image_path, status_callback=None):
+    def analyze_sun_angles(self, image_path, status_callback=None, use_cache=True, cancel_token=None):
         def log(message):
             if status_callback: status_callback(message)
             print(message)
 
-        if not self.api_key:
-            self.api_key = os.getenv("GOOGLE_API_KEY")
-            if not self.api_key:
-                raise ValueError("Google API Key not found.")
+        self._ensure_api_key()
 
-        payload = self._prepare_image_payload(image_path)
+        payload = self._prepare_image_payload(image_path, log)
         if not payload:
             raise ValueError("Invalid sky reference image.")
 
-        prompt = """
-        You are a lighting TD. From the attached sky photo, estimate the sun direction.
-        Return ONLY compact JSON with keys: sun_azimuth_deg (0-360, clockwise from North) and sun_elevation_deg (-10 to 90).
-        Example: {"sun_azimuth_deg": 215, "sun_elevation_deg": 14}
-        Do not include any extra text.
-        """
+        parts = [payload, {"text": SUN_PROMPT}]
+        raw = self._call_gemini_text(parts, log, use_cache=use_cache, cancel_token=cancel_token)
+        return self._parse_sun_angles(raw, log)
 
-        parts = [payload, {"text": prompt}]
-        raw = self._call_gemini_text(parts, log)
+    @staticmethod
+    def _parse_sun_angles(raw, log):
+        """Sun azimuth/elevation dict from the model's text answer."""
         if not raw:
             raise Exception("No sun analysis returned.")
 
@@ -143,145 +471,127 @@ class TerrainGeneratorAPI:
             log(f"Failed to parse sun JSON: {e}")
         raise Exception("Could not parse sun azimuth/elevation from analysis.")
 
-    def generate_heightmap_images(self, image_paths, generate_texture=True, status_callback=None):
-        def log(message):
-            if status_callback: status_callback(message)
-            print(message)
-
+    def _ensure_api_key(self):
         if not self.api_key:
             self.api_key = os.getenv("GOOGLE_API_KEY")
             if not self.api_key:
                 raise ValueError("Google API Key not found.")
 
-        # --- Prepare Reference Images ---
-        reference_payloads = []
-        for path in image_paths:
-            payload = self._prepare_image_payload(path)
-            if payload: reference_payloads.append(payload)
-
+    def prepare_reference_payloads(self, image_paths, log_callback=print):
+        """Encode reference images for the heightmap/texture steps; raises if none are usable."""
+        self._ensure_api_key()
+        reference_payloads = self._prepare_image_payloads(image_paths, log_callback)
         if not reference_payloads:
             raise ValueError("No valid reference images found.")
+        return reference_payloads
 
-        # --- STEP 1: Generate Heightmap ---
-        log("Step 1/2: Generating Heightmap (1:1 Square, Top-Down)...")
-        
-        prompt_hf = """
-        You are an expert Terrain Artist AI.
-        **TASK**: Generate a **Heightmap** based on the attached reference images.
-        **REQUIREMENTS**:
-        1. **View**: Strictly TOP-DOWN ORTHOGRAPHIC (satellite/nadir, 0° tilt). No side, oblique, or perspective mixes; horizon must never appear.
-        2. **Format**: 1:1 Square aspect ratio.
-        3. **Style**: 16-bit style grayscale heightmap. White = High, Black = Low.
-        4. **Content**: Hallucinate realistic terrain details (erosion, mountains) implied by the references.
-        5. **Consistency**: If any angled/side view would appear, regenerate to keep strict top-down.
-        **OUTPUT**: Return ONLY the heightmap image.
+    def _heightmap_parts(self, reference_payloads, context_img, log):
+        prompt_hf = HEIGHTMAP_PROMPT
+        context = []
+        if context_img is not None:
+            context = [self._prepare_image_payload(context_img, log)]
+            prompt_hf += CONTEXT_PROMPT.format(kind="heightmap")
+        return reference_payloads + context + [{"text": prompt_hf}]
+
+    def _texture_parts(self, heightmap_img, reference_payloads, context_img, log):
+        # Convert generated heightmap to payload
+        hf_payload = self._prepare_image_payload(heightmap_img, log)
+        prompt_tex = TEXTURE_PROMPT
+        context = []
+        if context_img is not None:
+            context = [self._prepare_image_payload(context_img, log)]
+            prompt_tex += CONTEXT_PROMPT.format(kind="texture map")
+        # Order: Heightmap first, then references (and context canvas), then prompt
+        return [hf_payload] + reference_payloads + context + [{"text": prompt_tex}]
+
+    def generate_heightmap_step(self, reference_payloads, log_callback=print, use_cache=True, context_img=None,
+                                cancel_token=None):
         """
+        Step 1: generate the top-down heightmap from encoded references. ``context_img`` is an
+        optional conditioning canvas (see ``tiled_generation``) whose non-grey bands the new
+        heightmap must continue seamlessly.
+        """
+        log = log_callback
+        log("Step 1/2: Generating Heightmap (1:1 Square, Top-Down)...")
         
-        parts_step1 = reference_payloads + [{"text": prompt_hf}]
-        hf_images = self._call_gemini(parts_step1, log)
+        parts_step1 = self._heightmap_parts(reference_payloads, context_img, log)
+        hf_images = self._call_gemini(parts_step1, log, use_cache, cancel_token)
         
         if not hf_images:
             raise Exception("Failed to generate heightmap in Step 1.")
             
         heightmap_img = hf_images[0]
         log("Heightmap generated successfully.")
+        return heightmap_img
 
-        if not generate_texture:
-            log("Texture generation skipped by user.")
-            return [heightmap_img]
-
-        # --- STEP 2: Generate Texture ---
-        log("Step 2/2: Generating Texture Map (Matching Heightmap)...")
-        
-        # Convert generated heightmap to payload
-        hf_payload = self._prepare_image_payload(heightmap_img)
-        
-        prompt_tex = """
-        You are an expert Terrain Artist AI.
-        **INPUT**: 
-        1. The first image attached is a **Heightmap** you just generated.
-        2. The other images are reference photos for style/colors.
-        
-        **TASK**: Generate a **Texture Map** that perfectly matches the provided Heightmap.
-        **REQUIREMENTS**:
-        1. **View**: Strictly TOP-DOWN ORTHOGRAPHIC (satellite/nadir, 0° tilt). No side, oblique, or perspective mixes; horizon must never appear. Must align 1:1 with the heightmap.
-        2. **Format**: 1:1 Square aspect ratio.
-        3. **Style**: Realistic satellite texture (rock, snow, grass) based on the elevation in the heightmap and style from references.
-        4. **Consistency**: If any angled/side view would appear, regenerate to keep strict top-down.
-        **OUTPUT**: Return ONLY the texture map image.
+    def generate_texture_step(self, heightmap_img, reference_payloads, log_callback=print, use_cache=True,
+                              context_img=None, cancel_token=None):
         """
+        Step 2: generate a texture aligned to ``heightmap_img``; returns None if Gemini gave nothing back.
+        ``context_img`` works as in ``generate_heightmap_step``.
+        """
+        log = log_callback
+        log("Step 2/2: Generating Texture Map (Matching Heightmap)...")
         
-        # Order: Heightmap first, then references, then prompt
-        parts_step2 = [hf_payload] + reference_payloads + [{"text": prompt_tex}]
-        tex_images = self._call_gemini(parts_step2, log)
+        parts_step2 = self._texture_parts(heightmap_img, reference_payloads, context_img, log)
+        tex_images = self._call_gemini(parts_step2, log, use_cache, cancel_token)
         
         if not tex_images:
-            log("Warning: Failed to generate texture in Step 2. Returning only heightmap.")
-            return [heightmap_img]
+            log("Warning: Failed to generate texture in Step 2.")
+            return None
             
-        texture_img = tex_images[0]
         log("Texture map generated successfully.")
+        return tex_images[0]
+
+    def generate_heightmap_images(self, image_paths, generate_texture=True, status_callback=None, use_cache=True,
+                                  cancel_token=None):
+        """
+        Heightmap (and optional texture) images for ``image_paths``. ``cancel_token`` (a
+        ``CancelToken``) aborts the in-flight Gemini request and raises ``JobCancelled``.
+        """
+        def log(message):
+            if status_callback: status_callback(message)
+            print(message)
+
+        # --- Prepare Reference Images ---
+        reference_payloads = self.prepare_reference_payloads(image_paths, log)
+
+        # --- STEP 1: Generate Heightmap ---
+        heightmap_img = self.generate_heightmap_step(reference_payloads, log, use_cache, cancel_token=cancel_token)
+
+        if not generate_texture:
+            log("Texture generation skipped by user.")
+            return [heightmap_img]
+
+        # --- STEP 2: Generate Texture ---
+        texture_img = self.generate_texture_step(heightmap_img, reference_payloads, log, use_cache,
+                                                 cancel_token=cancel_token)
+        if texture_img is None:
+            log("Returning only heightmap.")
+            return [heightmap_img]
 
         return [heightmap_img, texture_img]
 
-    def analyze_atmosphere(self, image_path, status_callback=None):
+    def analyze_atmosphere(self, image_path, status_callback=None, use_cache=True, cancel_token=None):
         def log(message):
             if status_callback: status_callback(message)
             print(message)
 
-        if not self.api_key:
-            self.api_key = os.getenv("GOOGLE_API_KEY")
-            if not self.api_key:
-                raise ValueError("Google API Key not found.")
+        self._ensure_api_key()
 
-        payload = self._prepare_image_payload(image_path)
+        payload = self._prepare_image_payload(image_path, log)
         if not payload:
             raise ValueError("Invalid sky reference image.")
 
-        prompt = """
-        You are an expert Terragen TD. Analyze the attached sky/cloud reference and return **concise JSON only** describing the atmosphere and clouds. 
-        Provide specific Terragen 4 parameter values where possible.
-        Schema:
-        {
-          "sun": {
-            "azimuth_deg": number, 
-            "elevation_deg": number
-          },
-          "cloud_layers": [
-            {
-              "type": "cumulus|stratocumulus|cirrus|altocumulus|altostratus|cumulonimbus|nimbus|fog|haze|other",
-              "coverage_pct": number,
-              "density": "low|medium|high",
-              "softness": "soft|medium|crisp",
-              "base_alt_km": number,
-              "top_alt_km": number,
-              "thickness_m": number,
-              "notes": "short free text"
-            }
-          ],
-          "atmosphere": {
-            "haze": "low|medium|high",
-            "visibility_km": number,
-            "tint": "short color hint",
-            "light_level": "low|medium|high",
-            "terragen_params": {
-                "haze_density": number (0.0-10.0, default ~2.0),
-                "bluesky_density": number (0.0-10.0, default ~2.0),
-                "bluesky_horizon_colour": "R G B" (e.g. "0.2 0.4 0.6"),
-                "haze_horizon_colour": "R G B" (e.g. "0.5 0.5 0.5")
-            }
-          }
-        }
-        Keep under 120 words; return valid JSON only, no extra text.
-        """
-
-        parts = [payload, {"text": prompt}]
-        result = self._call_gemini_text(parts, log)
+        parts = [payload, {"text": ATMOSPHERE_PROMPT}]
+        result = self._call_gemini_text(parts, log, use_cache=use_cache, cancel_token=cancel_token)
         if not result:
             raise Exception("No analysis returned for sky reference.")
         return result
 
-    def generate_heightfield(self, image_paths, generate_texture=True, status_callback=None):
+    def generate_heightfield(self, image_paths, generate_texture=True, status_callback=None, use_cache=True,
+                             output_dir=None, name=None, erode=True, output_format="png16", deband=True,
+                             upscale_to=None, cancel_token=None):
         """Generate heightmap (and optional texture), save to disk, and return file paths."""
 
         def log(message):
@@ -290,26 +600,110 @@ class TerrainGeneratorAPI:
             print(message)
 
         # Reuse the existing image generation pipeline
-        images = self.generate_heightmap_images(image_paths, generate_texture, status_callback=log)
+        images = self.generate_heightmap_images(image_paths, generate_texture, status_callback=log, use_cache=use_cache,
+                                                cancel_token=cancel_token)
         if not images:
             raise Exception("No images returned from Gemini.")
+        # Last chance to stop before the (slow) erosion and save
+        if cancel_token:
+            cancel_token.check()
+
+        return self.save_heightfield_images(
+            images, generate_texture, log, output_dir=output_dir, name=name, erode=erode,
+            output_format=output_format, deband=deband, upscale_to=upscale_to,
+        )
 
-        output_dir = os.path.join(os.getcwd(), "outputs")
+    def save_heightfield_images(self, images, generate_texture=True, log_callback=print, output_dir=None, name=None,
+                                erode=True, output_format="png16", deband=True, upscale_to=None):
+        """
+        Save [heightmap, texture?] to ``output_dir`` (default ./outputs). ``name`` replaces the
+        timestamp suffix so concurrent batch jobs never collide on filenames.
+
+        The heightmap is converted to a float32 heightfield (explicit luma, never via 8-bit
+        "L"), de-banded when the source was 8-bit, optionally eroded and bicubic-upsampled to
+        ``upscale_to`` pixels, then written as ``output_format`` (png16, tiff32, r32 or f32)
+        along with a small preview PNG. Every step works on a memory-mapped
+        ``TiledHeightfield`` in a scratch folder next to the output, band by band or tile by
+        tile, so the map itself is never held in RAM as one float array.
+        """
+        output_dir = output_dir or os.path.join(os.getcwd(), "outputs")
         os.makedirs(output_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = name or datetime.now().strftime("%Y%m%d_%H%M%S")
 
-        # Save heightmap
-        heightmap_img = images[0]
-        hf_filename = os.path.join(output_dir, f"heightfield_{timestamp}.png")
-        heightmap_img.save(hf_filename, format="PNG")
-        log(f"Saved heightfield to {hf_filename}")
+        work_dir = tempfile.mkdtemp(prefix=f".heightfield_{suffix}_", dir=output_dir)
+        store = None
+        try:
+            # A PIL image, or an already converted float32 array such as a stitched tile grid
+            heightmap_img = images[0]
+            if isinstance(heightmap_img, np.ndarray):
+                store = TiledHeightfield.from_array(os.path.join(work_dir, "source"), heightmap_img,
+                                                    overlap=STORE_OVERLAP)
+            else:
+                store = TiledHeightfield.from_image(os.path.join(work_dir, "source"), heightmap_img,
+                                                    overlap=STORE_OVERLAP, deband=deband)
+            if erode:
+                started = datetime.now()
+                store = erode_store(store)
+                log_callback(f"Eroded heightmap in {(datetime.now() - started).total_seconds():.1f}s")
+            if upscale_to and upscale_to != max(store.shape):
+                scale = upscale_to / max(store.shape)
+                upscaled = store.resampled(os.path.join(work_dir, "upscaled"),
+                                           max(1, round(store.rows * scale)), max(1, round(store.cols * scale)))
+                store.close()
+                store = upscaled
+                log_callback(f"Upsampled heightmap to {store.cols}x{store.rows}")
+            store.clip()
+            hf_filename = store.export(os.path.join(output_dir, f"heightfield_{suffix}"), output_format)
+            log_callback(f"Saved heightfield to {hf_filename}")
+            preview_path = os.path.join(output_dir, f"preview_{suffix}.png")
+            store.preview(PREVIEW_SIZE).save(preview_path)
+        finally:
+            if store is not None:
+                store.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
 
         texture_path = None
         if generate_texture and len(images) > 1:
             texture_img = images[1]
-            tex_filename = os.path.join(output_dir, f"texture_{timestamp}.png")
+            tex_filename = os.path.join(output_dir, f"texture_{suffix}.png")
             texture_img.save(tex_filename, format="PNG")
             texture_path = tex_filename
-            log(f"Saved texture to {tex_filename}")
+            log_callback(f"Saved texture to {tex_filename}")
+
+        return {"heightfield_path": hf_filename, "texture_path": texture_path, "preview_path": preview_path}
+
+    def generate_procedural_heightfield(self, size=2048, seed=None, style="ridged", status_callback=None,
+                                        output_dir=None, name=None, output_format="png16", store_dir=None,
+                                        **noise_kwargs):
+        """
+        Build a heightfield locally (no Gemini call) with the vectorized fBm/ridged generator and
+        save it as ``output_format`` (16-bit PNG by default). Useful as an offline fallback or a quick preview.
 
-        return {"heightfield_path": hf_filename, "texture_path": texture_path}
+        With ``store_dir`` the map is generated straight into a memory-mapped ``TiledHeightfield``
+        there (kept for later tiled erosion/export), so very large sizes never sit in RAM.
+        """
+
+        def log(message):
+            if status_callback:
+                status_callback(message)
+            print(message)
+
+        if seed is None:
+            seed = int.from_bytes(os.urandom(4), "little")
+        log(f"Generating procedural {style} heightfield {size}x{size} (seed {seed})...")
+        started = datetime.now()
+        store = TiledHeightfield.create(store_dir, size) if store_dir else None
+        heights = generate_heightfield_array(size, seed=seed, style=style,
+                                             out=store.data if store else None, **noise_kwargs)
+        log(f"Procedural heightfield built in {(datetime.now() - started).total_seconds():.1f}s")
+
+        output_dir = output_dir or os.path.join(os.getcwd(), "outputs")
+        os.makedirs(output_dir, exist_ok=True)
+        suffix = name or f"procedural_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        hf_filename = save_heightfield(heights, os.path.join(output_dir, f"heightfield_{suffix}"), output_format)
+        log(f"Saved heightfield to {hf_filename}")
+        result = {"heightfield_path": hf_filename, "texture_path": None, "seed": seed}
+        if store:
+            store.close()
+            result["store_path"] = store_dir
+        return result
@@ -0,0 +1,32 @@
+"""Per-user folders for the app's caches and logs, independent of the directory it was started from."""
+import os
+import sys
+
+APP_NAME = "TerrainAI"
+
+
+def app_data_dir():
+    """
+    Root folder for caches and logs: ``TERRAIN_AI_HOME`` when set, otherwise the
+    platform's per-user data folder (``%LOCALAPPDATA%\\TerrainAI`` on Windows,
+    ``~/Library/Application Support/TerrainAI`` on macOS, ``$XDG_DATA_HOME/TerrainAI``
+    or ``~/.local/share/TerrainAI`` elsewhere). Read on every call, not at import.
+    """
+    override = os.environ.get("TERRAIN_AI_HOME")
+    if override:
+        return os.path.abspath(os.path.expanduser(override))
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, APP_NAME)
+
+
+def cache_path(*parts):
+    return os.path.join(app_data_dir(), "cache", *parts)
+
+
+def log_path(*parts):
+    return os.path.join(app_data_dir(), "logs", *parts)
@@ -0,0 +1,201 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from api_handler import ATMOSPHERE_PROMPT, IMAGE_MODEL, SUN_PROMPT, TEXT_MODEL, TerrainGeneratorAPI
+from cancellable_http import CallTimeout
+from request_body import StreamingJSONBody
+
+
+class AsyncTerrainGeneratorAPI:
+    """
+    Coroutine version of ``TerrainGeneratorAPI`` so one event loop can drive many
+    terrain jobs at once.
+
+    Gemini requests go out on one shared ``httpx.AsyncClient``: waiting for a response
+    (often a minute or more for an image) holds no thread, so dozens of jobs cost
+    dozens of sockets, not dozens of threads. An ``asyncio.Semaphore`` caps in-flight
+    requests at ``max_concurrency``. Quotas and 429/503 retries go through the wrapped
+    API's ``RequestScheduler``, whose buckets are shared with any threaded callers, and
+    its response cache, encode cache and payload budget apply as usual.
+
+    CPU-bound steps (encoding references, decoding and saving heightfields, erosion) run
+    on a small private executor of ``cpu_workers`` threads. Cancelling a coroutine
+    cancels its HTTP request at once; a CPU step already running finishes first.
+
+    ``close`` cancels requests still in flight and waits for the CPU steps; the HTTP
+    client and the wrapped API are only closed when this wrapper created them.
+    """
+
+    def __init__(self, api=None, max_concurrency=8, client=None, cpu_workers=4, **api_kwargs):
+        self._owns_api = api is None
+        self.api = api or TerrainGeneratorAPI(**api_kwargs)
+        self.max_concurrency = max_concurrency
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=httpx.AsyncHTTPTransport(retries=3),
+        )
+        self._executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="terrain-api")
+        self._semaphore = None
+        self._loop = None
+        self._requests = set()
+
+    def _get_semaphore(self):
+        # Semaphores bind to the loop they are first used on; recreate if a new loop is running
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def _cpu(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- Requests ------------------------------------------------------------------
+
+    @staticmethod
+    def _timeout(timeout):
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        return httpx.Timeout(read, connect=connect)
+
+    async def _post_generate(self, model_name, payload, log_callback, timeout=None):
+        api = self.api
+        url = f"{api.base_url}/models/{model_name}:generateContent"
+        body = StreamingJSONBody(payload)
+
+        async def stream():
+            # Base64 chunks are produced as the socket takes them, as in the blocking client
+            for chunk in body:
+                yield chunk
+
+        async def send():
+            request = self.client.post(
+                url,
+                params={"key": api.api_key},
+                content=stream(),
+                headers={"Content-Type": "application/json", "Content-Length": str(len(body))},
+                timeout=self._timeout(timeout or api.timeout),
+            )
+            try:
+                return await asyncio.wait_for(request, api.max_call_seconds)
+            except asyncio.TimeoutError:
+                raise CallTimeout(f"Request did not finish within {api.max_call_seconds:.0f}s") from None
+
+        return await api.scheduler.submit_async(model_name, send, api._estimate_tokens(payload), log_callback)
+
+    async def _generate_content(self, model_name, content_parts, log_callback, use_cache=True, label="", timeout=None):
+        """Async ``TerrainGeneratorAPI._generate_content``: same cache, same error handling."""
+        api = self.api
+        payload = {"contents": [{"parts": content_parts}]}
+        cache_key, cached = await self._cpu(api._cached_response, model_name, payload, log_callback, use_cache, label)
+        if cached is not None:
+            return cached
+
+        log_callback(f"Sending request to {model_name}{label}...")
+        task = asyncio.current_task()
+        self._requests.add(task)
+        try:
+            async with self._get_semaphore():
+                response = await self._post_generate(model_name, payload, log_callback, timeout)
+        finally:
+            self._requests.discard(task)
+        return await self._cpu(api._finish_response, response, model_name, cache_key, log_callback)
+
+    async def _call_gemini(self, content_parts, log_callback, use_cache=True):
+        result_json = await self._generate_content(IMAGE_MODEL, content_parts, log_callback, use_cache)
+        return await self._cpu(self.api._images_from_response, result_json, log_callback)
+
+    async def _call_gemini_text(self, content_parts, log_callback, use_cache=True):
+        result_json = await self._generate_content(TEXT_MODEL, content_parts, log_callback, use_cache,
+                                                   label=" for text analysis", timeout=self.api.text_timeout)
+        return self.api._text_from_response(result_json, log_callback)
+
+    # --- Public API ----------------------------------------------------------------
+
+    @staticmethod
+    def _logger(status_callback):
+        def log(message):
+            if status_callback:
+                status_callback(message)
+            print(message)
+        return log
+
+    async def _sky_payload(self, image_path, log):
+        self.api._ensure_api_key()
+        payload = await self._cpu(self.api._prepare_image_payload, image_path, log)
+        if not payload:
+            raise ValueError("Invalid sky reference image.")
+        return payload
+
+    async def generate_heightmap_images(self, image_paths, generate_texture=True, status_callback=None, use_cache=True):
+        log = self._logger(status_callback)
+        api = self.api
+        reference_payloads = await self._cpu(api.prepare_reference_payloads, image_paths, log)
+
+        log("Step 1/2: Generating Heightmap (1:1 Square, Top-Down)...")
+        parts = await self._cpu(api._heightmap_parts, reference_payloads, None, log)
+        hf_images = await self._call_gemini(parts, log, use_cache)
+        if not hf_images:
+            raise Exception("Failed to generate heightmap in Step 1.")
+        heightmap_img = hf_images[0]
+        log("Heightmap generated successfully.")
+
+        if not generate_texture:
+            log("Texture generation skipped by user.")
+            return [heightmap_img]
+
+        log("Step 2/2: Generating Texture Map (Matching Heightmap)...")
+        parts = await self._cpu(api._texture_parts, heightmap_img, reference_payloads, None, log)
+        tex_images = await self._call_gemini(parts, log, use_cache)
+        if not tex_images:
+            log("Warning: Failed to generate texture in Step 2.")
+            log("Returning only heightmap.")
+            return [heightmap_img]
+        log("Texture map generated successfully.")
+        return [heightmap_img, tex_images[0]]
+
+    async def analyze_atmosphere(self, image_path, status_callback=None, use_cache=True):
+        log = self._logger(status_callback)
+        payload = await self._sky_payload(image_path, log)
+        result = await self._call_gemini_text([payload, {"text": ATMOSPHERE_PROMPT}], log, use_cache)
+        if not result:
+            raise Exception("No analysis returned for sky reference.")
+        return result
+
+    async def analyze_sun_angles(self, image_path, status_callback=None, use_cache=True):
+        log = self._logger(status_callback)
+        payload = await self._sky_payload(image_path, log)
+        raw = await self._call_gemini_text([payload, {"text": SUN_PROMPT}], log, use_cache)
+        return self.api._parse_sun_angles(raw, log)
+
+    async def generate_heightfield(self, image_paths, generate_texture=True, status_callback=None, use_cache=True,
+                                   **save_kwargs):
+        """Generate, then save as ``TerrainGeneratorAPI.save_heightfield_images`` does (same keyword options)."""
+        log = self._logger(status_callback)
+        images = await self.generate_heightmap_images(image_paths, generate_texture, log, use_cache)
+        if not images:
+            raise Exception("No images returned from Gemini.")
+        return await self._cpu(
+            lambda: self.api.save_heightfield_images(images, generate_texture, log, **save_kwargs)
+        )
+
+    async def close(self):
+        current = asyncio.current_task()
+        pending = [task for task in self._requests if task is not current]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if self._owns_client:
+            await self.client.aclose()
+        # CPU steps may still be running; let them finish before the API they use is closed
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+        if self._owns_api:
+            self.api.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
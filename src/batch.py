@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import wait as futures_wait
+from datetime import datetime
+
+from pipeline import Stage, StagedPipeline
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def _list_images(folder):
+    return sorted(
+        os.path.join(folder, f) for f in os.listdir(folder)
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def load_manifest(path, generate_texture=True):
+    """
+    Load reference sets as a list of {"id", "images", "texture"} dicts.
+
+    ``path`` may be a JSON list, a JSONL file (one set per line) or a directory whose
+    sub-folders each hold one reference set. Relative image paths resolve against the
+    manifest's folder. Ids name each set's output folder, so an id that is not a plain
+    folder name (path separators, ``..``, a drive) raises ``ValueError``.
+    """
+    if os.path.isdir(path):
+        sets = []
+        for entry in sorted(os.listdir(path)):
+            folder = os.path.join(path, entry)
+            if os.path.isdir(folder):
+                images = _list_images(folder)
+                if images:
+                    sets.append({"id": entry, "images": images, "texture": generate_texture})
+        return sets
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        raw_sets = json.loads(stripped)
+    else:
+        raw_sets = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    sets = []
+    seen = set()
+    for idx, raw in enumerate(raw_sets, start=1):
+        set_id = str(raw.get("id") or f"set_{idx:05d}")
+        _check_set_id(set_id)
+        if set_id in seen:
+            raise ValueError(f"Duplicate reference set id in manifest: {set_id}")
+        seen.add(set_id)
+        images = [p if os.path.isabs(p) else os.path.join(base_dir, p) for p in raw.get("images", [])]
+        sets.append({"id": set_id, "images": images, "texture": raw.get("texture", generate_texture)})
+    return sets
+
+
+def _check_set_id(set_id):
+    # Separators, drives ("C:x"), "." / ".." and padded names would all escape output_dir/<id>
+    if (set_id.strip() in ("", ".", "..") or any(c in set_id for c in "/\\:")
+            or os.path.isabs(set_id) or set_id != set_id.strip()):
+        raise ValueError(f"Reference set id must be a plain folder name: {set_id!r}")
+
+
+def _read_records(results_path):
+    if not os.path.exists(results_path):
+        return
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # tolerate a torn last line from an interrupted run
+
+
+def load_completed_ids(results_path):
+    """Return ids already marked done in a results log (used to resume a batch)."""
+    return {record.get("id") for record in _read_records(results_path) if record.get("status") == "done"}
+
+
+def load_undeployed(results_path):
+    """``{id: done record}`` for sets that were generated but whose last deploy did not succeed (or never ran)."""
+    done, deployed = {}, set()
+    for record in _read_records(results_path):
+        status, set_id = record.get("status"), record.get("id")
+        if status == "done":
+            done[set_id] = record
+        elif status == "deployed":
+            deployed.add(set_id)
+        elif status == "deploy_failed":
+            deployed.discard(set_id)
+    return {set_id: record for set_id, record in done.items() if set_id not in deployed}
+
+
+class ResultsLog:
+    """Append-only JSONL results log, safe to write from several worker threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+
+    def write(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+
+
+def run_batch(api, sets, output_dir, results_path, workers=4, texture_workers=None, resume=True, use_cache=True,
+              erode=True, output_format="png16", farm=None, log_callback=print):
+    """
+    Run reference sets through a two-stage heightmap -> texture pipeline; return (done, failed).
+
+    ``workers`` heightmap calls and ``texture_workers`` texture calls run at once, so the
+    texture step of one set overlaps the heightmap step of the next. With a
+    ``TerragenFarm`` every finished set is also deployed on the next free Terragen
+    instance as soon as it is saved; the outcome is logged as a "deployed" or
+    "deploy_failed" record. On resume, sets generated earlier whose deploy failed (or
+    never ran) are deployed again from their saved files without regenerating them.
+    """
+    for s in sets:
+        _check_set_id(s["id"])
+    results = ResultsLog(results_path)
+    skipped = load_completed_ids(results_path) if resume else set()
+    pending = [dict(s) for s in sets if s["id"] not in skipped]
+    if skipped:
+        log_callback(f"Resuming: {len(sets) - len(pending)} of {len(sets)} sets already done.")
+
+    # The API already prints its own step messages, so stages only log start/finish lines
+    def heightmap_stage(job):
+        log_callback(f"[{job['id']}] Starting ({len(job['images'])} references)")
+        job["started"] = time.time()
+        job["payloads"] = api.prepare_reference_payloads(job["images"])
+        job["heightmap"] = api.generate_heightmap_step(job["payloads"], use_cache=use_cache)
+        return job
+
+    def texture_stage(job):
+        images = [job["heightmap"]]
+        if job["texture"]:
+            texture = api.generate_texture_step(job["heightmap"], job["payloads"], use_cache=use_cache)
+            if texture is not None:
+                images.append(texture)
+        job["result"] = api.save_heightfield_images(
+            images, job["texture"], output_dir=os.path.join(output_dir, job["id"]), name=job["id"], erode=erode,
+            output_format=output_format,
+        )
+        return job
+
+    counts = {"done": 0, "failed": 0}
+    counts_lock = threading.Lock()
+    deploys = []
+
+    def record_deploy(set_id, future):
+        record = {"id": set_id, "finished_at": datetime.now().isoformat(timespec="seconds")}
+        try:
+            outcome = future.result()
+            record.update(status="deployed", endpoint=outcome["endpoint"], changes=outcome["changes"],
+                          project=outcome.get("project"))
+        except Exception as e:
+            record.update(status="deploy_failed", error=str(e))
+        results.write(record)
+        log_callback(f"[{set_id}] {record['status']} {record.get('endpoint') or record.get('error')}")
+
+    def submit_deploy(set_id, hf_path, tex_path):
+        future = farm.deploy(hf_path, tex_path)
+        future.add_done_callback(lambda f: record_deploy(set_id, f))
+        deploys.append(future)
+
+    if farm is not None and resume:
+        wanted = {s["id"] for s in sets}
+        retry = {k: r for k, r in load_undeployed(results_path).items() if k in wanted and k in skipped}
+        if retry:
+            log_callback(f"Resuming: deploying {len(retry)} set(s) generated earlier but not deployed.")
+        for set_id, record in retry.items():
+            submit_deploy(set_id, record.get("heightfield_path"), record.get("texture_path"))
+
+    def on_result(item):
+        job = item.value
+        record = {"id": job["id"], "images": job["images"]}
+        if item.error is None:
+            record.update(status="done", **job["result"])
+            if farm is not None:
+                submit_deploy(job["id"], job["result"].get("heightfield_path"), job["result"].get("texture_path"))
+        else:
+            record.update(status="failed", error=str(item.error), stage=item.failed_stage)
+        record["elapsed_s"] = round(time.time() - job.get("started", time.time()), 2)
+        record["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        results.write(record)
+        # Drop encoded payloads and images as soon as the set is finished
+        for field in ("payloads", "heightmap", "result"):
+            job.pop(field, None)
+        with counts_lock:
+            counts[record["status"]] += 1
+            finished = counts["done"] + counts["failed"]
+            log_callback(f"Progress: {finished}/{len(pending)} (failed {counts['failed']})")
+
+    pipeline = StagedPipeline(
+        [
+            Stage("heightmap", heightmap_stage, workers=workers),
+            Stage("texture", texture_stage, workers=texture_workers or workers),
+        ],
+        log_callback=log_callback,
+    )
+    pipeline.run(pending, key=lambda job: job["id"], on_result=on_result)
+    if deploys:
+        log_callback(f"Waiting for {sum(not f.done() for f in deploys)} Terragen deploys...")
+        futures_wait(deploys)
+    return counts["done"], counts["failed"]
@@ -0,0 +1,157 @@
+"""
+Abortable ``requests`` calls. A blocked socket read cannot be interrupted from Python,
+but shutting the socket down from another thread makes the read return at once; this
+module tracks which connections a call is using so a cancel or a wall-clock deadline
+can do exactly that. A connection stops being tracked as soon as it goes back to the
+pool, so an abort never reaches a socket another call has since picked up.
+"""
+import socket
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from cancellation import JobCancelled
+
+_local = threading.local()
+
+
+class CallTimeout(requests.Timeout):
+    """A request ran past its wall-clock deadline (the per-read timeout alone never fired)."""
+
+
+class _AbortScope:
+    def __init__(self):
+        self.reason = None
+        self._conns = []
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        with self._lock:
+            if self.reason is None:
+                self._conns.append(conn)
+                conn._abort_scope = self
+                return
+        # Aborted already: a retry opening a fresh connection fails straight away
+        _shutdown(conn)
+
+    def detach(self, conn):
+        with self._lock:
+            if conn in self._conns:
+                self._conns.remove(conn)
+            if getattr(conn, "_abort_scope", None) is self:
+                conn._abort_scope = None
+
+    def abort(self, reason):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            _shutdown(conn)
+
+    def close(self):
+        """Stop tracking connections still checked out, e.g. by a response that was never read to the end."""
+        with self._lock:
+            conns, self._conns = self._conns, []
+            for conn in conns:
+                if getattr(conn, "_abort_scope", None) is self:
+                    conn._abort_scope = None
+
+
+def _shutdown(conn):
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _TrackedHTTPConnection(HTTPConnection):
+    def request(self, *args, **kwargs):
+        scope = getattr(_local, "scope", None)
+        if scope is not None:
+            scope.attach(self)
+        return super().request(*args, **kwargs)
+
+
+class _TrackedHTTPSConnection(HTTPSConnection):
+    def request(self, *args, **kwargs):
+        scope = getattr(_local, "scope", None)
+        if scope is not None:
+            scope.attach(self)
+        return super().request(*args, **kwargs)
+
+
+def _detach(conn):
+    scope = getattr(conn, "_abort_scope", None)
+    if scope is not None:
+        scope.detach(conn)
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+    def _put_conn(self, conn):
+        # Released (response read or closed): the call no longer owns this socket
+        _detach(conn)
+        super()._put_conn(conn)
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+    def _put_conn(self, conn):
+        _detach(conn)
+        super()._put_conn(conn)
+
+
+class AbortableHTTPAdapter(HTTPAdapter):
+    """``HTTPAdapter`` whose connections can be shut down by an ``abortable`` block on the sending thread."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+
+
+@contextmanager
+def abortable(cancel_token=None, deadline=None):
+    """
+    Requests sent on this thread inside the block (through an ``AbortableHTTPAdapter``)
+    are aborted when ``cancel_token`` is cancelled, raising ``JobCancelled``, or once
+    ``deadline`` seconds have passed, raising ``CallTimeout``. Either way the socket is
+    closed at once, so neither the caller's thread nor the connection stays stuck.
+    """
+    scope = _AbortScope()
+    previous = getattr(_local, "scope", None)
+    _local.scope = scope
+    unregister = cancel_token.on_cancel(lambda: scope.abort("cancelled")) if cancel_token else None
+    timer = None
+    if deadline:
+        timer = threading.Timer(deadline, scope.abort, args=("timed out",))
+        timer.daemon = True
+        timer.start()
+    try:
+        yield
+    except (requests.RequestException, OSError) as e:
+        if scope.reason == "cancelled":
+            raise JobCancelled() from e
+        if scope.reason == "timed out":
+            raise CallTimeout(f"Request did not finish within {deadline:.0f}s") from e
+        raise
+    finally:
+        _local.scope = previous
+        if unregister:
+            unregister()
+        if timer:
+            timer.cancel()
+        scope.close()
@@ -0,0 +1,56 @@
+"""Cooperative cancellation shared by app jobs and the Gemini client."""
+import threading
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (or an API call it made) once its cancel token is set."""
+
+
+class CancelToken:
+    """
+    Set by ``JobManager.cancel`` (or by whoever owns the work). Jobs poll it between steps
+    with ``check``; blocking operations register ``on_cancel`` callbacks so they can be
+    interrupted mid-wait, e.g. by shutting down the socket of an in-flight request.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Cancel callback failed: {e}")
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback):
+        """Run ``callback()`` on cancel (now, if already cancelled); returns a function that unregisters it."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
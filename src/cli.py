@@ -0,0 +1,217 @@
+"""Headless command-line entry point (no Tk required).
+
+Usage:
+    python src/cli.py batch MANIFEST [--workers N] [--texture-workers N] [--output-dir DIR] [--results FILE]
+                                 [--format png16|tiff32|r32|f32] [--terragen HOST:PORT ...] [--project-dir DIR]
+    python src/cli.py procedural [--size N] [--seed N] [--style fbm|ridged] [--output-dir DIR] [--format FMT] [--store DIR]
+    python src/cli.py tiled IMAGE [IMAGE ...] [--grid ROWSxCOLS] [--tile-px N] [--overlap N] [--workers N]
+    python src/cli.py tiles import|erode|preview|export STORE [--source IMAGE] [--out FILE] [--format FMT]
+    python src/cli.py deploy HEIGHTFIELD [HEIGHTFIELD ...] --terragen HOST:PORT [--terragen HOST:PORT ...]
+                                 [--texture IMAGE] [--append] [--project-dir DIR]
+"""
+import os
+import sys
+import json
+import argparse
+
+from dotenv import load_dotenv
+
+from api_handler import TerrainGeneratorAPI
+from batch import load_manifest, run_batch
+from heightfield import HEIGHTFIELD_FORMATS
+from param_schema import ParamSchema
+from render_farm import TerragenFarm
+from tiled_generation import generate_tiled_heightfield
+from tiled_heightfield import TiledHeightfield, erode_store
+
+load_dotenv()
+
+
+def cmd_batch(args):
+    sets = load_manifest(args.manifest, generate_texture=not args.no_texture)
+    if not sets:
+        print(f"No reference sets found in {args.manifest}")
+        return 1
+
+    results_path = args.results or os.path.join(args.output_dir, "results.jsonl")
+    print(f"Loaded {len(sets)} reference sets; results -> {results_path}")
+
+    farm = TerragenFarm(args.terragen, project_dir=args.project_dir) if args.terragen else None
+    api = TerrainGeneratorAPI(pool_maxsize=max(args.workers + (args.texture_workers or args.workers), 16))
+    try:
+        done, failed = run_batch(
+            api,
+            sets,
+            output_dir=args.output_dir,
+            results_path=results_path,
+            workers=args.workers,
+            texture_workers=args.texture_workers,
+            resume=not args.no_resume,
+            use_cache=not args.no_cache,
+            erode=not args.no_erode,
+            output_format=args.format,
+            farm=farm,
+        )
+    finally:
+        api.close()
+        if farm is not None:
+            farm.close()
+
+    print(f"Batch finished: {done} done, {failed} failed.")
+    return 1 if failed else 0
+
+
+def cmd_procedural(args):
+    api = TerrainGeneratorAPI()
+    try:
+        result = api.generate_procedural_heightfield(
+            size=args.size, seed=args.seed, style=args.style, output_dir=args.output_dir, name=args.name,
+            output_format=args.format, store_dir=args.store,
+        )
+    finally:
+        api.close()
+    print(json.dumps(result))
+    return 0
+
+
+def cmd_tiled(args):
+    try:
+        rows, cols = (int(n) for n in args.grid.lower().split("x"))
+    except ValueError:
+        print(f"--grid must look like 3x3, not '{args.grid}'")
+        return 1
+
+    api = TerrainGeneratorAPI(pool_maxsize=max(args.workers * 2, 16))
+    try:
+        result = generate_tiled_heightfield(
+            api, args.images, grid=(rows, cols), tile_px=args.tile_px, overlap_px=args.overlap,
+            generate_texture=not args.no_texture, workers=args.workers, use_cache=not args.no_cache,
+            output_dir=args.output_dir, name=args.name, erode=not args.no_erode, output_format=args.format,
+        )
+    finally:
+        api.close()
+    print(json.dumps(result))
+    return 0
+
+
+def cmd_tiles(args):
+    if args.action == "import":
+        if not args.source:
+            print("tiles import needs --source IMAGE")
+            return 1
+        store = TiledHeightfield.from_image(args.store, args.source, tile_size=args.tile_size, overlap=args.overlap)
+        print(f"Imported {args.source} into {args.store} ({store.cols}x{store.rows})")
+        return 0
+
+    store = TiledHeightfield.open(args.store)
+    if args.action == "erode":
+        store = erode_store(store, processes=args.processes)
+        print(f"Eroded {args.store}")
+    elif args.action == "preview":
+        out = args.out or os.path.join(args.store, "preview.png")
+        store.preview(args.preview_size).save(out)
+        print(f"Saved preview to {out}")
+    elif args.action == "export":
+        out = args.out or os.path.join(args.store, "heightfield")
+        print(f"Exported {store.export(os.path.splitext(out)[0], args.format)}")
+    store.close()
+    return 0
+
+
+def cmd_deploy(args):
+    farm = TerragenFarm(args.terragen, project_dir=args.project_dir)
+    schema = ParamSchema()
+    futures = {hf: farm.deploy(hf, args.texture, append_mode=args.append, schema=schema) for hf in args.heightfields}
+    failed = 0
+    for hf, future in futures.items():
+        try:
+            result = future.result()
+            print(f"{hf} -> {result['endpoint']}: {result['changes']} change(s), saved {result['project']}, {result['summary']}")
+        except Exception as e:
+            failed += 1
+            print(f"{hf} failed: {e}")
+    for row in farm.status():
+        print(f"{row['endpoint']}: {row['done']} done, {row['failed']} failed, healthy={row['healthy']}")
+    farm.close()
+    return 1 if failed else 0
+
+
+def build_parser():
+    # Not an installed command: usage lines show the script path it is actually run by
+    parser = argparse.ArgumentParser(prog="python src/cli.py", description="Terrain AI Generator (headless)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="Generate heightfields for every reference set in a manifest")
+    batch.add_argument("manifest", help="JSON/JSONL manifest of reference sets, or a folder of set sub-folders")
+    batch.add_argument("--workers", type=int, default=4, help="Concurrent heightmap requests (default: 4)")
+    batch.add_argument("--texture-workers", type=int, help="Concurrent texture requests (default: same as --workers)")
+    batch.add_argument("--output-dir", default=os.path.join(os.getcwd(), "outputs", "batch"), help="Root folder for results")
+    batch.add_argument("--results", help="JSONL results log (default: OUTPUT_DIR/results.jsonl)")
+    batch.add_argument("--no-texture", action="store_true", help="Skip texture generation for sets that do not set it")
+    batch.add_argument("--no-resume", action="store_true", help="Re-run sets already marked done in the results log")
+    batch.add_argument("--no-cache", action="store_true", help="Bypass the Gemini response cache")
+    batch.add_argument("--no-erode", action="store_true", help="Save heightmaps as returned, without the erosion pass")
+    batch.add_argument("--format", choices=sorted(HEIGHTFIELD_FORMATS), default="png16",
+                       help="Heightfield file format (default: 16-bit PNG)")
+    batch.add_argument("--terragen", action="append", metavar="HOST:PORT",
+                       help="Deploy each finished set to this Terragen instance; repeat to spread across several")
+    batch.add_argument("--project-dir", help="Folder (as the Terragen hosts see it) for one saved .tgd per deploy "
+                                              "(default: beside each heightfield)")
+    batch.set_defaults(func=cmd_batch)
+
+    proc = sub.add_parser("procedural", help="Generate a heightfield locally with fBm/ridged noise (no API call)")
+    proc.add_argument("--size", type=int, default=4096, help="Width/height in pixels (default: 4096)")
+    proc.add_argument("--seed", type=int, help="Noise seed (default: random)")
+    proc.add_argument("--style", choices=["fbm", "ridged"], default="ridged")
+    proc.add_argument("--output-dir", default=os.path.join(os.getcwd(), "outputs"))
+    proc.add_argument("--name", help="Filename suffix (default: timestamp)")
+    proc.add_argument("--format", choices=sorted(HEIGHTFIELD_FORMATS), default="png16",
+                      help="Heightfield file format (default: 16-bit PNG)")
+    proc.add_argument("--store", help="Also keep the map as a tiled, memory-mapped store in this folder")
+    proc.set_defaults(func=cmd_procedural)
+
+    tiled = sub.add_parser("tiled", help="Generate one large seamless heightfield as a grid of Gemini tiles")
+    tiled.add_argument("images", nargs="+", help="Reference images")
+    tiled.add_argument("--grid", default="2x2", help="Tile rows x columns (default: 2x2)")
+    tiled.add_argument("--tile-px", type=int, default=1024, help="Tile size in pixels (default: 1024)")
+    tiled.add_argument("--overlap", type=int, default=128, help="Pixels shared with each neighbouring tile (default: 128)")
+    tiled.add_argument("--workers", type=int, default=4, help="Concurrent tile requests per wave (default: 4)")
+    tiled.add_argument("--output-dir", default=os.path.join(os.getcwd(), "outputs"))
+    tiled.add_argument("--name", help="Filename suffix (default: timestamp)")
+    tiled.add_argument("--no-texture", action="store_true", help="Generate heightmap tiles only")
+    tiled.add_argument("--no-cache", action="store_true", help="Bypass the Gemini response cache")
+    tiled.add_argument("--no-erode", action="store_true", help="Skip the erosion pass on the blended map")
+    tiled.add_argument("--format", choices=sorted(HEIGHTFIELD_FORMATS), default="png16")
+    tiled.set_defaults(func=cmd_tiled)
+
+    tiles = sub.add_parser("tiles", help="Work on a tiled, memory-mapped heightfield store tile by tile")
+    tiles.add_argument("action", choices=["import", "erode", "preview", "export"])
+    tiles.add_argument("store", help="Store folder (index.json + heights.f32)")
+    tiles.add_argument("--source", help="Heightfield image to import")
+    tiles.add_argument("--tile-size", type=int, default=1024)
+    tiles.add_argument("--overlap", type=int, default=32, help="Border cells read around each tile")
+    tiles.add_argument("--processes", type=int, help="Erosion worker processes (default: CPU count)")
+    tiles.add_argument("--out", help="Output file for preview/export")
+    tiles.add_argument("--preview-size", type=int, default=1024)
+    tiles.add_argument("--format", choices=sorted(HEIGHTFIELD_FORMATS), default="png16")
+    tiles.set_defaults(func=cmd_tiles)
+
+    deploy = sub.add_parser("deploy", help="Deploy heightfields across one or more Terragen instances")
+    deploy.add_argument("heightfields", nargs="+", help="Heightfield files, spread across the instances")
+    deploy.add_argument("--terragen", action="append", required=True, metavar="HOST:PORT",
+                        help="Terragen RPC endpoint; repeat for several instances")
+    deploy.add_argument("--texture", help="Texture to deploy with every heightfield")
+    deploy.add_argument("--append", action="store_true", help="Merge with the existing terrain chain")
+    deploy.add_argument("--project-dir", help="Folder (as the Terragen hosts see it) for one saved .tgd per deploy "
+                                               "(default: beside each heightfield)")
+    deploy.set_defaults(func=cmd_deploy)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Eviction trims the directory to this fraction of max_bytes, so it runs once per batch of writes
+EVICT_TO = 0.9
+
+
+class DiskLRU:
+    """
+    Byte budget for a cache directory of ``suffix`` files, shared by the on-disk caches.
+
+    Sizes are tracked in memory, least recently used first (the tree is walked once, on
+    the first ``added``). Once the total passes ``max_bytes`` the directory is rescanned
+    by mtime, since other processes may share it, and the oldest files are removed until
+    it is back under ``EVICT_TO`` of the limit. ``max_bytes`` of 0 or None means no limit.
+    Callers keep mtimes current with ``touched`` on every hit.
+    """
+
+    def __init__(self, directory, suffix, max_bytes):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # path -> size, least recently used first; None until the first write
+        self._index = None
+        self._total = 0
+
+    def touched(self, path):
+        """Mark ``path`` as recently used."""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        with self._lock:
+            if self._index is not None and path in self._index:
+                self._index.move_to_end(path)
+
+    def added(self, path, size):
+        """Record a file of ``size`` bytes just written to ``path`` and trim if over budget."""
+        with self._lock:
+            if self._index is None:
+                self._rescan()
+            else:
+                self._total += size - self._index.pop(path, 0)
+                self._index[path] = size
+            if self.max_bytes and self._total > self.max_bytes:
+                self._evict()
+
+    def forget(self, path):
+        with self._lock:
+            if self._index is not None and path in self._index:
+                self._total -= self._index.pop(path)
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._entries():
+                remove_quietly(path)
+            self._index = None
+            self._total = 0
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def _rescan(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        self._index = OrderedDict((path, size) for path, _, size in entries)
+        self._total = sum(self._index.values())
+
+    def _evict(self):
+        """Drop least-recently-used files until the directory is back under EVICT_TO of max_bytes (lock held)."""
+        self._rescan()
+        target = self.max_bytes * EVICT_TO
+        while self._index and self._total > target:
+            path, size = self._index.popitem(last=False)
+            remove_quietly(path)
+            self._total -= size
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,223 @@
+"""Vectorized grid-based hydraulic and thermal erosion for float32 heightfields in [0, 1]."""
+import os
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+EPS = np.float32(1e-6)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def process_pool(processes=None):
+    """
+    Process pool of ``processes`` workers (default: CPU count), created on first use and
+    reused by every later call asking for the same size, so repeated erosions do not pay
+    for starting worker processes each time. A pool broken by a crashed worker is replaced.
+    """
+    processes = processes or os.cpu_count() or 2
+    with _pools_lock:
+        pool = _pools.get(processes)
+        if pool is None or getattr(pool, "_broken", False):
+            pool = _pools[processes] = ProcessPoolExecutor(max_workers=processes)
+        return pool
+
+
+@atexit.register
+def _shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+def _neighbour_drops(surface, out):
+    """
+    Fill ``out`` (4, rows, cols) with the non-negative drop from each cell to its N, S, W, E
+    neighbour. Each axis needs only one difference array: the drop to the north of cell i
+    is the negated drop to the south of cell i-1. Off-map neighbours never receive flow.
+    """
+    dv = surface[1:, :] - surface[:-1, :]
+    np.maximum(dv, 0.0, out=out[0, 1:, :])
+    np.maximum(-dv, 0.0, out=out[1, :-1, :])
+    dh = surface[:, 1:] - surface[:, :-1]
+    np.maximum(dh, 0.0, out=out[2, :, 1:])
+    np.maximum(-dh, 0.0, out=out[3, :, :-1])
+    out[0, 0, :] = 0.0
+    out[1, -1, :] = 0.0
+    out[2, :, 0] = 0.0
+    out[3, :, -1] = 0.0
+    return out
+
+
+def _gather_inflow(outs, inflow):
+    """Sum into ``inflow`` what each cell receives from its neighbours' N, S, W, E outflows."""
+    inflow[...] = 0.0
+    inflow[:-1, :] += outs[0, 1:, :]   # my southern neighbour sends north to me
+    inflow[1:, :] += outs[1, :-1, :]
+    inflow[:, :-1] += outs[2, :, 1:]
+    inflow[:, 1:] += outs[3, :, :-1]
+    return inflow
+
+
+def thermal_erosion(heights, iterations=20, talus=None, strength=0.5):
+    """
+    Slump material down slopes steeper than ``talus`` (height units per cell, default ~4/size).
+    Each pass moves ``strength`` of the excess over the talus angle to lower neighbours,
+    split in proportion to how far each neighbour exceeds the angle.
+    """
+    h = np.array(heights, dtype=np.float32, copy=True)
+    talus = np.float32(talus if talus is not None else 4.0 / max(h.shape))
+    strength = np.float32(strength * 0.5)  # half the excess at most, so neighbours never swap order
+    drops = np.empty((4,) + h.shape, dtype=np.float32)
+    inflow = np.empty_like(h)
+    for _ in range(iterations):
+        _neighbour_drops(h, drops)
+        drops -= talus
+        np.maximum(drops, 0.0, out=drops)
+        total = drops.sum(axis=0)
+        moved = drops.max(axis=0)
+        moved *= strength
+        drops *= moved / (total + EPS)
+        h -= moved
+        h += _gather_inflow(drops, inflow)
+    return h
+
+
+def hydraulic_erosion(heights, iterations=40, rain=0.002, evaporation=0.05, capacity=8.0, erode_rate=0.3,
+                      deposit_rate=0.3, min_slope=0.002):
+    """
+    Grid (virtual-pipe style) hydraulic erosion: rain accumulates, water flows to lower
+    neighbours in proportion to the water-surface drop, carries sediment up to a capacity
+    that scales with flow and slope, then erodes or deposits towards that capacity.
+    Erosion never digs a cell below its lowest neighbour, which keeps the grid stable.
+    All steps are whole-array NumPy operations in float32 with preallocated buffers.
+    """
+    h = np.array(heights, dtype=np.float32, copy=True)
+    water = np.zeros_like(h)
+    sediment = np.zeros_like(h)
+    drops = np.empty((4,) + h.shape, dtype=np.float32)
+    ground = np.empty_like(drops)
+    inflow = np.empty_like(h)
+    rain = np.float32(rain)
+    keep = np.float32(1.0 - evaporation)
+
+    for _ in range(iterations):
+        water += rain
+        _neighbour_drops(h + water, drops)
+        total_drop = drops.sum(axis=0)
+
+        # Water leaving a cell: at most what it holds, and at most half the drop (stays stable)
+        outflow = np.minimum(water, total_drop * 0.5)
+        # Sediment travels with the fraction of water that leaves
+        carried = sediment * (outflow / (water + EPS))
+
+        drops *= 1.0 / (total_drop + EPS)       # drops -> per-direction share of the outflow
+        water -= outflow
+        water += _gather_inflow(drops * outflow, inflow)
+        sediment -= carried
+        sediment += _gather_inflow(drops * carried, inflow)
+
+        cap = np.maximum(total_drop * 0.25, min_slope)
+        cap *= capacity * outflow
+        excess = sediment - cap
+        change = np.where(excess > 0, excess * deposit_rate, excess * erode_rate)
+        # Limit digging to half the drop to the lowest neighbouring ground
+        max_dig = _neighbour_drops(h, ground).max(axis=0)
+        max_dig *= -0.5
+        np.maximum(change, max_dig, out=change)
+        h += change
+        sediment -= change
+
+        water *= keep
+
+    # Whatever is still suspended settles where it is
+    h += sediment
+    return h
+
+
+def erode(heights, hydraulic_iterations=40, thermal_iterations=20, **kwargs):
+    """Hydraulic pass followed by thermal smoothing of over-steep banks."""
+    thermal_kwargs = {k: kwargs.pop(k) for k in ("talus", "strength") if k in kwargs}
+    h = heights
+    if hydraulic_iterations:
+        h = hydraulic_erosion(h, iterations=hydraulic_iterations, **kwargs)
+    if thermal_iterations:
+        h = thermal_erosion(h, iterations=thermal_iterations, **thermal_kwargs)
+    return h
+
+
+def _erode_tile(args):
+    tile, kwargs = args
+    return erode(tile, **kwargs)
+
+
+def erode_tiled(heights, tile_size=1024, overlap=48, processes=None, **kwargs):
+    """
+    Erode a large heightfield as overlapping tiles on the shared process pool. Each tile
+    is eroded with ``overlap`` extra cells on every side and only its centre is written
+    back, so flow near tile borders still sees its neighbours. Material moves at most one
+    cell per iteration, so with ``overlap`` at least the total iteration count the result
+    matches eroding the whole map at once.
+    """
+    h = np.asarray(heights, dtype=np.float32)
+    rows, cols = h.shape
+    # Talus must come from the full map size, not the tile size
+    kwargs.setdefault("talus", 4.0 / max(rows, cols))
+
+    boxes = []
+    for r0 in range(0, rows, tile_size):
+        for c0 in range(0, cols, tile_size):
+            r1, c1 = min(rows, r0 + tile_size), min(cols, c0 + tile_size)
+            pr0, pc0 = max(0, r0 - overlap), max(0, c0 - overlap)
+            pr1, pc1 = min(rows, r1 + overlap), min(cols, c1 + overlap)
+            boxes.append(((r0, r1, c0, c1), (pr0, pr1, pc0, pc1)))
+
+    out = np.empty_like(h)
+    jobs = ((h[pr0:pr1, pc0:pc1], kwargs) for _, (pr0, pr1, pc0, pc1) in boxes)
+    for ((r0, r1, c0, c1), (pr0, _, pc0, _)), tile in zip(boxes, process_pool(processes).map(_erode_tile, jobs)):
+        out[r0:r1, c0:c1] = tile[r0 - pr0:r1 - pr0, c0 - pc0:c1 - pc0]
+    return out
+
+
+def _resize_float(arr, width, height, resample):
+    return np.array(Image.fromarray(np.ascontiguousarray(arr, dtype=np.float32)).resize((width, height), resample), dtype=np.float32)
+
+
+def erode_heightmap(heights, processes=None, tile_size=1024, max_resolution=None, **kwargs):
+    """
+    Default erosion entry point.
+
+    Maps are eroded at their native resolution; maps larger than ``tile_size`` are split
+    into overlapping tiles on the shared process pool when more than one core is
+    available. Passing ``max_resolution`` trades detail for speed: larger maps are then
+    eroded at that working size and only the erosion delta is upsampled back onto the
+    full-resolution map.
+    """
+    heights = np.asarray(heights, dtype=np.float32)
+    rows, cols = heights.shape
+    cores = processes or os.cpu_count() or 1
+    kwargs.setdefault("talus", 4.0 / max(rows, cols))
+
+    work = heights
+    scale = 1.0
+    if max_resolution and max(rows, cols) > max_resolution:
+        scale = max_resolution / max(rows, cols)
+        work = _resize_float(heights, max(1, round(cols * scale)), max(1, round(rows * scale)), Image.BOX)
+        kwargs["talus"] = kwargs["talus"] / scale  # same slope angle measured in coarser cells
+
+    if max(work.shape) > tile_size and cores > 1:
+        eroded = erode_tiled(work, tile_size=tile_size, processes=cores, **kwargs)
+    else:
+        eroded = erode(work, **kwargs)
+
+    if work is heights:
+        return eroded
+    eroded -= work
+    delta = _resize_float(eroded, cols, rows, Image.BILINEAR)
+    delta += heights
+    return delta
@@ -0,0 +1,181 @@
+"""Float32 heightfield conversion, clean-up and high-precision export."""
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+# Output format -> file extension
+HEIGHTFIELD_FORMATS = {
+    "png16": ".png",
+    "tiff32": ".tif",
+    "r32": ".r32",
+    "f32": ".f32",
+}
+
+# Rec. 709 luma weights for explicit RGB -> height conversion
+LUMA_WEIGHTS = (0.2126, 0.7152, 0.0722)
+
+ROW_CHUNK = 512
+# Classic TIFF offsets are 32-bit; larger maps have to go out as r32/f32
+TIFF_MAX_BYTES = 2 ** 32 - 1
+
+
+def image_to_heights(img):
+    """
+    Convert a PIL image to a float32 (rows, cols) heightfield in [0, 1].
+
+    RGB is reduced with Rec. 709 weights in float (PIL's "L" conversion would quantise to
+    8 bits first); 16-bit and float modes keep their full precision.
+    """
+    if img.mode in ("I;16", "I;16L", "I;16B", "I"):
+        heights = np.array(img, dtype=np.float32)
+        heights *= np.float32(1.0 / 65535.0)
+        return heights
+    if img.mode == "F":
+        heights = np.array(img, dtype=np.float32)
+        lo, hi = float(heights.min()), float(heights.max())
+        heights -= lo
+        if hi > lo:
+            heights *= np.float32(1.0 / (hi - lo))
+        return heights
+    if img.mode in ("L", "LA", "P", "1"):
+        heights = np.array(img.convert("L"), dtype=np.float32)
+        heights *= np.float32(1.0 / 255.0)
+        return heights
+
+    rgb = np.asarray(img.convert("RGB"))
+    heights = np.zeros(rgb.shape[:2], dtype=np.float32)
+    for channel, weight in enumerate(LUMA_WEIGHTS):
+        heights += rgb[..., channel].astype(np.float32) * np.float32(weight / 255.0)
+    return heights
+
+
+def is_low_precision(img):
+    """True when the source only carries 8 bits per sample (and so shows terracing)."""
+    return img.mode not in ("I;16", "I;16L", "I;16B", "I", "F")
+
+
+def deband_heights(heights, sigma=2.0, threshold=1.5 / 255.0):
+    """
+    Remove 8-bit terracing while keeping real edges (a range-limited, bilateral-style blur).
+
+    Pixels are replaced by their Gaussian-smoothed value only where the two differ by less
+    than ``threshold`` (about one quantisation step), so flat terraces ramp smoothly but
+    cliffs and ridges are left alone. Works in place; needs a single extra float32 buffer.
+    """
+    from scipy.ndimage import gaussian_filter
+
+    smooth = gaussian_filter(heights, sigma=sigma, output=np.float32)
+    smooth -= heights
+    # Weight falls from 1 (inside a quantisation step) to 0 (real feature)
+    weight = np.abs(smooth)
+    weight *= np.float32(-1.0 / threshold)
+    weight += np.float32(2.0)
+    np.clip(weight, 0.0, 1.0, out=weight)
+    smooth *= weight
+    heights += smooth
+    return heights
+
+
+def resample_heights(heights, width, height):
+    """Bicubic resize of a float32 heightfield (used for upsampling AI output)."""
+    img = Image.fromarray(np.ascontiguousarray(heights, dtype=np.float32))
+    return np.array(img.resize((width, height), Image.BICUBIC), dtype=np.float32)
+
+
+def _png_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)) + kind + data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+
+def _write_png16(heights, path):
+    """16-bit grey PNG encoded ``ROW_CHUNK`` rows at a time ("Up" filter), so only one chunk is ever converted."""
+    rows, cols = heights.shape
+    compressor = zlib.compressobj(6)
+    prev = np.zeros(cols * 2, dtype=np.uint8)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", cols, rows, 16, 0, 0, 0, 0))
+        for r0 in range(0, rows, ROW_CHUNK):
+            chunk = np.clip(heights[r0:r0 + ROW_CHUNK], 0.0, 1.0)
+            chunk *= np.float32(65535.0)
+            chunk += np.float32(0.5)
+            raw = chunk.astype(">u2").view(np.uint8).reshape(chunk.shape[0], cols * 2)
+            # Up filter: each byte minus the byte above it (mod 256); smooth terrain compresses far better
+            filtered = np.empty((raw.shape[0], cols * 2 + 1), dtype=np.uint8)
+            filtered[:, 0] = 2
+            filtered[0, 1:] = raw[0] - prev
+            filtered[1:, 1:] = raw[1:] - raw[:-1]
+            prev = raw[-1].copy()
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                _png_chunk(f, b"IDAT", data)
+        _png_chunk(f, b"IDAT", compressor.flush())
+        _png_chunk(f, b"IEND", b"")
+
+
+def _write_tiff32(heights, path):
+    """Uncompressed float32 TIFF with one strip per ``ROW_CHUNK`` rows, written strip by strip."""
+    rows, cols = heights.shape
+    strip_rows = min(ROW_CHUNK, rows)
+    strips = -(-rows // strip_rows)
+    counts = [min(strip_rows, rows - i * strip_rows) * cols * 4 for i in range(strips)]
+    entries = 11
+    arrays_at = 8 + 2 + entries * 12 + 4
+    data_at = arrays_at + (8 * strips if strips > 1 else 0)
+    if data_at + rows * cols * 4 > TIFF_MAX_BYTES:
+        raise ValueError("Heightfield is too large for a 32-bit TIFF; export it as r32 or f32 instead.")
+    offsets = [data_at + sum(counts[:i]) for i in range(strips)]
+
+    def entry(tag, kind, count, value):
+        # kind 3 = SHORT, 4 = LONG; single values sit in the entry itself
+        packed = struct.pack("<H", value) + b"\0\0" if kind == 3 else struct.pack("<I", value)
+        return struct.pack("<HHI", tag, kind, count) + packed
+
+    with open(path, "wb") as f:
+        f.write(b"II*\0" + struct.pack("<I", 8) + struct.pack("<H", entries))
+        f.write(entry(256, 4, 1, cols))
+        f.write(entry(257, 4, 1, rows))
+        f.write(entry(258, 3, 1, 32))  # BitsPerSample
+        f.write(entry(259, 3, 1, 1))  # no compression
+        f.write(entry(262, 3, 1, 1))  # BlackIsZero
+        f.write(entry(273, 4, strips, offsets[0] if strips == 1 else arrays_at))
+        f.write(entry(277, 3, 1, 1))  # SamplesPerPixel
+        f.write(entry(278, 4, 1, strip_rows))
+        f.write(entry(279, 4, strips, counts[0] if strips == 1 else arrays_at + 4 * strips))
+        f.write(entry(284, 3, 1, 1))  # contiguous
+        f.write(entry(339, 3, 1, 3))  # SampleFormat: IEEE float
+        f.write(struct.pack("<I", 0))
+        if strips > 1:
+            f.write(struct.pack(f"<{strips}I", *offsets))
+            f.write(struct.pack(f"<{strips}I", *counts))
+        for r0 in range(0, rows, strip_rows):
+            np.ascontiguousarray(heights[r0:r0 + strip_rows], dtype="<f4").tofile(f)
+
+
+def save_heightfield(heights, path_without_ext, output_format="png16"):
+    """
+    Write a [0, 1] float32 heightfield; return the file path.
+
+    png16: 16-bit grayscale PNG. tiff32: 32-bit float TIFF (up to 4 GB). r32/f32:
+    headerless little-endian float32 rows (Terragen / World Machine style raw). Every
+    format is converted and written ``ROW_CHUNK`` rows at a time, so ``heights`` can be a
+    memory-mapped store larger than RAM.
+    """
+    if output_format not in HEIGHTFIELD_FORMATS:
+        raise ValueError(f"Unknown heightfield format '{output_format}'. Use one of {sorted(HEIGHTFIELD_FORMATS)}.")
+    path = path_without_ext + HEIGHTFIELD_FORMATS[output_format]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rows = heights.shape[0]
+
+    if output_format == "png16":
+        _write_png16(heights, path)
+    elif output_format == "tiff32":
+        _write_tiff32(heights, path)
+    else:
+        with open(path, "wb") as f:
+            for r0 in range(0, rows, ROW_CHUNK):
+                np.ascontiguousarray(heights[r0:r0 + ROW_CHUNK], dtype="<f4").tofile(f)
+    return path
@@ -0,0 +1,190 @@
+"""Queue of long-running app jobs (generations, analyses, Terragen edits) on a bounded worker pool."""
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+from cancellation import CancelToken, JobCancelled
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    def __init__(self, job_id, label, fn, args, kwargs, serial):
+        self.id = job_id
+        self.label = label
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.serial = serial
+        self.token = CancelToken()
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobManager:
+    """
+    Runs submitted jobs on ``workers`` threads. Each job gets a ``CancelToken`` as its
+    ``token`` keyword and moves through queued -> running -> done / failed / cancelled.
+
+    Jobs sharing a ``serial`` key run one after another in submission order (all
+    Terragen edits share one, since they change the same open project); other jobs run
+    side by side up to the worker limit. Waiting serial jobs do not hold a worker.
+    ``on_change(job)`` is called from whichever thread changed the job's state.
+
+    Workers are daemon threads, so closing the app never waits on a job that is stuck
+    (or will not notice its token until its current step ends).
+    """
+
+    def __init__(self, workers=4, on_change=None, log_callback=print):
+        self.workers = workers
+        self.on_change = on_change
+        self.log_callback = log_callback
+        self._queue = queue.SimpleQueue()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._serial_busy = set()
+        self._serial_waiting = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-{i + 1}", daemon=True) for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn, *args, label=None, serial=None, **kwargs):
+        """Queue ``fn(*args, token=<CancelToken>, **kwargs)`` and return its ``Job``."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Job manager is shut down")
+            job = Job(next(self._ids), label or getattr(fn, "__name__", "job"), fn, args, kwargs, serial)
+            self._jobs[job.id] = job
+            if serial is not None and serial in self._serial_busy:
+                self._serial_waiting.setdefault(serial, deque()).append(job)
+                start = False
+            else:
+                if serial is not None:
+                    self._serial_busy.add(serial)
+                start = True
+        if start:
+            self._start(job)
+        self._changed(job)
+        return job
+
+    def _start(self, job):
+        self._queue.put(job)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job):
+        with self._lock:
+            skip = job.state != QUEUED
+            if not skip:
+                job.state = RUNNING
+                job.started = time.time()
+        if skip:
+            # Cancelled while waiting for a worker: only its serial slot needs releasing
+            self._finish(job, job.state)
+            return
+        self._changed(job)
+
+        try:
+            job.result = job.fn(*job.args, token=job.token, **job.kwargs)
+            state = CANCELLED if job.token.cancelled else DONE
+        except JobCancelled:
+            state = CANCELLED
+        except Exception as e:
+            job.error = e
+            state = CANCELLED if job.token.cancelled else FAILED
+            if state == FAILED:
+                self.log_callback(f"Job '{job.label}' failed: {e}")
+        self._finish(job, state)
+
+    def _finish(self, job, state):
+        with self._lock:
+            job.state = state
+            job.finished = time.time()
+            successor = None
+            if job.serial is not None:
+                waiting = self._serial_waiting.get(job.serial)
+                # Skip jobs cancelled while they waited their turn
+                while waiting:
+                    candidate = waiting.popleft()
+                    if candidate.state == QUEUED:
+                        successor = candidate
+                        break
+                if successor is None:
+                    self._serial_busy.discard(job.serial)
+        self._changed(job)
+        if successor is not None:
+            self._start(successor)
+
+    def cancel(self, job_id):
+        """Cancel a queued job outright, or ask a running one to stop at its next check."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return False
+            if job.state == QUEUED:
+                job.state = CANCELLED
+                job.finished = time.time()
+        # Outside the lock: cancel callbacks may abort sockets
+        job.token.cancel()
+        self._changed(job)
+        return True
+
+    def cancel_all(self):
+        for job in self.jobs():
+            self.cancel(job.id)
+
+    def jobs(self):
+        """All jobs, oldest first."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self):
+        return [job for job in self.jobs() if job.state not in FINISHED]
+
+    def clear_finished(self):
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.state in FINISHED]:
+                del self._jobs[job_id]
+        self._changed(None)
+
+    def _changed(self, job):
+        if self.on_change:
+            try:
+                self.on_change(job)
+            except Exception as e:
+                print(f"Job change callback failed: {e}")
+
+    def shutdown(self, cancel=True):
+        """Stop taking jobs; with ``cancel`` also cancel everything queued or running. Does not wait."""
+        with self._lock:
+            self._closed = True
+        if cancel:
+            self.cancel_all()
+        for _ in self._threads:
+            self._queue.put(None)
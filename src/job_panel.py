@@ -0,0 +1,73 @@
+"""Tk list of ``JobManager`` jobs with their state, run time and a cancel button."""
+import customtkinter as ctk
+
+from job_manager import CANCELLED, DONE, FAILED, FINISHED, QUEUED, RUNNING
+
+STATE_COLORS = {QUEUED: "gray60", RUNNING: "#3a8fd9", DONE: "#3fa34d", FAILED: "#e05050", CANCELLED: "gray50"}
+
+
+class JobPanel(ctk.CTkFrame):
+    """
+    One row per job. ``refresh`` re-reads the manager and only touches rows whose state
+    or run time changed; it is cheap enough to call on every job change and on a
+    one-second timer while anything is running.
+    """
+
+    def __init__(self, master, manager, **kwargs):
+        super().__init__(master, **kwargs)
+        self.manager = manager
+        self._rows = {}
+        self._timer = None
+
+        header = ctk.CTkFrame(self, fg_color="transparent")
+        header.pack(fill="x", padx=5, pady=(5, 0))
+        ctk.CTkLabel(header, text="Jobs", font=ctk.CTkFont(weight="bold")).pack(side="left")
+        ctk.CTkButton(header, text="Clear Finished", width=100, command=self.manager.clear_finished).pack(side="right")
+
+        self.summary_label = ctk.CTkLabel(self, text="No jobs", anchor="w")
+        self.summary_label.pack(fill="x", padx=5)
+        self.list_frame = ctk.CTkScrollableFrame(self, fg_color="transparent")
+        self.list_frame.pack(fill="both", expand=True, padx=5, pady=5)
+
+    def _add_row(self, job):
+        row = ctk.CTkFrame(self.list_frame, fg_color="transparent")
+        row.pack(fill="x", pady=1)
+        cancel_btn = ctk.CTkButton(row, text="Cancel", width=60, fg_color="gray30", hover_color="gray20",
+                                   command=lambda job_id=job.id: self.manager.cancel(job_id))
+        cancel_btn.pack(side="right")
+        state_label = ctk.CTkLabel(row, width=90, anchor="e")
+        state_label.pack(side="right", padx=5)
+        ctk.CTkLabel(row, text=f"#{job.id} {job.label}", anchor="w").pack(side="left", fill="x", expand=True)
+        self._rows[job.id] = {"frame": row, "state": state_label, "cancel": cancel_btn, "shown": None}
+
+    def refresh(self, _job=None):
+        jobs = self.manager.jobs()
+        live = {job.id for job in jobs}
+        for job_id in [i for i in self._rows if i not in live]:
+            self._rows.pop(job_id)["frame"].destroy()
+
+        for job in jobs:
+            if job.id not in self._rows:
+                self._add_row(job)
+            row = self._rows[job.id]
+            text = job.state if job.state == QUEUED else f"{job.state} {job.elapsed:.0f}s"
+            if row["shown"] == text:
+                continue
+            row["shown"] = text
+            row["state"].configure(text=text, text_color=STATE_COLORS.get(job.state))
+            if job.state in FINISHED:
+                row["cancel"].configure(state="disabled")
+
+        running = sum(1 for job in jobs if job.state == RUNNING)
+        queued = sum(1 for job in jobs if job.state == QUEUED)
+        self.summary_label.configure(
+            text=f"{running} running, {queued} queued of {self.manager.workers} workers" if jobs else "No jobs"
+        )
+
+        # Keep run times ticking while something is running
+        if running and self._timer is None:
+            self._timer = self.after(1000, self._tick)
+
+    def _tick(self):
+        self._timer = None
+        self.refresh()
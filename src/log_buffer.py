@@ -0,0 +1,86 @@
+"""Bounded log model and rotating file sink behind the log console; no Tk needed."""
+import os
+import logging
+from collections import namedtuple
+from logging.handlers import RotatingFileHandler
+
+from app_paths import log_path
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+LOG_FILENAME = "terrain_ai.log"
+
+LogEntry = namedtuple("LogEntry", "time level text")
+
+
+def guess_level(message):
+    """Level for messages logged without one, from the conventions the app's messages already follow."""
+    head = message.lstrip()[:40].lower()
+    if head.startswith(("critical", "error")) or "failed" in head:
+        return "ERROR"
+    if head.startswith(("warning", "verify:", "could not")):
+        return "WARNING"
+    if head.startswith(("set ", "param", "read attempt", "create attempt", "- ")):
+        return "DEBUG"
+    return "INFO"
+
+
+def file_logger(path=None, max_bytes=1_000_000, backups=3):
+    """
+    A ``logging.Logger`` writing to ``path`` (default: ``terrain_ai.log`` in the app's
+    log folder), rotated at ``max_bytes`` with ``backups`` old files kept.
+    """
+    path = path or log_path(LOG_FILENAME)
+    logger = logging.getLogger("terrain_ai")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+class _Ring:
+    """Fixed-capacity ring with O(1) append and O(1) indexing (oldest entry first)."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, item):
+        if self._size < self.capacity:
+            self._items[(self._start + self._size) % self.capacity] = item
+            self._size += 1
+        else:
+            self._items[self._start] = item
+            self._start = (self._start + 1) % self.capacity
+
+    def rows(self, start, stop):
+        stop = min(stop, self._size)
+        return [self._items[(self._start + i) % self.capacity] for i in range(max(start, 0), stop)]
+
+
+class LogBuffer:
+    """
+    The last ``capacity`` entries at each level threshold. Every threshold keeps its own
+    ring, so a filtered view is indexed directly instead of being rebuilt by scanning,
+    and appending costs one ring write per threshold the entry passes.
+    """
+
+    def __init__(self, capacity=5000):
+        self._rings = {level: _Ring(capacity) for level in LEVELS}
+        self.total = 0
+
+    def append(self, entry):
+        self.total += 1
+        for level in LEVELS[: LEVELS.index(entry.level) + 1]:
+            self._rings[level].append(entry)
+
+    def view(self, min_level="DEBUG"):
+        return self._rings[min_level]
@@ -0,0 +1,99 @@
+"""Virtualized Tk view over the bounded log model in ``log_buffer``."""
+import customtkinter as ctk
+
+from log_buffer import LogBuffer
+
+LEVEL_LABELS = {"All": "DEBUG", "Info": "INFO", "Warnings": "WARNING", "Errors": "ERROR"}
+LEVEL_COLORS = {"DEBUG": "gray60", "WARNING": "#d9a000", "ERROR": "#e05050"}
+
+
+class LogConsole(ctk.CTkFrame):
+    """
+    Log view that only ever holds the rows on screen. Scrolling re-renders the visible
+    window from the ``LogBuffer``, so the widget's cost does not grow with the session.
+    It follows new lines while scrolled to the bottom and stays put otherwise.
+    """
+
+    def __init__(self, master, capacity=5000, **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.buffer = LogBuffer(capacity)
+        self.min_level = "DEBUG"
+        self.top = 0
+        self.follow = True
+
+        toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        toolbar.pack(fill="x")
+        ctk.CTkLabel(toolbar, text="Show:").pack(side="left", padx=(0, 5))
+        self.level_menu = ctk.CTkOptionMenu(toolbar, values=list(LEVEL_LABELS), width=110, command=self._on_level)
+        self.level_menu.pack(side="left")
+        self.count_label = ctk.CTkLabel(toolbar, text="")
+        self.count_label.pack(side="right")
+
+        body = ctk.CTkFrame(self, fg_color="transparent")
+        body.pack(fill="both", expand=True)
+        self.scrollbar = ctk.CTkScrollbar(body, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.text = ctk.CTkTextbox(body, wrap="none", activate_scrollbars=False)
+        self.text.pack(side="left", fill="both", expand=True)
+        for level, color in LEVEL_COLORS.items():
+            self.text.tag_config(level, foreground=color)
+        self.text.configure(state="disabled")
+
+        self.text.bind("<Configure>", lambda _e: self._render())
+        self.text.bind("<MouseWheel>", self._on_wheel)
+        self.text.bind("<Button-4>", lambda _e: self.scroll(-3))
+        self.text.bind("<Button-5>", lambda _e: self.scroll(3))
+
+    def _visible_rows(self):
+        font = self.text.cget("font")
+        linespace = font.metrics("linespace") if hasattr(font, "metrics") else 16
+        return max(1, self.text.winfo_height() // linespace)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.buffer.append(entry)
+        self._render()
+
+    def scroll(self, delta):
+        self.follow = False
+        self.top += delta
+        self._render()
+
+    def _on_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        rows = len(self.buffer.view(self.min_level))
+        if action == "moveto":
+            self.follow = False
+            self.top = int(float(amount) * rows)
+            self._render()
+        elif action == "scroll":
+            step = self._visible_rows() if unit == "pages" else 1
+            self.scroll(int(amount) * step)
+
+    def _on_level(self, label):
+        self.min_level = LEVEL_LABELS[label]
+        self.follow = True
+        self._render()
+
+    def _render(self):
+        view = self.buffer.view(self.min_level)
+        n = len(view)
+        visible = self._visible_rows()
+        max_top = max(0, n - visible)
+        self.top = max_top if self.follow else max(0, min(self.top, max_top))
+        # Scrolling back to the bottom resumes following
+        self.follow = self.top >= max_top
+
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        for entry in view.rows(self.top, self.top + visible):
+            self.text.insert("end", f"[{entry.time}] {entry.text}\n", entry.level)
+        self.text.configure(state="disabled")
+
+        if n:
+            self.scrollbar.set(self.top / n, min(1.0, (self.top + visible) / n))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.count_label.configure(text=f"{n} shown / {self.buffer.total} logged")
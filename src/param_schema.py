@@ -0,0 +1,119 @@
+import copy
+import os
+import json
+import threading
+
+from app_paths import cache_path
+
+SCHEMA_FILENAME = "terragen_params.json"
+
+
+class ParamSchema:
+    """
+    Persisted parameter names per Terragen build and node class.
+
+    Terragen builds disagree on names (``image_filename`` vs ``filename``,
+    ``color_function_input`` vs ``colour_function``). After a successful deploy the
+    ``param_names()`` of every node class touched, and which candidate each lookup
+    resolved to, are saved here, so the next run resolves names without any RPC.
+    Entries are keyed by ``version`` (``TERRAGEN_VERSION`` env var), since terragen_rpc
+    cannot report the build. Without a version they are keyed per endpoint instead (see
+    ``for_endpoint``), so two instances running different builds never share names; with
+    neither, names are only kept for the life of this object. A write that fails against
+    cached names drops that class so it is relearned.
+    """
+
+    def __init__(self, path=None, version=None):
+        self.path = path or cache_path(SCHEMA_FILENAME)
+        self.version = version or os.environ.get("TERRAGEN_VERSION")
+        self.key = self.version
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._data = self._load()
+
+    def for_endpoint(self, endpoint):
+        """
+        This schema as seen from ``endpoint``: itself when the build version is known,
+        otherwise a view (sharing the same file and data) keyed by the endpoint.
+        """
+        if self.version or not endpoint:
+            return self
+        view = copy.copy(self)
+        view.key = f"unknown@{endpoint}"
+        view._dirty = False
+        return view
+
+    @property
+    def label(self):
+        return self.key or "unknown"
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                return {}
+            # Older files pooled every unversioned build under one shared key
+            data.pop("unknown", None)
+            return data
+        except (OSError, ValueError):
+            return {}
+
+    def _entry(self, node_class, create=False):
+        classes = self._data.get(self.key)
+        if classes is None:
+            if not create:
+                return None
+            classes = self._data[self.key] = {}
+        entry = classes.get(node_class)
+        if entry is None and create:
+            entry = classes[node_class] = {"names": [], "resolved": {}}
+        return entry
+
+    @staticmethod
+    def _candidates_key(candidates):
+        return "|".join(candidates)
+
+    def names(self, node_class):
+        with self._lock:
+            entry = self._entry(node_class)
+            return list(entry["names"]) if entry and entry["names"] else None
+
+    def record_names(self, node_class, names):
+        with self._lock:
+            entry = self._entry(node_class, create=True)
+            if entry["names"] != list(names):
+                entry["names"] = list(names)
+                self._dirty = True
+
+    def resolved(self, node_class, candidates):
+        with self._lock:
+            entry = self._entry(node_class)
+            return entry["resolved"].get(self._candidates_key(candidates)) if entry else None
+
+    def record_resolved(self, node_class, candidates, param):
+        with self._lock:
+            entry = self._entry(node_class, create=True)
+            key = self._candidates_key(candidates)
+            if entry["resolved"].get(key) != param:
+                entry["resolved"][key] = param
+                self._dirty = True
+
+    def forget(self, node_class):
+        with self._lock:
+            if self._data.get(self.key, {}).pop(node_class, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """Write the schema if anything changed (atomic replace). Names learned without a version or endpoint are not written."""
+        with self._lock:
+            if not self._dirty or self.key is None:
+                return False
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            data = {k: v for k, v in self._data.items() if k is not None}
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            return True
@@ -0,0 +1,109 @@
+import queue
+import threading
+
+_STOP = object()
+
+
+class Stage:
+    """One pipeline stage: ``fn(value) -> value`` run by ``workers`` threads off a bounded input queue."""
+
+    def __init__(self, name, fn, workers=1, queue_size=None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        # Back-pressure: upstream blocks once this many items are waiting here
+        self.queue_size = queue_size or self.workers
+
+
+class PipelineItem:
+    def __init__(self, index, key, value):
+        self.index = index
+        self.key = key
+        self.value = value
+        self.error = None
+        self.failed_stage = None
+
+
+class StagedPipeline:
+    """
+    Run many items through ordered stages where each stage has its own worker pool.
+
+    Stages overlap across items (stage 2 of item N runs while stage 1 of item N+1 is in
+    flight), so batch time tends towards the slowest stage rather than the sum of all
+    stages. An item whose stage raises skips the remaining stages and is reported with
+    its error.
+    """
+
+    def __init__(self, stages, log_callback=print):
+        self.stages = stages
+        self.log_callback = log_callback
+
+    def run(self, items, key=None, on_result=None):
+        """
+        Feed ``items`` through every stage; return finished ``PipelineItem``s in input order.
+        ``on_result(item)`` is called from worker threads as each item leaves the pipeline.
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        results = []
+        results_lock = threading.Lock()
+        threads = []
+
+        def finish(item):
+            with results_lock:
+                results.append(item)
+            if on_result:
+                try:
+                    on_result(item)
+                except Exception as e:
+                    self.log_callback(f"Pipeline result callback failed: {e}")
+
+        def make_worker(stage_idx, remaining):
+            stage = self.stages[stage_idx]
+            in_q = queues[stage_idx]
+            out_q = queues[stage_idx + 1] if stage_idx + 1 < len(queues) else None
+
+            def worker():
+                while True:
+                    item = in_q.get()
+                    if item is _STOP:
+                        with remaining["lock"]:
+                            remaining["count"] -= 1
+                            last = remaining["count"] == 0
+                        # The last worker out tells every worker of the next stage to stop
+                        if last and out_q is not None:
+                            for _ in range(self.stages[stage_idx + 1].workers):
+                                out_q.put(_STOP)
+                        return
+                    if item.error is None:
+                        try:
+                            item.value = stage.fn(item.value)
+                        except Exception as e:
+                            item.error = e
+                            item.failed_stage = stage.name
+                            self.log_callback(f"[{item.key}] {stage.name} failed: {e}")
+                    if out_q is None or item.error is not None:
+                        finish(item)
+                    else:
+                        out_q.put(item)
+
+            return worker
+
+        for idx, stage in enumerate(self.stages):
+            remaining = {"count": stage.workers, "lock": threading.Lock()}
+            for n in range(stage.workers):
+                t = threading.Thread(target=make_worker(idx, remaining), name=f"{stage.name}-{n}", daemon=True)
+                t.start()
+                threads.append(t)
+
+        try:
+            for index, value in enumerate(items):
+                item_key = key(value) if key else index
+                queues[0].put(PipelineItem(index, item_key, value))
+        finally:
+            # Stop the workers even when ``items`` or ``key`` raises, so no thread is left waiting
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_STOP)
+            for t in threads:
+                t.join()
+        results.sort(key=lambda item: item.index)
+        return results
@@ -0,0 +1,163 @@
+"""Local procedural heightfields (fBm / ridged multifractal) for offline use and fast previews."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+PERM_SIZE = 4096
+GRADIENT_COUNT = 16
+
+
+def _fade(t):
+    return t * t * t * (t * (t * 6.0 - 15.0) + 10.0)
+
+
+class GradientNoise:
+    """
+    Vectorized 2D gradient (Perlin) noise evaluated on regular pixel grids.
+
+    Lattice coordinates are separable on a grid, so integer/fractional parts are computed
+    once per row and once per column, and corner gradients come from a small per-octave
+    lattice table. Each sample is then just gathers and a handful of float32 ops.
+    """
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        self.perm = rng.permutation(PERM_SIZE).astype(np.int64)
+        angles = np.arange(GRADIENT_COUNT) * (2.0 * np.pi / GRADIENT_COUNT)
+        self.grad_x = np.cos(angles).astype(np.float32)
+        self.grad_y = np.sin(angles).astype(np.float32)
+        self.rng = rng
+
+    def lattice(self, cells_x, cells_y, offset):
+        """Corner gradient tables (cells_y + 1, cells_x + 1) for one octave."""
+        ix = (np.arange(cells_x + 1) + offset[0]) % PERM_SIZE
+        iy = (np.arange(cells_y + 1) + offset[1]) % PERM_SIZE
+        h = self.perm[(self.perm[ix][None, :] + iy[:, None]) % PERM_SIZE] % GRADIENT_COUNT
+        return self.grad_x[h], self.grad_y[h]
+
+    @staticmethod
+    def sample(lattice, xs, ys):
+        """Noise for the grid ``ys`` x ``xs`` (lattice units) -> float32 (len(ys), len(xs)) in ~[-1, 1]."""
+        gx, gy = lattice
+        ix0 = xs.astype(np.int64)
+        iy0 = ys.astype(np.int64)
+        fx = (xs - ix0).astype(np.float32)
+        fy = (ys - iy0).astype(np.float32)[:, None]
+        ix1 = ix0 + 1
+        iy1 = iy0 + 1
+
+        fx1 = fx - np.float32(1.0)
+        fy1 = fy - np.float32(1.0)
+
+        # Row gathers first (small), then np.take along columns (much faster than fancy indexing)
+        gx_r0, gy_r0 = gx[iy0], gy[iy0]
+        gx_r1, gy_r1 = gx[iy1], gy[iy1]
+        n00 = gx_r0.take(ix0, axis=1) * fx + gy_r0.take(ix0, axis=1) * fy
+        n10 = gx_r0.take(ix1, axis=1) * fx1 + gy_r0.take(ix1, axis=1) * fy
+        n01 = gx_r1.take(ix0, axis=1) * fx + gy_r1.take(ix0, axis=1) * fy1
+        n11 = gx_r1.take(ix1, axis=1) * fx1 + gy_r1.take(ix1, axis=1) * fy1
+
+        u = _fade(fx)
+        v = _fade(fy)
+        nx0 = n00 + u * (n10 - n00)
+        nx1 = n01 + u * (n11 - n01)
+        out = nx0 + v * (nx1 - nx0)
+        out *= np.float32(1.4142)  # Perlin 2D peaks at ~1/sqrt(2)
+        return out
+
+
+def _octave_plan(width, height, base_cells, octaves, lacunarity):
+    """(cells_x, cells_y) per octave, stopping once features get smaller than ~2 pixels."""
+    plan = []
+    aspect = height / width
+    freq = float(base_cells)
+    for _ in range(octaves):
+        cells_x = max(1, int(round(freq)))
+        if cells_x * 2 > width:
+            break
+        plan.append((cells_x, max(1, int(round(freq * aspect)))))
+        freq *= lacunarity
+    return plan
+
+
+def generate_heightfield_array(width, height=None, seed=0, style="fbm", octaves=10, base_cells=4, lacunarity=2.0,
+                               gain=0.5, ridge_offset=1.0, ridge_gain=2.0, backend="numpy", block_rows=256,
+                               workers=None, out=None):
+    """
+    Return a float32 (height, width) heightfield normalised to [0, 1].
+
+    ``style`` is "fbm" (smooth rolling terrain) or "ridged" (Musgrave ridged multifractal,
+    sharp mountain crests). The image is built in row blocks of ``block_rows`` on a thread
+    pool (NumPy releases the GIL), so peak temporary memory stays at a few blocks and
+    multi-core machines scale. ``backend="opensimplex"`` uses opensimplex's array API
+    instead; it is much slower without numba and best kept for small previews.
+
+    ``out`` may be a preallocated (height, width) float32 array such as a
+    ``TiledHeightfield.data`` memmap; blocks are then written straight to disk.
+    """
+    height = height or width
+    plan = _octave_plan(width, height, base_cells, octaves, lacunarity)
+    if out is None:
+        out = np.empty((height, width), dtype=np.float32)
+
+    if backend == "opensimplex":
+        _fill_opensimplex(out, plan, seed, style, gain, ridge_offset, ridge_gain)
+    else:
+        noise = GradientNoise(seed)
+        lattices = [noise.lattice(cx, cy, noise.rng.integers(0, PERM_SIZE, 2)) for cx, cy in plan]
+        xs_per_octave = [(np.arange(width, dtype=np.float64) + 0.5) * (cx / width) for cx, _ in plan]
+
+        def fill_block(row0):
+            row1 = min(height, row0 + block_rows)
+            rows = np.arange(row0, row1, dtype=np.float64) + 0.5
+            samples = (
+                GradientNoise.sample(lattice, xs, rows * (cy / height))
+                for lattice, xs, (_, cy) in zip(lattices, xs_per_octave, plan)
+            )
+            out[row0:row1] = _combine_octaves(samples, (row1 - row0, width), style, gain, ridge_offset, ridge_gain)
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as pool:
+            list(pool.map(fill_block, range(0, height, block_rows)))
+
+    # Normalise in place to [0, 1]
+    lo, hi = float(out.min()), float(out.max())
+    out -= lo
+    if hi > lo:
+        out *= np.float32(1.0 / (hi - lo))
+    return out
+
+
+def _combine_octaves(samples, shape, style, gain, ridge_offset, ridge_gain):
+    """Accumulate octave noise arrays into fBm or ridged multifractal."""
+    total = np.zeros(shape, dtype=np.float32)
+    amplitude = np.float32(1.0)
+    weight = None
+    for n in samples:
+        if style == "ridged":
+            signal = np.float32(ridge_offset) - np.abs(n, out=n)
+            signal *= signal
+            if weight is not None:
+                signal *= weight
+            total += signal * amplitude
+            weight = np.clip(signal * np.float32(ridge_gain), 0.0, 1.0)
+        else:
+            n *= amplitude
+            total += n
+        amplitude *= np.float32(gain)
+    return total
+
+
+def _fill_opensimplex(out, plan, seed, style, gain, ridge_offset, ridge_gain):
+    import opensimplex
+
+    height, width = out.shape
+    opensimplex.seed(seed)
+
+    def samples():
+        for idx, (cx, cy) in enumerate(plan):
+            xs = (np.arange(width) + 0.5) * (cx / width) + idx * 17.31
+            ys = (np.arange(height) + 0.5) * (cy / height) + idx * 9.73
+            yield opensimplex.noise2array(xs, ys).astype(np.float32)
+
+    out[:] = _combine_octaves(samples(), out.shape, style, gain, ridge_offset, ridge_gain)
@@ -0,0 +1,224 @@
+import re
+import time
+import asyncio
+import random
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Conservative per-model quotas; override via RequestScheduler(limits=...) to match your tier.
+DEFAULT_LIMITS = {
+    "gemini-3-pro-image-preview": {"rpm": 10, "tpm": None},
+    "gemini-2.0-flash": {"rpm": 15, "tpm": 1000000},
+}
+DEFAULT_MODEL_LIMIT = {"rpm": 10, "tpm": None}
+
+RETRY_STATUSES = (429, 503)
+# Longest a quota wait sleeps before re-checking its cancel token
+CANCEL_POLL_SECONDS = 0.5
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self, tokens=1, cancel_token=None):
+        """
+        Block until ``tokens`` are available (and any pause has elapsed); return seconds waited.
+        With a ``cancel_token`` the wait raises ``JobCancelled`` soon after it is cancelled.
+        """
+        poll = CANCEL_POLL_SECONDS if cancel_token else None
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                if cancel_token:
+                    cancel_token.check()
+                wait = self._take(tokens)
+                if not wait:
+                    return time.monotonic() - started
+                self._cond.wait(min(wait, poll or float("inf")))
+
+    def try_acquire(self, tokens=1):
+        """Take ``tokens`` without blocking: 0.0 when taken, else the seconds until they could be."""
+        with self._cond:
+            return self._take(tokens)
+
+    def _take(self, tokens):
+        tokens = min(tokens, self.capacity)  # an oversized request must still be able to go eventually
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds`` (the server told us we are over quota)."""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # Resume with a single probe request, then refill at the normal rate
+            self.tokens = min(1.0, self.capacity)
+            self.updated = self.paused_until
+            self._cond.notify_all()
+
+
+def _parse_retry_after(response):
+    """Seconds to wait from a Retry-After header or a google.rpc.RetryInfo body, else None."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except Exception:
+        return None
+    for detail in details:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        match = re.match(r"^([\d.]+)s$", str(delay or ""))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class RequestScheduler:
+    """
+    Central gate for Gemini requests: per-model RPM/TPM token buckets, a bounded number
+    of queued/in-flight requests, and jittered exponential backoff on 429/503 that
+    honours Retry-After. A throttled response pauses that model's bucket for every
+    caller, so concurrent jobs back off together instead of hammering the quota.
+    """
+
+    def __init__(self, limits=None, max_queue=32, max_attempts=6, base_delay=2.0, max_delay=120.0):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, model_name):
+        with self._lock:
+            if model_name not in self._buckets:
+                limit = self.limits.get(model_name, DEFAULT_MODEL_LIMIT)
+                rpm = TokenBucket(limit["rpm"]) if limit.get("rpm") else None
+                tpm = TokenBucket(limit["tpm"]) if limit.get("tpm") else None
+                self._buckets[model_name] = (rpm, tpm)
+            return self._buckets[model_name]
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @contextmanager
+    def _slot(self, cancel_token=None):
+        if cancel_token is None:
+            self._slots.acquire()
+        else:
+            while not self._slots.acquire(timeout=CANCEL_POLL_SECONDS):
+                cancel_token.check()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _retry_delay(self, response, attempt):
+        delay = _parse_retry_after(response)
+        if delay is None:
+            return self._backoff(attempt)
+        return min(delay, self.max_delay) + random.uniform(0, 1.0)
+
+    def _log_retry(self, log_callback, model_name, response, delay, attempt):
+        log_callback(
+            f"{model_name} returned {response.status_code}; retrying in {delay:.1f}s "
+            f"(attempt {attempt + 1}/{self.max_attempts})"
+        )
+
+    def submit(self, model_name, send_fn, est_tokens=0, log_callback=print, cancel_token=None):
+        """
+        Run ``send_fn()`` under the model's quota, retrying throttled responses; return the last
+        response. Quota waits and backoff sleeps end early with ``JobCancelled`` on ``cancel_token``.
+        """
+        rpm_bucket, tpm_bucket = self._buckets_for(model_name)
+        with self._slot(cancel_token):
+            for attempt in range(self.max_attempts):
+                waited = rpm_bucket.acquire(cancel_token=cancel_token) if rpm_bucket else 0.0
+                if tpm_bucket and est_tokens:
+                    waited += tpm_bucket.acquire(est_tokens, cancel_token=cancel_token)
+                if waited >= 1.0:
+                    log_callback(f"Rate limit: waited {waited:.1f}s for {model_name} quota.")
+
+                response = send_fn()
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_attempts - 1:
+                    return response
+
+                delay = self._retry_delay(response, attempt)
+                self._log_retry(log_callback, model_name, response, delay, attempt)
+                response.close()
+                if response.status_code == 429 and rpm_bucket:
+                    rpm_bucket.pause(delay)  # the next acquire() waits it out, along with every other caller
+                elif cancel_token:
+                    cancel_token.wait(delay)
+                    cancel_token.check()
+                else:
+                    time.sleep(delay)
+        return response
+
+    async def submit_async(self, model_name, send_coro_fn, est_tokens=0, log_callback=print):
+        """
+        ``submit`` for coroutines: awaits ``send_coro_fn()`` under the same quotas (buckets are
+        shared with threaded callers) and sleeps on the event loop instead of blocking a thread.
+        Cancelling the awaiting task cancels the wait or the request.
+        """
+        rpm_bucket, tpm_bucket = self._buckets_for(model_name)
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(CANCEL_POLL_SECONDS)
+        try:
+            for attempt in range(self.max_attempts):
+                waited = 0.0
+                for bucket, tokens in ((rpm_bucket, 1), (tpm_bucket, est_tokens)):
+                    if not bucket or not tokens:
+                        continue
+                    while True:
+                        wait = bucket.try_acquire(tokens)
+                        if not wait:
+                            break
+                        await asyncio.sleep(wait)
+                        waited += wait
+                if waited >= 1.0:
+                    log_callback(f"Rate limit: waited {waited:.1f}s for {model_name} quota.")
+
+                response = await send_coro_fn()
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_attempts - 1:
+                    return response
+
+                delay = self._retry_delay(response, attempt)
+                self._log_retry(log_callback, model_name, response, delay, attempt)
+                await response.aclose()
+                if response.status_code == 429 and rpm_bucket:
+                    rpm_bucket.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+        return response
@@ -0,0 +1,224 @@
+"""Dispatch Terragen jobs (deploys, clouds, lighting) across a pool of Terragen instances."""
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from terragen_client import get_client, parse_endpoint
+from terragen_deploy import APPLIED_GRAPHS, DeployError, deploy_heightfield, os_profile
+
+
+class NoHealthyInstance(ConnectionError):
+    """Every Terragen instance in the farm is down (or already failed this job)."""
+
+
+# How long an instance that stopped answering waits before probing it again
+UNHEALTHY_RETRY_SECONDS = 2.0
+
+
+class _Job:
+    def __init__(self, fn, args, kwargs, label):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.label = label
+        self.future = Future()
+        self.tried = set()
+        self.started = False
+
+
+class _Instance:
+    def __init__(self, client):
+        self.client = client
+        self.running = None
+        self.done = 0
+        self.failed = 0
+
+
+class TerragenFarm:
+    """
+    A pool of Terragen RPC endpoints pulling jobs from one shared queue.
+
+    ``submit(fn, *args)`` queues ``fn(client, *args)`` and returns a ``Future``; whichever
+    healthy instance is free next takes the oldest job it has not already failed, so an
+    idle instance never waits while another has a backlog. Each instance runs one job
+    at a time, since jobs edit its open project. When an instance dies mid-job (a
+    connection error, or calls failing and the endpoint no longer answering) the job
+    goes back to the front of the queue for the other instances; deploys are
+    diff-based, so re-running one elsewhere is safe. A job fails with
+    ``NoHealthyInstance`` once every instance has failed it or is down.
+
+    Deploys rewire the same heightfield chain in the instance's open project, so each
+    deploy saves the project to its own ``.tgd`` before the instance takes the next job:
+    beside the heightfield, or in ``project_dir``. Both are paths as the Terragen host
+    sees them.
+    """
+
+    def __init__(self, endpoints, log_callback=print, project_dir=None):
+        self.log_callback = log_callback
+        self.project_dir = project_dir
+        self.instances = [_Instance(get_client(*parse_endpoint(e))) for e in endpoints]
+        if not self.instances:
+            raise ValueError("A Terragen farm needs at least one endpoint")
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, args=(inst,), name=f"terragen-{inst.client.endpoint}", daemon=True)
+            for inst in self.instances
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn, *args, label=None, **kwargs):
+        """Queue ``fn(client, *args, **kwargs)`` for the next free healthy instance."""
+        job = _Job(fn, args, kwargs, label or getattr(fn, "__name__", "job"))
+        # Health probes are network calls, so they run outside the lock
+        if not any(inst.client.healthy() for inst in self.instances):
+            job.future.set_exception(NoHealthyInstance(f"No healthy Terragen instance for {job.label}"))
+            return job.future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Terragen farm is closed")
+            self._queue.append(job)
+            self._cond.notify_all()
+        return job.future
+
+    def _next_job(self, inst):
+        """Oldest queued job ``inst`` has not failed already (call with the lock held)."""
+        return next((job for job in self._queue if inst.client not in job.tried), None)
+
+    def _fail_stranded(self):
+        """Fail queued jobs that no instance can take: each one has either failed them or is down."""
+        healthy = {inst.client for inst in self.instances if inst.client.healthy()}
+        with self._cond:
+            stranded = [job for job in self._queue if not healthy - job.tried]
+            for job in stranded:
+                self._queue.remove(job)
+            self._cond.notify_all()
+        for job in stranded:
+            job.future.set_exception(NoHealthyInstance(f"No healthy Terragen instance left for {job.label}"))
+
+    def _idle(self):
+        return not self._queue and not any(inst.running for inst in self.instances)
+
+    def project_path_for(self, hf_path):
+        stem = os.path.splitext(os.path.basename(hf_path))[0] + ".tgd"
+        return os.path.join(self.project_dir, stem) if self.project_dir else os.path.splitext(hf_path)[0] + ".tgd"
+
+    def deploy(self, hf_path, tex_path=None, append_mode=False, schema=None, profile=None, project_path=None):
+        """
+        Queue a heightfield deploy; the future resolves to ``deploy_heightfield``'s result
+        dict plus ``project``, the project file the deploy was saved to.
+        """
+        profile = profile or os_profile()
+        project_path = project_path or self.project_path_for(hf_path)
+
+        def run(client):
+            log = lambda msg: self.log_callback(f"[{client.endpoint}] {msg}")
+            result = deploy_heightfield(
+                client, hf_path, tex_path, append_mode=append_mode, profile=profile, schema=schema, log_callback=log
+            )
+            # The next deploy on this instance rewires the same nodes; keep this one in its own file
+            if not client.save_project(project_path):
+                raise DeployError(f"Terragen {client.endpoint} could not save the project to {project_path}")
+            log(f"Saved project {project_path}")
+            # The open project is now that file; the next deploy here can still diff against this one
+            APPLIED_GRAPHS.moved(client.endpoint, result["project_path"], project_path)
+            result["project"] = project_path
+            return result
+
+        return self.submit(run, label=f"deploy {hf_path}")
+
+    def _worker(self, inst):
+        client = inst.client
+        while True:
+            with self._cond:
+                # After close, workers keep draining until nothing is queued or running anywhere,
+                # since a job an instance dies on comes back for the others
+                while not self._next_job(inst) and not (self._closed and self._idle()):
+                    self._cond.wait()
+                if self._closed and self._idle():
+                    return
+            if not client.healthy():
+                self._fail_stranded()
+                with self._cond:
+                    self._cond.wait(UNHEALTHY_RETRY_SECONDS)
+                continue
+            with self._cond:
+                job = self._next_job(inst)
+                if job is None:
+                    continue
+                self._queue.remove(job)
+                inst.running = job
+            # A job re-queued from a dead instance is already running as far as its caller knows
+            if not job.started:
+                job.started = True
+                if not job.future.set_running_or_notify_cancel():
+                    with self._cond:
+                        inst.running = None
+                        self._cond.notify_all()
+                    continue
+
+            failures_before = client.failures
+            try:
+                result = job.fn(client, *job.args, **job.kwargs)
+                error = None
+            except Exception as e:
+                result, error = None, e
+            # Sessions swallow per-call errors, so a dead instance can also look like a
+            # job that "finished" while its calls failed
+            died = isinstance(error, OSError) or (
+                client.failures > failures_before and not client.healthy(force=True)
+            )
+
+            with self._cond:
+                if died:
+                    inst.failed += 1
+                    job.tried.add(client)
+                    self._queue.appendleft(job)
+                elif error is not None:
+                    inst.failed += 1
+                else:
+                    inst.done += 1
+                inst.running = None
+                self._cond.notify_all()
+            if died:
+                self.log_callback(f"Terragen {client.endpoint} stopped answering during {job.label}; handing it on")
+                self._fail_stranded()
+            elif error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def status(self):
+        """Per-instance endpoint, health, current job and done/failed counts, plus the shared queue length."""
+        with self._cond:
+            queued = len(self._queue)
+            rows = [(inst.client, inst.running, inst.done, inst.failed) for inst in self.instances]
+        return [
+            {"endpoint": c.endpoint, "healthy": c.healthy(), "running": job.label if job else None,
+             "queued": queued, "done": done, "failed": failed}
+            for c, job, done, failed in rows
+        ]
+
+    def close(self, wait=True, cancel_pending=False):
+        """
+        Stop taking jobs. By default the instances still work through everything queued;
+        with ``cancel_pending`` queued jobs that have not started are cancelled instead
+        (their futures report ``CancelledError``). Jobs already running always finish.
+        """
+        with self._cond:
+            self._closed = True
+            dropped = []
+            if cancel_pending:
+                # Jobs handed back by a dead instance are already running for their callers
+                dropped = [job for job in self._queue if not job.started]
+                for job in dropped:
+                    self._queue.remove(job)
+            self._cond.notify_all()
+        for job in dropped:
+            job.future.cancel()
+        if wait:
+            for t in self._threads:
+                t.join()
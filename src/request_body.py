@@ -0,0 +1,69 @@
+import json
+import base64
+
+# Multiple of 3 so each base64 chunk concatenates into one valid base64 string
+B64_CHUNK_BYTES = 48 * 1024
+
+
+def _b64_length(n):
+    return 4 * ((n + 2) // 3)
+
+
+class StreamingJSONBody:
+    """
+    Iterable request body that serialises a JSON payload on the fly.
+
+    ``bytes`` values (the encoded images in ``inline_data.data``) are base64-encoded
+    in small chunks while ``requests`` writes them to the socket, so no base64 string
+    or full JSON document is ever materialised. ``len()`` is computed up front so the
+    request still carries a Content-Length (and can be replayed on retry).
+    """
+
+    def __init__(self, payload, chunk_size=B64_CHUNK_BYTES):
+        self.payload = payload
+        self.chunk_size = chunk_size - chunk_size % 3 or 3
+        self._length = None
+
+    def __len__(self):
+        if self._length is None:
+            self._length = self._measure(self.payload)
+        return self._length
+
+    def __iter__(self):
+        return self._iter_value(self.payload)
+
+    def _iter_value(self, value):
+        if isinstance(value, dict):
+            yield b"{"
+            for i, (key, item) in enumerate(value.items()):
+                if i:
+                    yield b","
+                yield json.dumps(str(key)).encode("ascii") + b":"
+                yield from self._iter_value(item)
+            yield b"}"
+        elif isinstance(value, (list, tuple)):
+            yield b"["
+            for i, item in enumerate(value):
+                if i:
+                    yield b","
+                yield from self._iter_value(item)
+            yield b"]"
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            view = memoryview(value)
+            yield b'"'
+            for start in range(0, len(view), self.chunk_size):
+                yield base64.b64encode(view[start:start + self.chunk_size])
+            yield b'"'
+        else:
+            yield json.dumps(value).encode("ascii")
+
+    def _measure(self, value):
+        if isinstance(value, dict):
+            commas = max(len(value) - 1, 0)
+            return 2 + commas + sum(len(json.dumps(str(k))) + 1 + self._measure(v) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            commas = max(len(value) - 1, 0)
+            return 2 + commas + sum(self._measure(v) for v in value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return 2 + _b64_length(memoryview(value).nbytes)
+        return len(json.dumps(value))
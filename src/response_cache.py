@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from app_paths import cache_path
+from disk_lru import DiskLRU, remove_quietly
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for Gemini ``generateContent`` responses.
+
+    Entries are keyed by a SHA-256 of the model name plus every request part (prompt
+    text and encoded image bytes). ``cache_dir`` defaults to ``responses`` in the app's
+    cache folder.
+
+    The directory is kept under ``max_bytes`` by a ``DiskLRU``: hits refresh the file
+    mtime and least-recently-used entries are evicted once the total passes the limit.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024, ttl_seconds=7 * 24 * 3600, enabled=True):
+        self.cache_dir = cache_dir or cache_path("responses")
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._lru = DiskLRU(self.cache_dir, ".json", max_bytes)
+
+    @property
+    def max_bytes(self):
+        return self._lru.max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        self._lru.max_bytes = value
+
+    @staticmethod
+    def make_key(model_name, payload):
+        """Hash model + request parts without re-serialising the image data."""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        for content in payload.get("contents", []):
+            for part in content.get("parts", []):
+                inline_data = part.get("inline_data")
+                if inline_data:
+                    digest.update(b"\x00img:")
+                    digest.update(str(inline_data.get("mime_type", "")).encode("utf-8"))
+                    data = inline_data.get("data") or b""
+                    digest.update(data if isinstance(data, (bytes, bytearray)) else data.encode("utf-8"))
+                else:
+                    digest.update(b"\x00part:")
+                    digest.update(json.dumps(part, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached response JSON, or None on miss/expiry."""
+        if not self.enabled:
+            return None
+        path = self._path_for(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl_seconds and time.time() - entry.get("created", 0) > self.ttl_seconds:
+            remove_quietly(path)
+            self._lru.forget(path)
+            return None
+        self._lru.touched(path)
+        return entry.get("response")
+
+    def put(self, key, response_json, model_name=None):
+        if not self.enabled:
+            return
+        path = self._path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"created": time.time(), "model": model_name, "response": response_json}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write response cache entry: {e}")
+            remove_quietly(tmp_path)
+            return
+        self._lru.added(path, size)
+
+    def clear(self):
+        self._lru.clear()
@@ -0,0 +1,197 @@
+"""Long-lived Terragen RPC clients, one per endpoint, shared across the process."""
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+
+from terragen_rpc.high import Node
+from terragen_rpc.jsonrpc import Reply
+
+DEFAULT_HOST = os.environ.get("TERRAGEN_RPC_HOST", "localhost")
+DEFAULT_PORT = int(os.environ.get("TERRAGEN_RPC_PORT", "36971"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def parse_endpoint(spec):
+    """``"host:port"``, ``"port"`` or ``"host"`` -> (host, port)."""
+    host, _, port = str(spec).rpartition(":")
+    if not host:
+        return (DEFAULT_HOST, int(port)) if port.isdigit() else (port or DEFAULT_HOST, DEFAULT_PORT)
+    return host, int(port)
+
+
+def get_client(host=None, port=None):
+    """The process-wide client for ``host:port`` (the default endpoint when omitted)."""
+    key = (host or DEFAULT_HOST, int(port or DEFAULT_PORT))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = TerragenClient(*key)
+        return _clients[key]
+
+
+class ClientNode(Node):
+    """A ``terragen_rpc`` node whose calls go to the client (endpoint) it came from."""
+
+    def __init__(self, client, id):
+        super().__init__(id)
+        self.client = client
+
+    def __eq__(self, other):
+        return isinstance(other, ClientNode) and self.id == other.id and self.client is other.client
+
+    def __hash__(self):
+        return hash((id(self.client), self.id))
+
+    def name(self):
+        return self.client.call("name", [self.id])
+
+    def path(self):
+        # 'name_and_path' is what terragen_rpc itself uses, for 0.7/0.8 servers
+        return self.client.call("name_and_path", [self.id])
+
+    def parent_path(self):
+        return self.client.call("parent_path", [self.id])
+
+    def parent(self):
+        return self.client.node(self.client.call("parent", [self.id]))
+
+    def children(self):
+        return self.client.nodes(self.client.call("children", [self.id]))
+
+    def children_filtered_by_class(self, class_name):
+        return self.client.nodes(self.client.call("children_filtered_by_class", [self.id, class_name]))
+
+    def param_names(self):
+        return self.client.call("param_names", [self.id])
+
+    def get_param_as_string(self, param_name):
+        return self.client.call("get_param_as_string", [self.id, param_name])
+
+    def set_param_from_string(self, param_name, value_string):
+        self.client.call("set_param_from_string", [self.id, param_name, value_string])
+
+
+class TerragenClient:
+    """
+    One Terragen RPC endpoint.
+
+    ``terragen_rpc`` talks to a single module-global host/port, so it cannot address
+    two instances at once. This client speaks the same wire protocol (length-prefixed
+    JSON-RPC, one TCP connection per call; the server closes the socket after every
+    reply, so there is no connection to keep alive) against its own endpoint, and
+    parses replies with ``terragen_rpc``'s ``Reply`` so errors are the usual
+    ``terragen_rpc`` exceptions. Nodes it returns are ``terragen_rpc`` ``Node``s bound
+    to this endpoint, so ``RPCSession(tg=client)`` works unchanged.
+
+    Connecting is retried ``retries`` times with a short backoff, so a Terragen that is
+    restarting on the same port is picked up again. While calls fail the client reports
+    itself unhealthy, until a later call or ``healthy()`` check gets through.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=10, retries=2, health_ttl=5.0):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.retries = retries
+        self.health_ttl = health_ttl
+        self.calls = 0
+        self.failures = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._alive = None
+        self._checked_at = 0.0
+
+    @property
+    def endpoint(self):
+        return f"{self.host}:{self.port}"
+
+    def __repr__(self):
+        return f"TerragenClient({self.endpoint})"
+
+    def _connect(self):
+        return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def _exchange(self, s, msg_bytes):
+        with s:
+            s.sendall(len(msg_bytes).to_bytes(4, byteorder="little") + msg_bytes)
+            chunks = []
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _mark(self, alive):
+        with self._lock:
+            self._alive = alive
+            self._checked_at = time.monotonic()
+            if not alive:
+                self.failures += 1
+
+    def call(self, method, params=()):
+        """
+        Send one JSON-RPC call and return its result. Only the connect is retried: once
+        the request is on the wire a failure is raised, since calls like ``create_child``
+        must not run twice.
+        """
+        params = list(params)
+        with self._lock:
+            self.calls += 1
+            msg = json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": next(self._ids)})
+        for attempt in range(self.retries + 1):
+            try:
+                s = self._connect()
+                break
+            except OSError:
+                self._mark(False)
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.2 * 2 ** attempt)
+        try:
+            reply_bytes = self._exchange(s, msg.encode())
+        except OSError:
+            self._mark(False)
+            raise
+        self._mark(True)
+        return Reply(reply_bytes, method, params).value
+
+    def node(self, node_id):
+        return ClientNode(self, node_id) if node_id and node_id != "0" else None
+
+    def nodes(self, node_ids):
+        return [ClientNode(self, i) for i in node_ids or []]
+
+    def root(self):
+        return self.node(self.call("root"))
+
+    def node_by_path(self, path):
+        return self.node(self.call("node_by_path", [path]))
+
+    def create_child(self, of_node, class_name):
+        return self.node(self.call("create_child", [of_node.id, class_name]))
+
+    def save_project(self, filename):
+        """Save the open project as ``filename`` (a path on the Terragen host); True on success."""
+        return bool(self.call("save_project", [filename]))
+
+    def project_filepath(self):
+        return self.call("project_filepath")
+
+    def healthy(self, force=False):
+        """True when the endpoint answers; cached for ``health_ttl`` seconds unless ``force``."""
+        with self._lock:
+            fresh = self._alive is not None and time.monotonic() - self._checked_at < self.health_ttl
+            if fresh and not force:
+                return self._alive
+        try:
+            # One attempt only: a health probe should not sit through the retry backoff
+            self._exchange(self._connect(), json.dumps({"jsonrpc": "2.0", "method": "root", "params": [], "id": 0}).encode())
+            self._mark(True)
+        except OSError:
+            self._mark(False)
+        return self._alive
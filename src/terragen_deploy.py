@@ -0,0 +1,509 @@
+"""Declarative Terragen deploys: the node graph is described as data and only what differs from the live project is written."""
+import platform
+import threading
+from collections import OrderedDict, namedtuple
+
+from PIL import Image
+
+from terragen_graph import ProjectIndex
+from terragen_session import RPCSession, same_value
+
+# Parameter names differ between Terragen builds; each tuple is tried in order
+WARP_INPUT_PARAMS = ("input_node", "shader_input", "main_input", "input_primary")
+WARP_MASK_PARAMS = ("mask_input", "mask", "input_mask", "blend_input", "mix_input")
+MERGER_PRIMARY_PARAMS = ("input_node", "main_input", "primary_input", "input_primary", "input_a", "A")
+MERGER_SECONDARY_PARAMS = ("input_node_2", "secondary_input", "input_secondary", "input_b", "mask_input", "B", "input_B")
+TEXTURE_FILE_PARAMS = ("image_filename", "filename", "texture_filename", "file", "map_filename", "colour_image", "color_image")
+PROJECTION_PARAMS = ("projection", "mapping_mode", "map_projection", "mapping")
+SIZE_PARAMS = ("size", "map_size", "tile_size", "scale", "repeat_scale", "texture_size")
+CENTER_PARAMS = ("center", "map_center", "offset", "origin", "position", "centre", "pivot")
+REPEAT_FLAGS = ("tile", "tiling", "repeat", "wrap", "use_repeat", "repeat_enabled", "clamp")
+FLIP_FLAGS = ("flip", "flip_x", "flip_y", "mirror_x", "mirror_y")
+COLOR_PARAMS = (
+    "color_function_input",
+    "color_function",
+    "colour_function_input",
+    "colour_function",
+    "color_input",
+    "colour_input",
+    "surface_shader_input",
+    "shader_input",
+    "input_node",
+)
+
+Ref = namedtuple("Ref", "key")
+Ref.__doc__ = "Edge to the node declared under ``key`` (written as its path)."
+
+Keep = namedtuple("Keep", "key params fallback")
+Keep.__new__.__defaults__ = (None,)
+Keep.__doc__ = """
+Splice into an existing chain: the value ``key``'s ``params`` held before this deploy,
+as long as it points outside the declared graph. When it points into the graph (a
+previous deploy already spliced in) the parameter is left as it is, or set to
+``fallback`` if it is empty.
+"""
+
+Change = namedtuple("Change", "key param old new")
+
+
+AppliedGraph = namedtuple("AppliedGraph", "project_nodes nodes session_state")
+AppliedGraph.__doc__ = """
+What a successful deploy left behind: the ids of the project's top-level nodes, the
+declared key -> node mapping and the session's ``known_state`` for those nodes.
+"""
+
+
+class AppliedGraphs:
+    """
+    Last applied graph per (endpoint, project file), so a redeploy can diff against it
+    instead of reading every declared parameter back from Terragen.
+
+    A deploy takes its entry out before touching the project and puts a new one back
+    only after its writes verified, so an interrupted deploy never leaves a stale entry.
+    Drift is detected from the project's node list (one ``children()`` call): nodes
+    added, deleted or replaced since the last deploy force a full re-read. Parameters
+    edited by hand in Terragen between deploys are not noticed; ``clear()`` (or
+    ``applied_graphs=None``) makes the next deploy read everything again.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, endpoint, project_path):
+        with self._lock:
+            return self._entries.pop((endpoint, project_path), None)
+
+    def put(self, endpoint, project_path, applied):
+        with self._lock:
+            self._entries[(endpoint, project_path)] = applied
+            self._entries.move_to_end((endpoint, project_path))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def moved(self, endpoint, old_path, new_path):
+        """The project was saved under ``new_path``; keep its entry for deploys made there next."""
+        with self._lock:
+            applied = self._entries.pop((endpoint, old_path), None)
+            if applied is not None:
+                self._entries[(endpoint, new_path)] = applied
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every deploy in the process (GUI, CLI and farm workers)
+APPLIED_GRAPHS = AppliedGraphs()
+
+
+class DeployError(Exception):
+    """The project lacks a node the deploy cannot create (Planet, Compute Terrain)."""
+
+
+def os_profile():
+    """Capture platform-specific node class preferences for Terragen builds."""
+    sys_name = platform.system().lower()
+    is_mac = "darwin" in sys_name
+    is_windows = "windows" in sys_name
+
+    # Default ordering works for most Windows installs; macOS builds sometimes expose v3 first.
+    cloud_classes = ["cloud_layer", "cloud_layer_v3", "cloud_layer_v2"]
+    if is_mac:
+        cloud_classes = ["cloud_layer_v3", "cloud_layer", "cloud_layer_v2"]
+
+    # Image map shader class IDs differ across builds; keep broad lists but tweak priority.
+    image_map_classes = ["image_map_shader", "image_map_shader_v2", "image_map", "image_map_v3"]
+    if is_mac:
+        image_map_classes = ["image_map_shader_v2", "image_map_shader", "image_map_v3", "image_map"]
+
+    # Surface shaders are generally consistent; keep a short list.
+    # Prefer surface_layer so we can layer over existing planet surfaces without replacing base shading
+    surface_classes = ["surface_layer", "default_shader", "fractal_shader"]
+
+    compute_classes = ["compute_terrain"]
+
+    return {
+        "cloud_classes": cloud_classes,
+        "image_map_classes": image_map_classes,
+        "surface_classes": surface_classes,
+        "compute_classes": compute_classes,
+        "platform": sys_name,
+        "is_mac": is_mac,
+        "is_windows": is_windows,
+    }
+
+
+class NodeSpec:
+    """
+    One node of the target graph.
+
+    ``params`` maps a parameter name, or a tuple of candidate names, to a value, ``Ref``
+    or ``Keep``. ``pos`` is only written when the node is created, so nodes the user
+    has arranged stay where they are. Managed nodes are matched by ``name`` or an
+    ``AI_<name>`` prefix and created as ``AI_<name>_NN``; unmanaged (anchor) nodes match
+    any node of their classes and are created under ``name`` exactly.
+    """
+
+    def __init__(self, key, name, classes, params=None, pos=None, managed=True, create=True):
+        self.key = key
+        self.name = name
+        self.classes = list(classes)
+        self.params = dict(params or {})
+        self.pos = pos
+        self.managed = managed
+        self.create = create
+
+
+class GraphDeploy:
+    """
+    Bring the live project in line with a declared node graph.
+
+    ``resolve()`` finds (or creates) every declared node through a ``ProjectIndex``,
+    ``plan()`` reads the current value of each declared parameter once and returns only
+    the ones that differ, and ``apply()`` queues those writes on the session.
+
+    ``restore()`` replaces ``resolve()`` when an ``AppliedGraph`` from an earlier deploy
+    into the same project still matches its node list: nodes and values come from
+    memory, so a redeploy that only changed the heightfield file is one write and its
+    verify read, and an unchanged redeploy writes and reads nothing.
+    """
+
+    def __init__(self, index, log_callback=print):
+        self.index = index
+        self.session = index.session
+        self.log_callback = log_callback
+        self.specs = {}
+        self.nodes = {}
+        self.created = set()
+        self.project_nodes = None
+
+    def add(self, key, name, classes, params=None, pos=None, managed=True, create=True):
+        spec = NodeSpec(key, name, classes, params, pos, managed, create)
+        self.specs[key] = spec
+        return spec
+
+    def _find(self, spec):
+        node = self.index.by_name(spec.name)
+        if node:
+            # A name lookup only tells us the class when there is a single acceptable one
+            if len(spec.classes) == 1:
+                self.session.note_class(node, spec.classes[0])
+            return node
+        prefix = f"AI_{spec.name}"
+        for c in self.index.of_classes(spec.classes):
+            label = self.session.name(c)
+            if not spec.managed or label == spec.name or label.startswith(prefix):
+                return c
+        return None
+
+    def _numbered_name(self, base_name):
+        """Next free ``AI_<base>_NN`` name, so users can tell generated nodes apart."""
+        prefix = f"AI_{base_name}_"
+        max_n = 0
+        for n in self.index.names():
+            if n.startswith(prefix):
+                try:
+                    max_n = max(max_n, int(n[len(prefix):]))
+                except ValueError:
+                    continue
+        return f"{prefix}{max_n + 1:02d}"
+
+    def _create(self, spec):
+        name = self._numbered_name(spec.name) if spec.managed else spec.name
+        for cls in spec.classes:
+            try:
+                node = self.index.create(cls, name)
+            except Exception as e:
+                self.log_callback(f"Create attempt failed for {spec.name} class '{cls}': {e}")
+                continue
+            if node:
+                self.log_callback(f"Created '{name}' using class '{cls}'")
+                if spec.pos:
+                    self.session.set(node, "gui_node_pos", spec.pos, verify=False)
+                return node
+        return None
+
+    def resolve(self, keys=None):
+        """Find (or create) the declared nodes; returns the keys that could not be resolved."""
+        missing = []
+        for key in keys or list(self.specs):
+            if key in self.nodes:
+                continue
+            spec = self.specs[key]
+            node = self._find(spec)
+            if node is None and spec.create:
+                node = self._create(spec)
+                if node:
+                    self.created.add(key)
+            if node is None:
+                missing.append(key)
+            else:
+                self.nodes[key] = node
+        return missing
+
+    def restore(self, applied):
+        """
+        Take nodes and known values from ``applied`` instead of resolving them; False (and
+        nothing adopted) unless it covers every declared node and the project still has
+        exactly the top-level nodes it had then.
+        """
+        if not set(self.specs) <= set(applied.nodes):
+            return False
+        live = frozenset(getattr(node, "id", node) for node in self.session.children(self.index.project))
+        if live != applied.project_nodes:
+            self.log_callback("Project nodes changed since the last deploy; re-reading the graph")
+            return False
+        self.session.adopt_state(applied.session_state)
+        self.nodes = {key: applied.nodes[key] for key in self.specs}
+        self.project_nodes = live
+        return True
+
+    def snapshot(self):
+        """This deploy's ``AppliedGraph``; take it after ``session.verify()``."""
+        project_nodes = self.project_nodes
+        if project_nodes is None:
+            project_nodes = frozenset(getattr(node, "id", node) for node in self.index.nodes())
+        return AppliedGraph(project_nodes, dict(self.nodes), self.session.known_state(self.nodes.values()))
+
+    def param(self, key, candidates):
+        """Name ``candidates`` resolve to on node ``key``; None if it has none of them or names are unavailable."""
+        if isinstance(candidates, str):
+            candidates = (candidates,)
+        return self.session.resolve_param(self.nodes[key], list(candidates))
+
+    def _target(self, value):
+        if isinstance(value, Ref):
+            node = self.nodes.get(value.key)
+            return self.session.path(node) if node else None
+        return self.session.value_string(value)
+
+    def _read(self, node, param):
+        try:
+            if isinstance(param, tuple):
+                return self.session.get_first(node, list(param))[1]
+            return self.session.get(node, param)
+        except Exception:
+            return None
+
+    def _keep(self, keep, current, managed):
+        source = self.nodes.get(keep.key)
+        upstream = self.session.get_first(source, list(keep.params))[1] if source else None
+        if upstream and upstream not in managed:
+            return upstream
+        if current or keep.fallback is None:
+            return None
+        return self._target(keep.fallback)
+
+    def plan(self):
+        """
+        Changes needed to reach the declared graph, as ``Change(key, param, old, new)``.
+        Everything is read before anything is written, so ``Keep`` sees the graph as it
+        was. When two entries resolve to the same parameter the later one wins.
+        """
+        managed = {self.session.path(self.nodes[k]) for k, s in self.specs.items() if s.managed and k in self.nodes}
+
+        targets = {}
+        for key, spec in self.specs.items():
+            node = self.nodes.get(key)
+            if node is None:
+                continue
+            for candidates, value in spec.params.items():
+                candidates = (candidates,) if isinstance(candidates, str) else tuple(candidates)
+                param = self.session.resolve_param(node, list(candidates))
+                if param is None:
+                    if self.session.param_names(node) is not None:
+                        self.log_callback(f"{spec.name}: none of {list(candidates)} exist on this build; skipped")
+                        continue
+                    # Build cannot list its names: resolved by trial when applied
+                    param = candidates
+                targets.pop((key, param), None)
+                targets[(key, param)] = value
+
+        changes = []
+        unchanged = 0
+        for (key, param), value in targets.items():
+            node = self.nodes[key]
+            # Freshly created nodes hold defaults; writing them all beats reading them first
+            current = None if key in self.created else self._read(node, param)
+            new = self._keep(value, current, managed) if isinstance(value, Keep) else self._target(value)
+            if new is None:
+                continue
+            if current is not None and same_value(current, new):
+                unchanged += 1
+                continue
+            changes.append(Change(key, param, current or "", new))
+        self.log_callback(f"Deploy plan: {len(changes)} change(s), {unchanged} parameter(s) already up to date")
+        return changes
+
+    def apply(self, changes):
+        """Queue ``changes`` on the session; call ``session.verify()`` afterwards to flush and check them."""
+        for change in changes:
+            node = self.nodes[change.key]
+            if isinstance(change.param, tuple):
+                param, _ = self.session.set_first(node, list(change.param), change.new)
+            else:
+                param = change.param if self.session.set(node, change.param, change.new) else None
+            if param:
+                self.log_callback(f"Set {self.session.name(node)}.{param}: '{change.old}' -> '{change.new}'")
+            else:
+                self.log_callback(f"Could not set {self.session.name(node)}.{list(change.param)} = '{change.new}'")
+
+
+def terrain_graph(deploy, os_profile, hf_path=None, tex_path=None, tex_size=None, append_mode=False):
+    """
+    Declare the heightfield deploy graph on ``deploy``:
+    HF load -> HF shader -> (merger with the existing warp chain) -> Compute Terrain ->
+    (surface layer with the texture) -> Planet.
+
+    Without ``append_mode`` the HF shader is spliced in front of whatever already fed
+    Compute Terrain; with it, the existing chain is routed through a fractal warp and
+    merged with the heightfield.
+    """
+    deploy.add("planet", "Planet 01", ["planet"], managed=False, create=False)
+    deploy.add("compute_terrain", "Compute Terrain", os_profile["compute_classes"], managed=False)
+
+    deploy.add("hf_load", "Manual_HF_Load", ["heightfield_load"], {"filename": hf_path} if hf_path else {}, pos="-200 -200")
+    hf_shader = deploy.add("hf_shader", "Manual_HF_Shader", ["heightfield_shader"], {"heightfield": Ref("hf_load")}, pos="-50 -200")
+
+    if append_mode:
+        deploy.add("base_pf", "Power Fractal Base", ["power_fractal_shader_v3", "power_fractal_shader"])
+        deploy.add("mask", "Valley Mask", ["simple_shape_shader", "power_fractal_shader_v3", "image_map_shader"])
+        deploy.add(
+            "warp",
+            "Fractal Warp Shader 01",
+            ["fractal_warp_shader"],
+            {
+                WARP_INPUT_PARAMS: Keep("compute_terrain", ("input_node",), Ref("base_pf")),
+                WARP_MASK_PARAMS: Ref("mask"),
+            },
+        )
+        deploy.add(
+            "merger",
+            "HF_Merger",
+            ["merger_shader", "merge_shader", "merger"],
+            {MERGER_PRIMARY_PARAMS: Ref("warp"), MERGER_SECONDARY_PARAMS: Ref("hf_shader")},
+            pos="150 -200",
+        )
+        terrain_source = Ref("merger")
+    else:
+        hf_shader.params["input_node"] = Keep("compute_terrain", ("input_node",))
+        terrain_source = Ref("hf_shader")
+    deploy.specs["compute_terrain"].params["input_node"] = terrain_source
+
+    if not tex_path:
+        deploy.specs["planet"].params["surface_shader"] = Ref("compute_terrain")
+        return deploy
+
+    img_w, img_h = tex_size or (1024, 1024)
+    deploy.add(
+        "texture",
+        "AI_Texture_Image",
+        os_profile["image_map_classes"],
+        {
+            TEXTURE_FILE_PARAMS: tex_path,
+            # Plan Y mapping at the image's own size, centred on the origin, no repeats or flips
+            PROJECTION_PARAMS: "Plan Y",
+            SIZE_PARAMS: f"{img_w} {img_h}",
+            "size_x": img_w,
+            "size_y": img_h,
+            "repeat_x": 0,
+            "repeat_y": 0,
+            CENTER_PARAMS: "0 0 0",
+            "position_center": 1,
+            "position_lower_left": 0,
+            REPEAT_FLAGS: 0,
+            FLIP_FLAGS: 0,
+        },
+        pos="300 100",
+    )
+    deploy.add(
+        "surface",
+        "Manual_Surface",
+        os_profile["surface_classes"],
+        {"input_node": Ref("compute_terrain"), COLOR_PARAMS: Ref("texture")},
+        pos="100 100",
+    )
+    deploy.specs["planet"].params["surface_shader"] = Ref("surface")
+    return deploy
+
+
+def deploy_heightfield(tg, hf_path, tex_path=None, append_mode=False, profile=None, schema=None, log_callback=print,
+                       cancel_token=None, applied_graphs=APPLIED_GRAPHS):
+    """
+    Deploy a heightfield (and texture) into the project on ``tg`` (a ``TerragenClient``),
+    without any UI. Returns a dict with the endpoint, the project file deployed into,
+    applied changes, verify mismatches and the session summary; raises ``DeployError``
+    when Planet or Compute Terrain is missing and cannot be created, and connection
+    errors as they come. A cancelled ``cancel_token`` stops the deploy before anything
+    is written (``JobCancelled``). Redeploys into the same project diff against the
+    graph recorded in ``applied_graphs`` (None reads the whole graph every time).
+    """
+    profile = profile or os_profile()
+    endpoint = getattr(tg, "endpoint", None)
+    session = RPCSession(tg, log_callback=log_callback, schema=schema)
+    project = session.root()
+    if not project:
+        raise DeployError("Terragen has no project open")
+    project_path = session.project_path() if applied_graphs is not None else None
+    applied = applied_graphs.take(endpoint, project_path) if project_path is not None else None
+
+    tex_size = None
+    if tex_path:
+        try:
+            # Only the header is read; the texture itself is never decoded here
+            with Image.open(tex_path) as tex_img:
+                tex_size = tex_img.size
+        except Exception as e:
+            log_callback(f"Failed to read texture size: {e}")
+
+    # The target graph is data; only parameters that differ from the live project are written
+    index = ProjectIndex(session, project)
+    deploy = terrain_graph(
+        GraphDeploy(index, log_callback=log_callback),
+        profile,
+        hf_path=hf_path,
+        tex_path=tex_path,
+        tex_size=tex_size,
+        append_mode=append_mode,
+    )
+
+    if applied is None or not deploy.restore(applied):
+        for key, label in (("planet", "Planet"), ("compute_terrain", "Compute Terrain")):
+            if deploy.resolve([key]):
+                log_callback(f"CRITICAL: {label} node not found. Listing all nodes:")
+                for c in index.nodes():
+                    log_callback(f" - {session.name(c)} ({session.path(c)})")
+                raise DeployError(f"Could not find a {label} node. See log for available nodes.")
+        for key in deploy.resolve():
+            log_callback(f"Could not find or create '{deploy.specs[key].name}'; its connections are skipped")
+
+    if append_mode and "merger" in deploy.nodes and session.param_names(deploy.nodes["merger"]) is not None:
+        if not deploy.param("merger", MERGER_SECONDARY_PARAMS):
+            # Fallback: bypass merger so HF still drives CT
+            deploy.specs["compute_terrain"].params["input_node"] = Ref("hf_shader")
+            log_callback("Merger has no secondary input on this build; Compute Terrain -> HF Shader directly")
+
+    changes = deploy.plan()
+    # Nodes may have been created while resolving, but no parameter has been written yet
+    if cancel_token:
+        cancel_token.check()
+    deploy.apply(changes)
+
+    mismatches = session.verify()
+    for node_name, param, expected, actual in mismatches:
+        log_callback(f"Verify: {node_name}.{param} expected '{expected}' but reads '{actual}'")
+    if not mismatches and session.save_schema():
+        log_callback(f"Saved Terragen parameter names for build '{session.schema.label}'")
+    # Only a graph known to be exactly as declared is worth diffing against next time
+    complete = len(deploy.nodes) == len(deploy.specs)
+    if project_path is not None and complete and not mismatches and not session.stats["failed"]:
+        applied_graphs.put(endpoint, project_path, deploy.snapshot())
+    return {
+        "endpoint": endpoint,
+        "project_path": project_path,
+        "changes": len(changes),
+        "mismatches": mismatches,
+        "summary": session.summary(),
+    }
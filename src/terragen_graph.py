@@ -0,0 +1,119 @@
+"""In-memory index of a Terragen project's top-level node graph, built once per operation."""
+
+
+class ProjectIndex:
+    """
+    Name -> node, class -> nodes and input edges for the project's top-level nodes.
+
+    terragen_rpc has no bulk query, so the index is filled lazily through an
+    ``RPCSession``: one ``children()`` call plus one ``name()`` per node the first time
+    names are needed, one ``children_filtered_by_class()`` per class the first time that
+    class is asked for, and one read per input edge (kept in the session's value cache).
+    After that every lookup is served from memory, and nodes created through ``create``
+    are added in place instead of triggering a rescan.
+    """
+
+    def __init__(self, session, project=None):
+        self.session = session
+        self.project = project or session.root()
+        self._by_name = None
+        self._nodes = []
+        self._by_class = {}
+
+    def _names(self):
+        if self._by_name is None:
+            self._by_name = {}
+            self._nodes = list(self.session.children(self.project))
+            for node in self._nodes:
+                name = self.session.name(node)
+                self._by_name.setdefault(name, node)
+                # Top-level nodes live at "/<name>", so their path needs no RPC of its own
+                self.session.note_path(node, f"/{name}")
+        return self._by_name
+
+    def nodes(self):
+        """Every top-level node, including ones sharing a name."""
+        self._names()
+        return list(self._nodes)
+
+    def names(self):
+        return list(self._names())
+
+    def by_name(self, name):
+        return self._names().get(name)
+
+    def by_path(self, path):
+        """Top-level node for ``/Name`` (or ``Name``); None for nested or unknown paths."""
+        if not path:
+            return None
+        name = path[1:] if path.startswith("/") else path
+        if "/" in name:
+            return self.session.node_by_path(path)
+        return self.by_name(name)
+
+    def of_class(self, class_name):
+        if class_name not in self._by_class:
+            try:
+                self._by_class[class_name] = list(self.session.children_filtered_by_class(self.project, class_name))
+            except Exception:
+                self._by_class[class_name] = []
+        return list(self._by_class[class_name])
+
+    def of_classes(self, class_names):
+        """Nodes of any of ``class_names``, in class order, without duplicates."""
+        seen = set()
+        found = []
+        for class_name in class_names:
+            for node in self.of_class(class_name):
+                key = getattr(node, "id", node)
+                if key not in seen:
+                    seen.add(key)
+                    found.append(node)
+        return found
+
+    def first_of(self, name, class_names=()):
+        """Node called ``name``, else the first node of ``class_names``."""
+        node = self.by_name(name)
+        if node:
+            if len(class_names) == 1:
+                self.session.note_class(node, class_names[0])
+            return node
+        for class_name in class_names:
+            nodes = self.of_class(class_name)
+            if nodes:
+                return nodes[0]
+        return None
+
+    def create(self, class_name, name=None):
+        """Create a top-level node (and name it); the index is updated without a rescan."""
+        names = self._names()
+        node = self.session.create_child(self.project, class_name)
+        if not node:
+            return None
+        if name:
+            self.session.set(node, "name", name, verify=False)
+            self.session.note_path(node, f"/{name}")
+            names[name] = node
+            self._nodes.append(node)
+        else:
+            self._by_name = None
+        if class_name in self._by_class:
+            self._by_class[class_name].append(node)
+        return node
+
+    def rename(self, node, name):
+        names = self._names()
+        for old, existing in list(names.items()):
+            if existing == node:
+                del names[old]
+        self.session.set(node, "name", name, verify=False)
+        self.session.note_path(node, f"/{name}")
+        names[name] = node
+
+    def input_of(self, node, params):
+        """
+        (param, path, node) of ``node``'s first non-empty input among ``params``. Edge values
+        live in the session's value cache, so writes made through the session show up here.
+        """
+        param, path = self.session.get_first(node, params)
+        return param, path, self.by_path(path)
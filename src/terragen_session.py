@@ -0,0 +1,379 @@
+"""Round-trip-aware session over terragen_rpc: cached reads, queued writes, one batched verify pass."""
+
+
+def _node_key(node):
+    return getattr(node, "id", node)
+
+
+def param_string(value):
+    """String form Terragen stores for ``value`` (sequences are space-separated)."""
+    if isinstance(value, (tuple, list)):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+
+def _numbers(value):
+    try:
+        return [float(v) for v in str(value).split()]
+    except ValueError:
+        return None
+
+
+def same_value(actual, expected):
+    """Equal as Terragen sees it: case-insensitive, and "3000" matches "3000.0"."""
+    if actual == expected or str(actual).lower() == str(expected).lower():
+        return True
+    a, b = _numbers(actual), _numbers(expected)
+    return bool(a) and a == b
+
+
+class RPCSession:
+    """
+    One deploy's worth of Terragen RPC traffic.
+
+    terragen_rpc opens a new TCP connection for every call, so the round trip count is
+    what makes a deploy slow. The session:
+
+    - caches node names, paths and ``param_names()`` so each is fetched once per node;
+    - resolves candidate parameter names against ``param_names()`` instead of trying
+      them one by one with a set and a read-back each;
+    - queues writes, drops writes that would not change a known value and keeps only the
+      last of several writes to the same parameter;
+    - serves reads of parameters it has written (or read) from memory;
+    - verifies every write in one read pass in ``verify()``.
+
+    With a ``ParamSchema`` the parameter names of every node whose class is known come
+    from the persisted schema, so a repeat deploy on the same build needs no
+    ``param_names()`` calls at all.
+
+    ``tg`` is the process-wide ``TerragenClient`` for the default endpoint unless given;
+    the terragen_rpc module, or any object with the same functions (``root``,
+    ``node_by_path``, ``create_child``), works too.
+    """
+
+    def __init__(self, tg=None, log_callback=print, schema=None):
+        if tg is None:
+            from terragen_client import get_client
+            tg = get_client()
+        self.tg = tg
+        self.log_callback = log_callback
+        # Unversioned schemas keep separate names per endpoint
+        self.schema = schema.for_endpoint(getattr(tg, "endpoint", None)) if schema is not None else None
+        self.round_trips = 0
+        self.stats = {"writes": 0, "reads": 0, "elided_writes": 0, "elided_reads": 0, "schema_hits": 0, "failed": 0}
+        self._classes = {}
+        self._from_schema = set()
+        self._names = {}
+        self._labels = {}
+        self._paths = {}
+        self._values = {}
+        self._pending = {}
+        self._to_verify = {}
+
+    def _rpc(self, fn, *args):
+        self.round_trips += 1
+        return fn(*args)
+
+    # --- Structure -----------------------------------------------------------------
+
+    def root(self):
+        return self._rpc(self.tg.root)
+
+    def project_path(self):
+        """File of the open project ("" while unsaved), or None when the build cannot report it."""
+        try:
+            return self._rpc(self.tg.project_filepath)
+        except Exception:
+            return None
+
+    def note_class(self, node, class_name):
+        """Record ``node``'s class (terragen_rpc cannot report it) so schema lookups can use it."""
+        if node and class_name:
+            self._classes.setdefault(_node_key(node), class_name)
+        return node
+
+    def note_path(self, node, path):
+        if node and path:
+            self._paths[_node_key(node)] = path
+
+    def node_class(self, node):
+        return self._classes.get(_node_key(node))
+
+    def node_by_path(self, path, node_class=None):
+        # Pending renames must land before looking nodes up by name
+        self.flush()
+        try:
+            return self.note_class(self._rpc(self.tg.node_by_path, path), node_class)
+        except Exception:
+            return None
+
+    def create_child(self, parent, class_name):
+        self.flush()
+        return self.note_class(self._rpc(self.tg.create_child, parent, class_name), class_name)
+
+    def children(self, node):
+        self.flush()
+        return self._rpc(node.children)
+
+    def children_filtered_by_class(self, node, class_name):
+        self.flush()
+        found = self._rpc(node.children_filtered_by_class, class_name)
+        for child in found:
+            self.note_class(child, class_name)
+        return found
+
+    def name(self, node):
+        key = _node_key(node)
+        if key not in self._labels:
+            pending = self._pending.get((key, "name"))
+            if pending is not None:
+                return pending[1]
+            self._labels[key] = self._rpc(node.name)
+        return self._labels[key]
+
+    def path(self, node):
+        key = _node_key(node)
+        if key not in self._paths:
+            if (key, "name") in self._pending:
+                self.flush()
+            self._paths[key] = self._rpc(node.path)
+        return self._paths[key]
+
+    def param_names(self, node):
+        """Parameter names of ``node`` (cached), or None when this build cannot list them."""
+        key = _node_key(node)
+        if key not in self._names:
+            node_class = self._classes.get(key)
+            cached = self.schema.names(node_class) if self.schema and node_class else None
+            if cached:
+                self.stats["schema_hits"] += 1
+                self._from_schema.add(key)
+                self._names[key] = cached
+                return cached
+            self._fetch_names(node, key, node_class)
+        return self._names[key]
+
+    def _fetch_names(self, node, key, node_class):
+        try:
+            self._names[key] = list(self._rpc(node.param_names) or [])
+        except Exception:
+            self._names[key] = None
+        if self.schema and node_class and self._names[key]:
+            self.schema.record_names(node_class, self._names[key])
+        return self._names[key]
+
+    def _relearn_names(self, node):
+        """
+        Names served from the schema lack a parameter the caller expected: ask the node
+        itself, since the cached list may come from another build. Returns the live names,
+        or None when they were live already (so the miss is real).
+        """
+        key = _node_key(node)
+        if key not in self._from_schema:
+            return None
+        self._from_schema.discard(key)
+        return self._fetch_names(node, key, self._classes.get(key))
+
+    def has_param(self, node, param):
+        """True/False when ``param_names()`` is available, None when it is not."""
+        names = self.param_names(node)
+        return None if names is None else param in names
+
+    def _lacks_param(self, node, param):
+        """True only when the node's live names (not just cached ones) say ``param`` is missing."""
+        if self.has_param(node, param) is not False:
+            return False
+        names = self._relearn_names(node)
+        return names is None or param not in names
+
+    def resolve_param(self, node, candidates):
+        """First of ``candidates`` that exists on ``node``; None if none do or names are unavailable."""
+        names = self.param_names(node)
+        if names is None:
+            return None
+        node_class = self.node_class(node)
+        if self.schema and node_class:
+            param = self.schema.resolved(node_class, candidates)
+            if param in names:
+                return param
+        param = next((p for p in candidates if p in names), None)
+        if param is None:
+            names = self._relearn_names(node)
+            if names:
+                param = next((p for p in candidates if p in names), None)
+        if param and self.schema and node_class:
+            self.schema.record_resolved(node_class, candidates, param)
+        return param
+
+    # --- Values --------------------------------------------------------------------
+
+    def value_string(self, value):
+        """Nodes are written as their (cached) path, everything else as Terragen's string form."""
+        if hasattr(value, "id") and hasattr(value, "path"):
+            return self.path(value)
+        return param_string(value)
+
+    def get(self, node, param, refresh=False):
+        """Current string value of ``param``; served from memory when the session already knows it."""
+        key = (_node_key(node), param)
+        if not refresh:
+            if key in self._pending:
+                self.stats["elided_reads"] += 1
+                return self._pending[key][1]
+            if key in self._values:
+                self.stats["elided_reads"] += 1
+                return self._values[key]
+        if self._lacks_param(node, param):
+            raise KeyError(f"{self.name(node)} has no parameter '{param}'")
+        self.stats["reads"] += 1
+        value = self._rpc(node.get_param_as_string, param)
+        self._values[key] = value
+        return value
+
+    def set(self, node, param, value, verify=True):
+        """
+        Queue a write. Returns False (without any RPC) when ``param_names()`` says the
+        parameter does not exist on this node. Writes that match the known value are dropped.
+        """
+        if self._lacks_param(node, param):
+            return False
+        value = self.value_string(value)
+        key = (_node_key(node), param)
+        known = self._pending[key][1] if key in self._pending else self._values.get(key)
+        if known is not None and known == value:
+            self.stats["elided_writes"] += 1
+            return True
+        self._pending.pop(key, None)  # re-insert so writes keep their latest order
+        self._pending[key] = (node, value)
+        if verify:
+            self._to_verify[key] = (node, value)
+        else:
+            self._to_verify.pop(key, None)
+        if param == "name":
+            self._labels.pop(key[0], None)
+            self._paths.pop(key[0], None)
+        return True
+
+    def set_now(self, node, param, value):
+        """Write immediately and read the value back (for builds without ``param_names()``)."""
+        self.set(node, param, value, verify=False)
+        self.flush()
+        return self.get(node, param, refresh=True)
+
+    def set_first(self, node, candidates, value, verify=True):
+        """
+        Set the first of ``candidates`` that exists on ``node``; return (param, value) or
+        (None, None). Without ``param_names()`` falls back to trying each name with an
+        immediate read-back, as older builds require.
+        """
+        value = self.value_string(value)
+        if self.param_names(node) is not None:
+            param = self.resolve_param(node, candidates)
+            if param is None:
+                return None, None
+            self.set(node, param, value, verify=verify)
+            return param, value
+
+        for param in candidates:
+            try:
+                actual = self.set_now(node, param, value)
+                if actual and same_value(actual, value):
+                    return param, actual
+            except Exception as e:
+                self.stats["failed"] += 1
+                self.log_callback(f"Param attempt failed {self.name(node)}.{param}: {e}")
+        return None, None
+
+    def get_first(self, node, candidates):
+        """First non-empty value among ``candidates`` (skipping names the node does not have)."""
+        for param in candidates:
+            if self.has_param(node, param) is False:
+                continue
+            try:
+                value = self.get(node, param)
+            except Exception as e:
+                self.log_callback(f"Read attempt failed {self.name(node)}.{param}: {e}")
+                continue
+            if value:
+                return param, value
+        return None, None
+
+    # --- Carried-over state ---------------------------------------------------------
+
+    def known_state(self, nodes):
+        """
+        Everything the session knows about ``nodes`` (names, paths, classes, parameter names
+        and values, after any writes), for a later session on the same project to ``adopt_state``.
+        """
+        keys = {_node_key(node) for node in nodes}
+        labels = {k: v for k, v in self._labels.items() if k in keys}
+        for (key, param), value in self._values.items():
+            if param == "name" and key in keys:
+                labels.setdefault(key, value)
+        return {
+            "labels": labels,
+            "paths": {k: v for k, v in self._paths.items() if k in keys},
+            "classes": {k: v for k, v in self._classes.items() if k in keys},
+            "names": {k: v for k, v in self._names.items() if k in keys and k not in self._from_schema},
+            "values": {k: v for k, v in self._values.items() if k[0] in keys},
+        }
+
+    def adopt_state(self, state):
+        """Serve what ``known_state`` captured from memory, as if this session had read it itself."""
+        self._labels.update(state["labels"])
+        self._paths.update(state["paths"])
+        self._classes.update(state["classes"])
+        self._names.update(state["names"])
+        self._values.update(state["values"])
+
+    # --- Batching ------------------------------------------------------------------
+
+    def flush(self):
+        """Send queued writes in order; failed writes are logged and forgotten."""
+        pending, self._pending = self._pending, {}
+        for key, (node, value) in pending.items():
+            self.stats["writes"] += 1
+            try:
+                self._rpc(node.set_param, key[1], value)
+                self._values[key] = value
+            except Exception as e:
+                self.stats["failed"] += 1
+                self._values.pop(key, None)
+                self._to_verify.pop(key, None)
+                self.log_callback(f"Set failed {self.name(node)}.{key[1]} = '{value}': {e}")
+                if key[0] in self._from_schema:
+                    # Cached names were wrong for this build: relearn them from the node
+                    self.schema.forget(self._classes[key[0]])
+                    self._from_schema.discard(key[0])
+                    self._names.pop(key[0], None)
+
+    def verify(self):
+        """
+        Flush, then read every verified write back once. Returns a list of
+        (node name, param, expected, actual) for writes that did not stick.
+        """
+        self.flush()
+        checks, self._to_verify = self._to_verify, {}
+        mismatches = []
+        for key, (node, expected) in checks.items():
+            try:
+                actual = self.get(node, key[1], refresh=True)
+            except Exception as e:
+                actual = f"<read failed: {e}>"
+            if not same_value(actual, expected):
+                mismatches.append((self.name(node), key[1], expected, actual))
+        return mismatches
+
+    def save_schema(self):
+        """Persist learned parameter names, but only after a session with no failed writes."""
+        if self.schema and not self.stats["failed"]:
+            return self.schema.save()
+        return False
+
+    def summary(self):
+        s = self.stats
+        return (
+            f"{self.round_trips} RPC round trips ({s['writes']} writes, {s['reads']} reads; "
+            f"{s['elided_writes']} writes and {s['elided_reads']} read-backs skipped, "
+            f"{s['schema_hits']} schema hits, {s['failed']} failed)"
+        )
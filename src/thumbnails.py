@@ -0,0 +1,160 @@
+"""Preview thumbnails decoded off the Tk thread, cached in memory and on disk."""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from app_paths import cache_path
+from disk_lru import DiskLRU, remove_quietly
+
+# CTkImage rescales for HiDPI displays, so thumbnails are decoded at up to twice the display size
+HIDPI_FACTOR = 2
+
+
+def _reducible(img):
+    """16-bit greys widen to 32-bit ("I"), palette/other modes become RGB(A); all of these can ``reduce``."""
+    if img.mode in ("I;16", "I;16B", "I;16L"):
+        return img.convert("I")
+    if img.mode in ("L", "RGB", "RGBA", "I", "F"):
+        return img
+    return img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+
+def _to_8bit(img):
+    """Stretch 32-bit int / float heightfields to 8-bit grey over their own range."""
+    if img.mode not in ("I", "F"):
+        return img
+    lo, hi = img.getextrema()
+    span = (hi - lo) or 1
+    return img.point(lambda v: (v - lo) * 255.0 / span).convert("L")
+
+
+def decode_thumbnail(path, edge):
+    """
+    Decode ``path`` so its longer side is at most ``edge``. JPEGs decode straight at a
+    reduced DCT scale (``draft``), other formats are box-reduced by an integer factor
+    before the final resample, so large sources never go through a full-size filter.
+    """
+    with Image.open(path) as img:
+        img.draft("RGB", (edge, edge))
+        img = _reducible(img)
+        factor = max(img.size) // (edge * 2)
+        if factor >= 2:
+            img = img.reduce(factor)
+        img = _to_8bit(img)
+        img.thumbnail((edge, edge), Image.LANCZOS)
+        img.load()
+        return img
+
+
+class ThumbnailService:
+    """
+    Decodes preview thumbnails on a small thread pool and hands them to ``deliver``
+    (normally ``UIDispatcher.call``, so callbacks run on the Tk thread).
+
+    Thumbnails are keyed by absolute path, mtime, file size and edge length. Decoded
+    images stay in an in-memory LRU of ``memory_items`` entries and are written to
+    ``cache_dir`` as PNG, so re-opening the same references, or restarting the app,
+    skips decoding the originals. Overwritten files get a new mtime and so a new entry;
+    the old ones age out as ``cache_dir`` is kept under ``max_bytes`` by a ``DiskLRU``.
+    Concurrent requests for the same thumbnail share one decode.
+    """
+
+    def __init__(self, deliver, cache_dir=None, workers=2, memory_items=64, max_bytes=64 * 1024 * 1024):
+        self.deliver = deliver
+        self.cache_dir = cache_dir or cache_path("thumbnails")
+        self.memory_items = memory_items
+        self._disk = DiskLRU(self.cache_dir, ".png", max_bytes)
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+
+    @staticmethod
+    def make_key(path, edge):
+        st = os.stat(path)
+        digest = hashlib.sha1(f"{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{edge}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def request(self, path, size, callback, on_error=None):
+        """
+        Call ``callback(image)`` through ``deliver`` once the thumbnail for ``path`` at
+        display ``size`` is ready (immediately when it is already in memory).
+        """
+        edge = max(size) * HIDPI_FACTOR
+        try:
+            key = self.make_key(path, edge)
+        except OSError as e:
+            if on_error:
+                self.deliver(on_error, e)
+            return
+
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+            else:
+                waiters = self._pending.get(key)
+                if waiters is not None:
+                    waiters.append((callback, on_error))
+                    return
+                self._pending[key] = [(callback, on_error)]
+        if img is not None:
+            self.deliver(callback, img)
+            return
+        self._executor.submit(self._load, key, path, edge)
+
+    def _load(self, key, path, edge):
+        try:
+            img, error = self._read_cached(key), None
+            if img is None:
+                img = decode_thumbnail(path, edge)
+                self._write_cached(key, img)
+        except Exception as e:
+            img, error = None, e
+
+        with self._lock:
+            waiters = self._pending.pop(key, [])
+            if img is not None:
+                self._memory[key] = img
+                self._memory.move_to_end(key)
+                while len(self._memory) > self.memory_items:
+                    self._memory.popitem(last=False)
+        for callback, on_error in waiters:
+            if img is not None:
+                self.deliver(callback, img)
+            elif on_error:
+                self.deliver(on_error, error)
+
+    def _read_cached(self, key):
+        path = self._path_for(key)
+        try:
+            with Image.open(path) as img:
+                img.load()
+        except (OSError, ValueError):
+            return None
+        self._disk.touched(path)
+        return img
+
+    def _write_cached(self, key, img):
+        path = self._path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            img.save(tmp_path, format="PNG")
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write thumbnail cache entry: {e}")
+            remove_quietly(tmp_path)
+            return
+        self._disk.added(path, size)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,182 @@
+"""Seamless multi-tile terrain generation: edge-conditioned Gemini tiles blended into one map."""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from heightfield import deband_heights, image_to_heights, is_low_precision, resample_heights
+
+UNKNOWN_GREY = 128
+
+
+def tile_waves(rows, cols):
+    """
+    Group tile (row, col) positions into dependency waves. A tile is conditioned on its
+    left and top neighbours, so every tile on one anti-diagonal is independent of the
+    others and a whole diagonal can be generated at once.
+    """
+    return [[(r, k - r) for r in range(max(0, k - cols + 1), min(rows, k + 1))] for k in range(rows + cols - 1)]
+
+
+def _ramp(length, overlap, rising, falling):
+    """1-D feather weights: linear 0 -> 1 over ``overlap`` cells on sides that have a neighbour."""
+    w = np.ones(length, dtype=np.float32)
+    if overlap <= 0:
+        return w
+    edge = (np.arange(overlap, dtype=np.float32) + 0.5) / np.float32(overlap)
+    if rising:
+        w[:overlap] = edge
+    if falling:
+        w[-overlap:] = np.minimum(w[-overlap:], edge[::-1])
+    return w
+
+
+class TileMosaic:
+    """
+    Accumulates tiles into one large map with feathered overlaps.
+
+    Tiles sit on a grid with ``step = tile_px - overlap_px`` spacing, so neighbours share an
+    ``overlap_px`` band. Each tile is added with linear ramps across the bands it shares;
+    opposite ramps sum to one, so the blended map is ``acc / weight`` everywhere.
+    """
+
+    def __init__(self, rows, cols, tile_px, overlap_px, channels=None):
+        self.rows, self.cols = rows, cols
+        self.tile_px, self.overlap_px = tile_px, overlap_px
+        self.step = tile_px - overlap_px
+        height = self.step * (rows - 1) + tile_px
+        width = self.step * (cols - 1) + tile_px
+        shape = (height, width) if channels is None else (height, width, channels)
+        self.acc = np.zeros(shape, dtype=np.float32)
+        self.weight = np.zeros((height, width), dtype=np.float32)
+
+    def box(self, r, c):
+        r0, c0 = r * self.step, c * self.step
+        return r0, r0 + self.tile_px, c0, c0 + self.tile_px
+
+    def blended(self, r0=0, r1=None, c0=0, c1=None):
+        """Blended values in a window, plus the mask of cells any tile has covered so far."""
+        weight = self.weight[r0:r1, c0:c1]
+        known = weight > 0
+        safe = np.where(known, weight, np.float32(1.0))
+        acc = self.acc[r0:r1, c0:c1]
+        return acc / (safe if acc.ndim == 2 else safe[..., None]), known
+
+    def context(self, r, c):
+        """Conditioning canvas for tile (r, c): neighbours' overlap bands, flat grey elsewhere."""
+        r0, r1, c0, c1 = self.box(r, c)
+        values, known = self.blended(r0, r1, c0, c1)
+        canvas = np.where(known if values.ndim == 2 else known[..., None], values, np.float32(UNKNOWN_GREY / 255.0))
+        return Image.fromarray((np.clip(canvas, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8))
+
+    def match_levels(self, r, c, tile):
+        """
+        Gain/offset-correct a heightmap tile so it agrees with what is already in its overlap
+        bands (least squares over the shared cells). Gemini does not keep absolute levels
+        between calls, so without this neighbouring tiles meet at a step.
+        """
+        r0, r1, c0, c1 = self.box(r, c)
+        existing, known = self.blended(r0, r1, c0, c1)
+        if known.sum() < 16:
+            return tile
+        x, y = tile[known], existing[known]
+        var = float(x.var())
+        gain = float(np.clip(((x - x.mean()) * (y - y.mean())).mean() / var, 0.5, 2.0)) if var > 1e-8 else 1.0
+        offset = float(y.mean()) - gain * float(x.mean())
+        tile *= np.float32(gain)
+        tile += np.float32(offset)
+        return tile
+
+    def add(self, r, c, tile):
+        r0, r1, c0, c1 = self.box(r, c)
+        ov = self.overlap_px
+        wy = _ramp(self.tile_px, ov, r > 0, r < self.rows - 1)
+        wx = _ramp(self.tile_px, ov, c > 0, c < self.cols - 1)
+        w = wy[:, None] * wx[None, :]
+        self.acc[r0:r1, c0:c1] += tile * (w if tile.ndim == 2 else w[..., None])
+        self.weight[r0:r1, c0:c1] += w
+
+    def result(self):
+        values, _ = self.blended()
+        return values
+
+
+def generate_tiled_heightfield(api, image_paths, grid=(2, 2), tile_px=1024, overlap_px=128, generate_texture=True,
+                               workers=4, use_cache=True, status_callback=None, output_dir=None, name=None,
+                               erode=True, output_format="png16"):
+    """
+    Generate a ``grid`` (rows, cols) of Gemini heightmap (and texture) tiles and save them as
+    one seamless heightfield.
+
+    Tiles run in anti-diagonal waves of up to ``workers`` concurrent calls. Each tile is
+    conditioned on a canvas holding the overlap bands of its already generated left/top
+    neighbours, level-matched to them, and feather-blended into the mosaic. Returns the
+    same dict as ``TerrainGeneratorAPI.save_heightfield_images``.
+    """
+
+    def log(message):
+        if status_callback:
+            status_callback(message)
+        print(message)
+
+    rows, cols = grid
+    if overlap_px * 2 >= tile_px:
+        raise ValueError("overlap_px must be less than half of tile_px.")
+    heights = TileMosaic(rows, cols, tile_px, overlap_px)
+    texture = TileMosaic(rows, cols, tile_px, overlap_px, channels=3) if generate_texture else None
+
+    reference_payloads = api.prepare_reference_payloads(image_paths, log)
+
+    def make_tile(pos):
+        r, c = pos
+        tile_log = lambda message: log(f"[tile {r},{c}] {message}")  # noqa: E731
+        first = r == 0 and c == 0
+        hf_img = api.generate_heightmap_step(
+            reference_payloads, tile_log, use_cache, context_img=None if first else heights.context(r, c),
+        )
+        tex_img = None
+        if texture is not None:
+            tex_img = api.generate_texture_step(
+                hf_img, reference_payloads, tile_log, use_cache, context_img=None if first else texture.context(r, c),
+            )
+        tile_heights = image_to_heights(hf_img)
+        if is_low_precision(hf_img):
+            tile_heights = deband_heights(tile_heights)
+        if tile_heights.shape != (tile_px, tile_px):
+            tile_heights = resample_heights(tile_heights, tile_px, tile_px)
+        return pos, tile_heights, tex_img
+
+    waves = tile_waves(rows, cols)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for n, wave in enumerate(waves, 1):
+            log(f"Tile wave {n}/{len(waves)}: {len(wave)} tile(s)")
+            # Diagonal neighbours share a corner band, so blend only after the whole wave has read the mosaic
+            for (r, c), tile_heights, tex_img in list(pool.map(make_tile, wave)):
+                heights.add(r, c, heights.match_levels(r, c, tile_heights))
+                if texture is not None:
+                    if tex_img is None:
+                        log(f"[tile {r},{c}] No texture returned; texture output disabled.")
+                        texture = None
+                    else:
+                        tex_img = tex_img.convert("RGB")
+                        if tex_img.size != (tile_px, tile_px):
+                            tex_img = tex_img.resize((tile_px, tile_px), Image.LANCZOS)
+                        tex = np.asarray(tex_img, dtype=np.float32)
+                        texture.add(r, c, tex * np.float32(1.0 / 255.0))
+
+    merged = heights.result()
+    lo, hi = float(merged.min()), float(merged.max())
+    merged -= lo
+    if hi > lo:
+        merged *= np.float32(1.0 / (hi - lo))
+    log(f"Blended {rows}x{cols} tiles into a {merged.shape[1]}x{merged.shape[0]} heightfield")
+
+    images = [merged]
+    if texture is not None:
+        tex = np.clip(texture.result(), 0.0, 1.0)
+        tex *= 255.0
+        tex += 0.5
+        images.append(Image.fromarray(tex.astype(np.uint8)))
+    return api.save_heightfield_images(
+        images, texture is not None, log, output_dir=output_dir, name=name, erode=erode, output_format=output_format,
+    )
@@ -0,0 +1,255 @@
+"""Tiled float32 heightfields backed by numpy.memmap, for maps too large to hold in RAM."""
+import os
+import json
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+from PIL import Image
+
+from erosion import erode, process_pool
+from heightfield import deband_heights, image_to_heights, is_low_precision, save_heightfield
+
+INDEX_FILE = "index.json"
+DATA_FILE = "heights.f32"
+
+# ``box`` is the tile's own (r0, r1, c0, c1); ``padded`` adds up to ``overlap`` cells of border
+Tile = namedtuple("Tile", ["row", "col", "box", "padded"])
+
+
+class TiledHeightfield:
+    """
+    A heightfield stored as one row-major float32 file plus a small JSON tile index.
+
+    The data is memory-mapped, so opening a store costs nothing and only the pages of the
+    tiles actually read are loaded. Work is done tile by tile: ``read_tile`` returns a tile
+    with its overlap border (so filters and erosion see their neighbours) and
+    ``write_tile`` stores only the tile's centre. Because the file is headerless
+    little-endian float32, it is also a valid ``.r32`` heightfield.
+    """
+
+    def __init__(self, path, rows, cols, tile_size=1024, overlap=32, mode="r+"):
+        self.path = path
+        self.rows = rows
+        self.cols = cols
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.data = np.memmap(os.path.join(path, DATA_FILE), dtype="<f4", mode=mode, shape=(rows, cols))
+
+    @classmethod
+    def create(cls, path, rows, cols=None, tile_size=1024, overlap=32):
+        """Create an empty (zero-filled, sparse on most filesystems) store at ``path``."""
+        cols = cols or rows
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "cols": cols, "tile_size": tile_size, "overlap": overlap,
+                       "dtype": "float32", "data": DATA_FILE}, f, indent=2)
+        with open(os.path.join(path, DATA_FILE), "wb") as f:
+            f.truncate(rows * cols * 4)
+        return cls(path, rows, cols, tile_size, overlap)
+
+    @classmethod
+    def open(cls, path, mode="r+"):
+        with open(os.path.join(path, INDEX_FILE), encoding="utf-8") as f:
+            index = json.load(f)
+        return cls(path, index["rows"], index["cols"], index["tile_size"], index["overlap"], mode=mode)
+
+    @classmethod
+    def from_image(cls, path, image, tile_size=1024, overlap=32, deband=False):
+        """
+        Import a heightfield image (a path or an open PIL image, any mode ``image_to_heights``
+        accepts) into a new store. Rows are converted to float32 ``tile_size`` at a time, so
+        only the source pixels and one band of floats are ever in memory. With ``deband``,
+        8-bit sources are de-banded band by band, each band read with ``overlap`` extra
+        rows so the blur matches de-banding the whole map.
+        """
+        if not isinstance(image, Image.Image):
+            with Image.open(image) as img:
+                return cls.from_image(path, img, tile_size, overlap, deband)
+
+        cols, rows = image.size
+        deband = deband and is_low_precision(image)
+        # Float sources are normalised over the whole map, not per band
+        raw_float = image.mode == "F"
+        pad = overlap if deband else 0
+        store = cls.create(path, rows, cols, tile_size, overlap)
+        for r0 in range(0, rows, tile_size):
+            r1 = min(rows, r0 + tile_size)
+            pr0, pr1 = max(0, r0 - pad), min(rows, r1 + pad)
+            band = image.crop((0, pr0, cols, pr1))
+            heights = np.array(band, dtype=np.float32) if raw_float else image_to_heights(band)
+            if deband:
+                heights = deband_heights(heights)
+            store.data[r0:r1] = heights[r0 - pr0:r1 - pr0]
+        if raw_float:
+            store.normalize()
+        store.flush()
+        return store
+
+    @classmethod
+    def from_array(cls, path, heights, tile_size=1024, overlap=32):
+        """Copy an in-memory (rows, cols) heightfield into a new store."""
+        store = cls.create(path, heights.shape[0], heights.shape[1], tile_size, overlap)
+        for r0 in range(0, store.rows, tile_size):
+            store.data[r0:r0 + tile_size] = heights[r0:r0 + tile_size]
+        store.flush()
+        return store
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    def tiles(self):
+        """Tile index in row-major order."""
+        for r0 in range(0, self.rows, self.tile_size):
+            for c0 in range(0, self.cols, self.tile_size):
+                r1, c1 = min(self.rows, r0 + self.tile_size), min(self.cols, c0 + self.tile_size)
+                padded = (max(0, r0 - self.overlap), min(self.rows, r1 + self.overlap),
+                          max(0, c0 - self.overlap), min(self.cols, c1 + self.overlap))
+                yield Tile(r0 // self.tile_size, c0 // self.tile_size, (r0, r1, c0, c1), padded)
+
+    def read_tile(self, tile, padded=True):
+        """Load one tile (with its overlap border by default) into an in-memory float32 array."""
+        r0, r1, c0, c1 = tile.padded if padded else tile.box
+        return np.array(self.data[r0:r1, c0:c1], dtype=np.float32)
+
+    def write_tile(self, tile, values, padded=True):
+        """Store a tile; when ``values`` includes the overlap border only its centre is written."""
+        r0, r1, c0, c1 = tile.box
+        if padded:
+            pr0, _, pc0, _ = tile.padded
+            values = values[r0 - pr0:r1 - pr0, c0 - pc0:c1 - pc0]
+        self.data[r0:r1, c0:c1] = values
+
+    def flush(self):
+        self.data.flush()
+
+    def close(self):
+        if self.data is None:
+            return
+        self.flush()
+        # Drop the mapping so the file can be replaced (required on Windows)
+        self.data = None
+
+    def map_tiles(self, fn, dest=None, processes=None, max_in_flight=None):
+        """
+        Apply ``fn(padded_tile) -> padded_tile`` to every tile, writing into ``dest`` (default:
+        in place) on the shared erosion process pool. ``fn`` must be picklable when
+        ``processes`` is not 1. Reads always come from this store, so with a separate
+        ``dest`` neighbouring tiles never see each other's results. At most
+        ``max_in_flight`` tiles are held in memory at once.
+        """
+        dest = dest or self
+        processes = processes or os.cpu_count() or 1
+        # A single tile gains nothing from a worker process
+        if processes == 1 or (self.rows <= self.tile_size and self.cols <= self.tile_size):
+            for tile in self.tiles():
+                dest.write_tile(tile, fn(self.read_tile(tile)))
+            dest.flush()
+            return dest
+
+        max_in_flight = max_in_flight or processes * 2
+        pool = process_pool(processes)
+        pending = []
+        for tile in self.tiles():
+            pending.append((tile, pool.submit(fn, self.read_tile(tile))))
+            if len(pending) >= max_in_flight:
+                done_tile, future = pending.pop(0)
+                dest.write_tile(done_tile, future.result())
+        for done_tile, future in pending:
+            dest.write_tile(done_tile, future.result())
+        dest.flush()
+        return dest
+
+    def value_range(self):
+        lo, hi = np.inf, -np.inf
+        for tile in self.tiles():
+            r0, r1, c0, c1 = tile.box
+            block = self.data[r0:r1, c0:c1]
+            lo, hi = min(lo, float(block.min())), max(hi, float(block.max()))
+        return lo, hi
+
+    def normalize(self):
+        """Rescale the whole map to [0, 1], one tile at a time."""
+        lo, hi = self.value_range()
+        scale = np.float32(1.0 / (hi - lo)) if hi > lo else np.float32(1.0)
+        for tile in self.tiles():
+            values = self.read_tile(tile, padded=False)
+            values -= lo
+            values *= scale
+            self.write_tile(tile, values, padded=False)
+        self.flush()
+
+    def clip(self, lo=0.0, hi=1.0):
+        """Clamp the whole map to [``lo``, ``hi``], one tile at a time."""
+        for tile in self.tiles():
+            values = self.read_tile(tile, padded=False)
+            np.clip(values, lo, hi, out=values)
+            self.write_tile(tile, values, padded=False)
+        self.flush()
+
+    def resampled(self, path, rows, cols):
+        """
+        Bicubic resize into a new store at ``path``, ``tile_size`` output rows at a time.
+        Each band is resampled from the source rows it covers plus the filter's reach, so
+        the result matches resizing the whole map at once.
+        """
+        out = TiledHeightfield.create(path, rows, cols, self.tile_size, self.overlap)
+        scale = self.rows / rows
+        # Bicubic reads 2 source rows either side, more when shrinking
+        margin = int(np.ceil(2 * max(1.0, scale))) + 1
+        for r0 in range(0, rows, self.tile_size):
+            r1 = min(rows, r0 + self.tile_size)
+            y0, y1 = r0 * scale, r1 * scale
+            s0, s1 = max(0, int(y0) - margin), min(self.rows, int(np.ceil(y1)) + margin)
+            band = Image.fromarray(np.array(self.data[s0:s1], dtype=np.float32))
+            band = band.resize((cols, r1 - r0), Image.BICUBIC, box=(0, y0 - s0, self.cols, y1 - s0))
+            out.data[r0:r1] = np.asarray(band, dtype=np.float32)
+        out.flush()
+        return out
+
+    def preview(self, max_size=1024):
+        """Downsampled grayscale PIL image of the whole map, built from per-tile block means."""
+        step = 1
+        while max(self.rows, self.cols) > max_size * step:
+            step *= 2
+        if self.tile_size % step:
+            # Tiles would not line up with preview pixels; fall back to strided sampling
+            return Image.fromarray((np.clip(self.data[::step, ::step], 0.0, 1.0) * 255.0).astype(np.uint8))
+        out = np.zeros((-(-self.rows // step), -(-self.cols // step)), dtype=np.float32)
+        for tile in self.tiles():
+            r0, r1, c0, c1 = tile.box
+            values = self.read_tile(tile, padded=False)
+            # Tile sizes are not always multiples of step; pad the ragged edge by repetition
+            pr, pc = -(-values.shape[0] // step) * step, -(-values.shape[1] // step) * step
+            if (pr, pc) != values.shape:
+                values = np.pad(values, ((0, pr - values.shape[0]), (0, pc - values.shape[1])), mode="edge")
+            block = values.reshape(pr // step, step, pc // step, step).mean(axis=(1, 3))
+            out[r0 // step:r0 // step + block.shape[0], c0 // step:c0 // step + block.shape[1]] = block
+        np.clip(out, 0.0, 1.0, out=out)
+        out *= 255.0
+        return Image.fromarray(out.astype(np.uint8))
+
+    def export(self, path_without_ext, output_format="png16"):
+        """
+        Write the map as a regular heightfield file (see ``heightfield.save_heightfield``).
+        Every format streams from the memory map in row chunks; tiff32 is limited to 4 GB.
+        """
+        self.flush()
+        return save_heightfield(self.data, path_without_ext, output_format)
+
+
+def erode_store(store, processes=None, **kwargs):
+    """
+    Erode a tiled store tile by tile into a sibling data file, then swap it in. Only
+    ``processes * 2`` padded tiles are ever in memory; talus is taken from the full map size.
+    """
+    kwargs.setdefault("talus", 4.0 / max(store.shape))
+    scratch = TiledHeightfield.create(store.path + ".eroding", store.rows, store.cols, store.tile_size, store.overlap)
+    store.map_tiles(partial(erode, **kwargs), dest=scratch, processes=processes)
+    scratch.close()
+    store.close()
+    os.replace(os.path.join(scratch.path, DATA_FILE), os.path.join(store.path, DATA_FILE))
+    os.remove(os.path.join(scratch.path, INDEX_FILE))
+    os.rmdir(scratch.path)
+    return TiledHeightfield.open(store.path)
@@ -0,0 +1,141 @@
+"""Main-thread dispatch for the Tk app: worker threads queue UI work, the Tk loop drains it on a fixed tick."""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from tkinter import messagebox as tk_messagebox
+
+
+class UIClosed(RuntimeError):
+    """The Tk loop has stopped; UI work queued from a worker thread will never run."""
+
+
+class UIDispatcher:
+    """
+    Tk widgets must only be touched from the thread running ``mainloop``. Worker threads
+    hand UI work to ``call`` (fire and forget) or ``call_sync`` (wait for the result,
+    e.g. a yes/no dialog), and log lines to ``log``. Every ``tick_ms`` the Tk loop runs
+    queued calls for at most ``budget_ms`` and passes all log lines gathered since the
+    previous tick to ``log_sink`` in one batch, so several jobs streaming output cost
+    one widget update per frame instead of one per line. A queued call that raises is
+    reported through ``on_error(message)`` (the app's ``log_message``).
+    """
+
+    def __init__(self, root, log_sink=None, tick_ms=16, budget_ms=8, on_error=None):
+        self.root = root
+        self.log_sink = log_sink
+        self.on_error = on_error
+        self.tick_ms = tick_ms
+        self.budget_ms = budget_ms
+        self._main_thread = threading.current_thread()
+        self._calls = queue.SimpleQueue()
+        self._lines = []
+        self._lines_lock = threading.Lock()
+        self._after_id = None
+        self._stopped = False
+        self._stop_lock = threading.Lock()
+
+    def on_main_thread(self):
+        return threading.current_thread() is self._main_thread
+
+    def start(self):
+        if self._after_id is None and not self._stopped:
+            self._after_id = self.root.after(self.tick_ms, self._tick)
+
+    def stop(self):
+        """Stop ticking for good; workers waiting in ``call_sync`` get ``UIClosed`` instead of hanging."""
+        with self._stop_lock:
+            self._stopped = True
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        while True:
+            try:
+                _fn, _args, _kwargs, future = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            if future is not None:
+                future.set_exception(UIClosed("The window was closed"))
+
+    def call(self, fn, *args, **kwargs):
+        """Run ``fn`` on the Tk thread: now when already there, else on the next tick."""
+        if self.on_main_thread():
+            return fn(*args, **kwargs)
+        with self._stop_lock:
+            if not self._stopped:
+                self._calls.put((fn, args, kwargs, None))
+        return None
+
+    def call_sync(self, fn, *args, **kwargs):
+        """Run ``fn`` on the Tk thread and wait for its result (re-raising its error, or ``UIClosed``)."""
+        if self.on_main_thread():
+            return fn(*args, **kwargs)
+        future = Future()
+        with self._stop_lock:
+            if self._stopped:
+                raise UIClosed("The window was closed")
+            self._calls.put((fn, args, kwargs, future))
+        return future.result()
+
+    def log(self, line):
+        """Queue one entry for ``log_sink`` (whatever the sink takes: the app passes ``LogEntry``)."""
+        with self._lines_lock:
+            self._lines.append(line)
+
+    def _tick(self):
+        with self._lines_lock:
+            lines, self._lines = self._lines, []
+        if lines and self.log_sink:
+            try:
+                self.log_sink(lines)
+            except Exception:
+                # Not reported through on_error: that would feed the failing sink again
+                logging.getLogger("terrain_ai").exception("UI log sink failed")
+
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        while time.perf_counter() < deadline:
+            try:
+                fn, args, kwargs, future = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if future is not None:
+                    future.set_exception(e)
+                elif self.on_error:
+                    self.on_error(f"UI update failed: {e}")
+                continue
+            if future is not None:
+                future.set_result(result)
+
+        self._after_id = self.root.after(self.tick_ms, self._tick)
+
+
+class Dialogs:
+    """
+    ``tkinter.messagebox`` that can be called from any thread (the dialog runs on the Tk
+    thread). Once the window is closed, dialogs return at once: None, or False for questions.
+    """
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def _show(self, fn, title, message, options, closed_result=None):
+        try:
+            return self.dispatcher.call_sync(fn, title, message, **options)
+        except UIClosed:
+            return closed_result
+
+    def showinfo(self, title, message, **options):
+        return self._show(tk_messagebox.showinfo, title, message, options)
+
+    def showwarning(self, title, message, **options):
+        return self._show(tk_messagebox.showwarning, title, message, options)
+
+    def showerror(self, title, message, **options):
+        return self._show(tk_messagebox.showerror, title, message, options)
+
+    def askyesno(self, title, message, **options):
+        return self._show(tk_messagebox.askyesno, title, message, options, closed_result=False)
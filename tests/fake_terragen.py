@@ -0,0 +1,169 @@
+"""
+In-process stand-in for Terragen's RPC server, for tests.
+
+Speaks the same wire protocol as Terragen (length-prefixed JSON-RPC, one TCP
+connection per call) and models just enough of a project for a deploy: a flat
+node tree, per-class parameter names and string parameter values. Every call is
+counted, so tests can compare what a session reports with what the server saw.
+"""
+import json
+import socketserver
+import threading
+
+CLASS_PARAMS = {
+    "project": [],
+    "planet": ["name", "surface_shader", "atmosphere_shader", "gui_node_pos"],
+    "compute_terrain": ["name", "input_node", "gradient_patch_size", "gui_node_pos"],
+    "heightfield_load": ["name", "filename", "gui_node_pos"],
+    "heightfield_shader": ["name", "heightfield", "input_node", "gui_node_pos"],
+    "surface_layer": ["name", "input_node", "color_function_input", "gui_node_pos"],
+    "image_map_shader": ["name", "image_filename", "projection", "size", "size_x", "size_y", "position_center",
+                         "position_lower_left", "repeat_x", "repeat_y", "flip_x", "flip_y", "gui_node_pos"],
+    "merger_shader": ["name", "input_node", "input_node_2", "mix_to_use", "gui_node_pos"],
+    "fractal_warp_shader": ["name", "input_node", "mask_input", "gui_node_pos"],
+    "power_fractal_shader_v3": ["name", "input_node", "gui_node_pos"],
+    "simple_shape_shader": ["name", "input_node", "gui_node_pos"],
+    "cloud_layer_v3": ["name", "input_node", "density_shader", "cloud_altitude", "cloud_depth", "cloud_density",
+                       "coverage_adjust", "edge_sharpness", "gui_node_pos"],
+    "density_fractal_shader_v3": ["name", "input_node", "feature_scale", "gui_node_pos"],
+    "planet_atmosphere": ["name", "haze_density", "bluesky_density", "gui_node_pos"],
+    "sunlight": ["name", "heading", "elevation", "strength", "gui_node_pos"],
+}
+
+# What a new Terragen project starts with
+DEFAULT_NODES = [
+    ("Planet 01", "planet"),
+    ("Compute Terrain", "compute_terrain"),
+    ("Base colours", "surface_layer"),
+    ("Atmosphere 01", "planet_atmosphere"),
+    ("Sunlight 01", "sunlight"),
+]
+
+
+class FakeTerragen:
+    """The project state behind the server; ``calls`` counts every request handled."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes = {}
+        self.calls = 0
+        self.saved = []
+        self.project_path = ""
+        self._next_id = 1
+        self.root = self._add("Project", "project", None)
+        for name, class_name in DEFAULT_NODES:
+            self._add(name, class_name, self.root)
+        self.node_by_path("/Planet 01")["params"]["surface_shader"] = "/Base colours"
+
+    def _add(self, name, class_name, parent):
+        node_id = str(self._next_id)
+        self._next_id += 1
+        params = {p: "" for p in CLASS_PARAMS[class_name]}
+        params["name"] = name
+        self.nodes[node_id] = {"id": node_id, "class": class_name, "parent": parent, "params": params}
+        return node_id
+
+    def node_by_path(self, path):
+        for node in self.nodes.values():
+            if node["parent"] == self.root and "/" + node["params"]["name"] == path:
+                return node
+        return None
+
+    def add_node(self, name, class_name):
+        """Add a top-level node the way a user would in the Terragen UI."""
+        with self.lock:
+            return self._add(name, class_name, self.root)
+
+    def nodes_of_class(self, class_name):
+        return [n for n in self.nodes.values() if n["class"] == class_name]
+
+    def handle(self, method, params):
+        with self.lock:
+            self.calls += 1
+            if method == "root":
+                return self.root
+            if method == "node_by_path":
+                node = self.node_by_path(params[0])
+                return node["id"] if node else "0"
+            if method == "create_child":
+                if params[1] not in CLASS_PARAMS:
+                    return "0"
+                base = params[1].replace("_", " ").title()
+                index = 1
+                while self.node_by_path(f"/{base} {index:02d}"):
+                    index += 1
+                return self._add(f"{base} {index:02d}", params[1], params[0])
+            if method == "save_project":
+                self.saved.append(params[0])
+                self.project_path = params[0]
+                return True
+            if method == "project_filepath":
+                return self.project_path
+            if method == "children":
+                return [n["id"] for n in self.nodes.values() if n["parent"] == params[0]]
+            if method == "children_filtered_by_class":
+                return [n["id"] for n in self.nodes.values() if n["parent"] == params[0] and n["class"] == params[1]]
+
+            node = self.nodes.get(params[0])
+            if node is None:
+                raise ValueError(f"No node with id {params[0]}")
+            if method == "name":
+                return node["params"].get("name", "")
+            if method in ("path", "name_and_path"):
+                return "/" + node["params"]["name"] if node["parent"] else node["params"]["name"]
+            if method == "param_names":
+                return list(node["params"])
+            if method == "get_param_as_string":
+                if params[1] not in node["params"]:
+                    raise KeyError(params[1])
+                return node["params"][params[1]]
+            if method == "set_param_from_string":
+                if params[1] not in node["params"]:
+                    raise KeyError(params[1])
+                node["params"][params[1]] = params[2]
+                return ""
+            raise NotImplementedError(method)
+
+
+class FakeTerragenServer(socketserver.ThreadingTCPServer):
+    """Serves a ``FakeTerragen`` on 127.0.0.1 from a background thread; use as a context manager."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        self.fake = FakeTerragen()
+        super().__init__(("127.0.0.1", port), _Handler)
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        length = int.from_bytes(self._recv(4), "little")
+        msg = json.loads(self._recv(length))
+        try:
+            reply = {"jsonrpc": "2.0", "id": msg["id"], "result": self.server.fake.handle(msg["method"], msg["params"])}
+        except Exception as e:
+            reply = {"jsonrpc": "2.0", "id": msg["id"], "error": {"code": -32602, "message": repr(e)}}
+        self.request.sendall(json.dumps(reply).encode("utf-8"))
+
+    def _recv(self, n):
+        buf = b""
+        while len(buf) < n:
+            chunk = self.request.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("Client closed the connection")
+            buf += chunk
+        return buf
@@ -0,0 +1,65 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import api_handler
+from api_handler import PayloadBudget, TerrainGeneratorAPI
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def api():
+    api = TerrainGeneratorAPI(response_cache=ResponseCache(enabled=False))
+    yield api
+    api.close()
+
+
+@pytest.fixture
+def noisy_png(tmp_path):
+    # Noise compresses badly as PNG but JPEG-encodes far smaller
+    rng = np.random.default_rng(0)
+    path = tmp_path / "reference.png"
+    Image.fromarray(rng.integers(0, 256, (256, 384, 3), dtype=np.uint8)).save(path)
+    return str(path)
+
+
+def test_reference_file_is_closed_after_encoding(api, noisy_png, monkeypatch):
+    opened = []
+    real_open = Image.open
+
+    def tracking_open(*args, **kwargs):
+        img = real_open(*args, **kwargs)
+        opened.append(img)
+        return img
+
+    monkeypatch.setattr(api_handler.Image, "open", tracking_open)
+    payload = api._prepare_image_payload(noisy_png, log_callback=lambda msg: None)
+
+    assert payload["inline_data"]["mime_type"] == "image/jpeg"
+    assert opened and all(img.fp is None for img in opened)
+
+
+def test_encoded_payloads_are_memoized(api, noisy_png):
+    first = api._prepare_image_payload(noisy_png, log_callback=lambda msg: None)
+    assert api._prepare_image_payload(noisy_png, log_callback=lambda msg: None) is first
+
+
+def test_log_reports_growth_without_negative_savings(api, tmp_path):
+    # A flat PNG is tiny; its JPEG re-encode is larger
+    path = tmp_path / "flat.png"
+    Image.new("RGB", (512, 512), (90, 120, 60)).save(path)
+    logs = []
+    api.payload_budget = PayloadBudget(quality=95)
+    api._prepare_image_payload(str(path), log_callback=logs.append)
+
+    line = next(msg for msg in logs if msg.startswith("Encoded"))
+    assert "saved" not in line
+    assert line.endswith("KB larger)")
+
+
+def test_budget_downscales_to_long_edge(api, noisy_png):
+    api.payload_budget = PayloadBudget(max_long_edge=128)
+    data = api._prepare_image_payload(noisy_png, log_callback=lambda msg: None)["inline_data"]["data"]
+    assert max(Image.open(BytesIO(data)).size) == 128
@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import json
+import time
+from io import BytesIO
+
+import httpx
+import pytest
+from PIL import Image
+
+from api_handler import TerrainGeneratorAPI
+from async_api import AsyncTerrainGeneratorAPI
+from rate_limiter import RequestScheduler
+from response_cache import ResponseCache
+
+
+def image_response():
+    buf = BytesIO()
+    Image.new("L", (16, 16), 128).save(buf, "PNG")
+    data = base64.b64encode(buf.getvalue()).decode("ascii")
+    return {"candidates": [{"content": {"parts": [{"inline_data": {"mime_type": "image/png", "data": data}}]}}]}
+
+
+class FakeGemini:
+    """Async ``httpx.MockTransport`` handler answering every request after ``delay`` seconds."""
+
+    def __init__(self, delay=0.0, statuses=()):
+        self.delay = delay
+        self.statuses = list(statuses)
+        self.requests = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, request):
+        body = b"".join([chunk async for chunk in request.stream])
+        self.requests.append((request, json.loads(body)))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if self.statuses:
+            return httpx.Response(self.statuses.pop(0), json={"error": {}})
+        return httpx.Response(200, json=image_response())
+
+
+@pytest.fixture
+def reference(tmp_path):
+    path = tmp_path / "reference.png"
+    Image.new("RGB", (64, 64), (80, 100, 60)).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    scheduler = RequestScheduler(limits={"gemini-3-pro-image-preview": {"rpm": 6000}}, base_delay=0.01)
+    api = TerrainGeneratorAPI(response_cache=ResponseCache(cache_dir=str(tmp_path / "responses")), scheduler=scheduler)
+    yield api
+    api.close()
+
+
+def run(fake, api, coro_fn, max_concurrency=8):
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+        async with AsyncTerrainGeneratorAPI(api=api, client=client, max_concurrency=max_concurrency) as async_api:
+            result = await coro_fn(async_api)
+        await client.aclose()
+        return result
+    return asyncio.run(main())
+
+
+def test_jobs_share_the_loop_without_a_thread_per_request(api, reference):
+    fake = FakeGemini(delay=0.3)
+
+    async def jobs(async_api):
+        started = time.monotonic()
+        results = await asyncio.gather(*[
+            async_api.generate_heightmap_images([reference], generate_texture=False, use_cache=False) for _ in range(12)
+        ])
+        return results, time.monotonic() - started
+
+    results, elapsed = run(fake, api, jobs, max_concurrency=12)
+
+    assert [len(images) for images in results] == [1] * 12
+    assert fake.peak == 12
+    assert elapsed < 12 * 0.3 / 2
+
+
+def test_concurrency_is_capped(api, reference):
+    fake = FakeGemini(delay=0.05)
+    run(fake, api, lambda a: asyncio.gather(*[
+        a.generate_heightmap_images([reference], generate_texture=False, use_cache=False) for _ in range(6)
+    ]), max_concurrency=2)
+    assert fake.peak == 2
+
+
+def test_request_carries_json_headers_and_streamed_body(api, reference):
+    fake = FakeGemini()
+    images = run(fake, api, lambda a: a.generate_heightmap_images([reference], generate_texture=True, use_cache=False))
+
+    assert len(images) == 2
+    request, body = fake.requests[0]
+    assert request.headers["content-type"] == "application/json"
+    assert int(request.headers["content-length"]) == len(json.dumps(body, separators=(",", ":")).encode())
+    assert request.url.params["key"] == "test-key"
+    assert body["contents"][0]["parts"][-1]["text"].strip().startswith("You are an expert Terrain Artist AI.")
+
+
+def test_throttled_responses_are_retried(api, reference):
+    fake = FakeGemini(statuses=[503, 503])
+    images = run(fake, api, lambda a: a.generate_heightmap_images([reference], generate_texture=False, use_cache=False))
+    assert len(images) == 1
+    assert len(fake.requests) == 3
+
+
+def test_cached_responses_skip_the_network(api, reference):
+    fake = FakeGemini()
+    for _ in range(2):
+        run(fake, api, lambda a: a.generate_heightmap_images([reference], generate_texture=False))
+    assert len(fake.requests) == 1
+
+
+def test_cancelling_a_job_cancels_its_request(api, reference):
+    fake = FakeGemini(delay=30)
+
+    async def cancel_soon(async_api):
+        task = asyncio.ensure_future(async_api.generate_heightmap_images([reference], use_cache=False))
+        while not fake.requests:
+            await asyncio.sleep(0.01)
+        started = time.monotonic()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return time.monotonic() - started
+
+    assert run(fake, api, cancel_soon) < 1.0
+    assert fake.in_flight == 0
+
+
+def test_close_cancels_in_flight_requests_and_leaves_a_passed_in_api_open(api, reference, monkeypatch):
+    fake = FakeGemini(delay=30)
+    closed = []
+    monkeypatch.setattr(api, "close", lambda: closed.append(api))
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+        async_api = AsyncTerrainGeneratorAPI(api=api, client=client)
+        task = asyncio.ensure_future(async_api.generate_heightmap_images([reference], use_cache=False))
+        while not fake.requests:
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(async_api.close(), 1.0)
+        assert task.cancelled()
+        assert not client.is_closed
+        await client.aclose()
+
+    asyncio.run(main())
+    assert closed == []
@@ -0,0 +1,134 @@
+import json
+import os
+from concurrent.futures import Future
+
+import pytest
+
+import cli
+from batch import load_completed_ids, load_manifest, load_undeployed, run_batch
+
+
+class FakeAPI:
+    """Stands in for ``TerrainGeneratorAPI``'s batch steps; ``fail`` lists set ids whose heightmap step raises."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.generated = []
+
+    def prepare_reference_payloads(self, images):
+        return list(images)
+
+    def generate_heightmap_step(self, payloads, use_cache=True):
+        set_id = os.path.basename(os.path.dirname(payloads[0]))
+        if set_id in self.fail:
+            raise RuntimeError(f"no heightmap for {set_id}")
+        self.generated.append(set_id)
+        return f"heightmap:{set_id}"
+
+    def generate_texture_step(self, heightmap, payloads, use_cache=True):
+        return f"texture:{heightmap}"
+
+    def save_heightfield_images(self, images, generate_texture, output_dir=None, name=None, **kwargs):
+        os.makedirs(output_dir, exist_ok=True)
+        return {"heightfield_path": os.path.join(output_dir, f"heightfield_{name}.png"),
+                "texture_path": os.path.join(output_dir, f"texture_{name}.png") if len(images) > 1 else None}
+
+
+class FakeFarm:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.deployed = []
+
+    def deploy(self, hf_path, tex_path=None):
+        future = Future()
+        self.deployed.append(hf_path)
+        if any(set_id in hf_path for set_id in self.fail):
+            future.set_exception(ConnectionError("Terragen went away"))
+        else:
+            future.set_result({"endpoint": "render1:36971", "changes": 1, "project": hf_path + ".tgd"})
+        return future
+
+
+@pytest.fixture
+def sets(tmp_path):
+    refs = tmp_path / "refs"
+    for set_id in ("alps", "dunes", "fjord"):
+        (refs / set_id).mkdir(parents=True)
+        (refs / set_id / "a.jpg").write_bytes(b"")
+    return load_manifest(str(refs))
+
+
+def records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_manifest_formats(tmp_path):
+    (tmp_path / "list.json").write_text(json.dumps([{"id": "a", "images": ["x.jpg"]}, {"images": ["/abs/y.jpg"]}]))
+    (tmp_path / "sets.jsonl").write_text('{"id": "a", "images": ["x.jpg"], "texture": false}\n\n{"images": []}\n')
+
+    listed = load_manifest(str(tmp_path / "list.json"))
+    assert [s["id"] for s in listed] == ["a", "set_00002"]
+    assert listed[0]["images"] == [os.path.join(str(tmp_path), "x.jpg")]
+    assert listed[1]["images"] == ["/abs/y.jpg"]
+    lines = load_manifest(str(tmp_path / "sets.jsonl"), generate_texture=True)
+    assert [s["texture"] for s in lines] == [False, True]
+
+
+@pytest.mark.parametrize("set_id", ["../escape", "/abs", "a/b", "a\\b", "..", ".", "C:x", " padded"])
+def test_manifest_rejects_ids_that_are_not_folder_names(tmp_path, set_id):
+    (tmp_path / "sets.jsonl").write_text(json.dumps({"id": set_id, "images": []}))
+    with pytest.raises(ValueError):
+        load_manifest(str(tmp_path / "sets.jsonl"))
+
+
+def test_manifest_rejects_duplicate_ids(tmp_path):
+    (tmp_path / "sets.jsonl").write_text('{"id": "a"}\n{"id": "a"}\n')
+    with pytest.raises(ValueError):
+        load_manifest(str(tmp_path / "sets.jsonl"))
+
+
+def test_run_batch_records_done_and_failed_sets(tmp_path, sets):
+    results = str(tmp_path / "out" / "results.jsonl")
+    done, failed = run_batch(FakeAPI(fail={"dunes"}), sets, str(tmp_path / "out"), results, workers=2,
+                             log_callback=lambda msg: None)
+
+    assert (done, failed) == (2, 1)
+    by_id = {r["id"]: r for r in records(results)}
+    assert by_id["dunes"]["status"] == "failed" and by_id["dunes"]["stage"] == "heightmap"
+    assert by_id["alps"]["heightfield_path"] == os.path.join(str(tmp_path), "out", "alps", "heightfield_alps.png")
+    assert load_completed_ids(results) == {"alps", "fjord"}
+
+
+def test_resume_only_reruns_unfinished_sets(tmp_path, sets):
+    results = str(tmp_path / "out" / "results.jsonl")
+    run_batch(FakeAPI(fail={"dunes"}), sets, str(tmp_path / "out"), results, log_callback=lambda msg: None)
+
+    api = FakeAPI()
+    done, failed = run_batch(api, sets, str(tmp_path / "out"), results, log_callback=lambda msg: None)
+
+    assert api.generated == ["dunes"]
+    assert (done, failed) == (1, 0)
+    assert load_completed_ids(results) == {"alps", "dunes", "fjord"}
+
+    api = FakeAPI()
+    run_batch(api, sets, str(tmp_path / "out"), results, resume=False, log_callback=lambda msg: None)
+    assert sorted(api.generated) == ["alps", "dunes", "fjord"]
+
+
+def test_resume_redeploys_sets_whose_deploy_failed(tmp_path, sets):
+    results = str(tmp_path / "out" / "results.jsonl")
+    farm = FakeFarm(fail={"fjord"})
+    run_batch(FakeAPI(), sets, str(tmp_path / "out"), results, farm=farm, log_callback=lambda msg: None)
+    assert set(load_undeployed(results)) == {"fjord"}
+
+    api, farm = FakeAPI(), FakeFarm()
+    run_batch(api, sets, str(tmp_path / "out"), results, farm=farm, log_callback=lambda msg: None)
+
+    assert api.generated == []
+    assert farm.deployed == [os.path.join(str(tmp_path), "out", "fjord", "heightfield_fjord.png")]
+    assert load_undeployed(results) == {}
+
+
+def test_cli_usage_names_the_script_it_runs_as():
+    assert cli.build_parser().format_usage().startswith("usage: python src/cli.py")
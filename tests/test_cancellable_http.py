@@ -0,0 +1,98 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from cancellable_http import AbortableHTTPAdapter, CallTimeout, abortable
+from cancellation import CancelToken, JobCancelled
+
+SLOW_SECONDS = 3
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connections go back to the pool
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(SLOW_SECONDS)
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session():
+    session = requests.Session()
+    session.mount("http://", AbortableHTTPAdapter())
+    yield session
+    session.close()
+
+
+def test_deadline_aborts_a_stuck_read(server, session):
+    started = time.monotonic()
+    with pytest.raises(CallTimeout):
+        with abortable(deadline=0.2):
+            session.get(f"{server.url}/slow", timeout=30)
+    assert time.monotonic() - started < SLOW_SECONDS / 2
+
+
+def test_cancel_aborts_a_stuck_read(server, session):
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        with abortable(token, deadline=30):
+            session.get(f"{server.url}/slow", timeout=30)
+    assert time.monotonic() - started < SLOW_SECONDS / 2
+
+
+def test_finished_calls_are_untouched(server, session):
+    with abortable(CancelToken(), deadline=5):
+        assert session.get(f"{server.url}/fast", timeout=5).text == "ok"
+
+
+def test_released_connections_leave_the_scope(server, session):
+    token = CancelToken()
+    with abortable(token, deadline=30):
+        assert session.get(f"{server.url}/fast", timeout=5).text == "ok"
+        # The response is read and its connection is back in the pool: aborting now must not touch it
+        token.cancel()
+
+    with abortable(deadline=5):
+        assert session.get(f"{server.url}/fast", timeout=5).text == "ok"
+
+    # One socket served both calls: the cancel did not shut it down
+    assert server.connections == 1
+
+
+def test_deadline_after_release_does_not_reach_another_call(server, session):
+    with abortable(deadline=0.2):
+        assert session.get(f"{server.url}/fast", timeout=5).text == "ok"
+        time.sleep(0.4)  # the deadline passes with nothing in flight
+
+    assert session.get(f"{server.url}/fast", timeout=5).text == "ok"
+    assert server.connections == 1
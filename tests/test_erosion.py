@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import erosion
+from erosion import erode, erode_heightmap, erode_tiled, process_pool
+from procedural import generate_heightfield_array
+
+SIZE = 192
+
+
+@pytest.fixture(scope="module")
+def heights():
+    return np.asarray(generate_heightfield_array(SIZE, seed=3), dtype=np.float32)
+
+
+def test_tiles_match_whole_map_erosion(heights):
+    whole = erode(heights, talus=4.0 / SIZE)
+    # 40 hydraulic + 20 thermal iterations: nothing moves further than 60 cells
+    tiled = erode_tiled(heights, tile_size=64, overlap=60, processes=2)
+
+    np.testing.assert_allclose(tiled, whole, atol=1e-6)
+    assert np.abs(whole - heights).max() > 0.01
+
+
+def test_tiles_without_overlap_show_seams(heights):
+    whole = erode(heights, talus=4.0 / SIZE)
+    tiled = erode_tiled(heights, tile_size=64, overlap=0, processes=2)
+
+    assert np.abs(tiled - whole)[:, 62:66].max() > 1e-3
+
+
+def test_large_maps_keep_native_resolution_by_default(heights, monkeypatch):
+    def no_resize(*args):
+        raise AssertionError("eroded at a reduced working size")
+
+    monkeypatch.setattr(erosion, "_resize_float", no_resize)
+    eroded = erode_heightmap(heights, processes=2, tile_size=64)
+
+    np.testing.assert_allclose(eroded, erode(heights, talus=4.0 / SIZE), atol=1e-6)
+
+
+def test_downsampling_is_opt_in(heights):
+    eroded = erode_heightmap(heights, processes=1, max_resolution=SIZE // 2)
+
+    assert eroded.shape == heights.shape
+    assert not np.allclose(eroded, erode(heights, talus=4.0 / SIZE), atol=1e-4)
+
+
+def test_process_pool_is_reused():
+    pool = process_pool(2)
+    erode_tiled(np.zeros((64, 64), np.float32), tile_size=32, processes=2)
+
+    assert process_pool(2) is pool
+    assert process_pool(3) is not pool
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import heightfield
+from heightfield import deband_heights, image_to_heights, is_low_precision, save_heightfield
+
+
+@pytest.fixture
+def heights():
+    rng = np.random.default_rng(7)
+    h = np.cumsum(rng.normal(0, 0.01, (45, 70)), axis=1).astype(np.float32)
+    h -= h.min()
+    h /= h.max()
+    return h
+
+
+@pytest.fixture(params=[512, 7], ids=["one-chunk", "many-chunks"])
+def row_chunk(request, monkeypatch):
+    # Small chunks make the writers split the map into several IDAT chunks / TIFF strips
+    monkeypatch.setattr(heightfield, "ROW_CHUNK", request.param)
+    return request.param
+
+
+def test_png16_round_trip(tmp_path, heights, row_chunk):
+    path = save_heightfield(heights, str(tmp_path / "hf"), "png16")
+
+    assert path.endswith(".png")
+    with Image.open(path) as img:
+        assert img.size == (70, 45) and img.mode.startswith("I")
+        assert is_low_precision(img) is False
+        back = image_to_heights(img)
+    np.testing.assert_allclose(back, heights, atol=0.5 / 65535 + 1e-7)
+
+
+def test_tiff32_round_trip(tmp_path, heights, row_chunk):
+    path = save_heightfield(heights, str(tmp_path / "hf"), "tiff32")
+
+    with Image.open(path) as img:
+        assert img.mode == "F"
+        back = np.array(img, dtype=np.float32)
+    np.testing.assert_array_equal(back, heights)
+
+
+@pytest.mark.parametrize("fmt", ["r32", "f32"])
+def test_raw_round_trip(tmp_path, heights, row_chunk, fmt):
+    path = save_heightfield(heights, str(tmp_path / "hf"), fmt)
+
+    np.testing.assert_array_equal(np.fromfile(path, dtype="<f4").reshape(heights.shape), heights)
+
+
+def test_writers_accept_a_memory_map(tmp_path, heights, row_chunk):
+    mapped = np.memmap(str(tmp_path / "heights.f32"), dtype="<f4", mode="w+", shape=heights.shape)
+    mapped[:] = heights
+
+    with Image.open(save_heightfield(mapped, str(tmp_path / "hf"), "tiff32")) as img:
+        np.testing.assert_array_equal(np.array(img), heights)
+    # The writers convert copies of each chunk; the source is never modified
+    np.testing.assert_array_equal(mapped, heights)
+
+
+def test_png16_clips_out_of_range_values(tmp_path):
+    heights = np.array([[-0.5, 0.0, 1.0, 1.5]], dtype=np.float32)
+    with Image.open(save_heightfield(heights, str(tmp_path / "hf"), "png16")) as img:
+        assert list(np.array(img)[0]) == [0, 0, 65535, 65535]
+
+
+def test_unknown_format_is_rejected(tmp_path, heights):
+    with pytest.raises(ValueError):
+        save_heightfield(heights, str(tmp_path / "hf"), "exr")
+
+
+def test_rgb_is_converted_without_8bit_rounding():
+    img = Image.new("RGB", (2, 1))
+    img.putpixel((0, 0), (255, 0, 0))
+    img.putpixel((1, 0), (0, 0, 255))
+    np.testing.assert_allclose(image_to_heights(img)[0], [0.2126, 0.0722], rtol=1e-6)
+
+
+def test_deband_smooths_terraces_but_keeps_cliffs():
+    ramp = np.tile(np.linspace(0.2, 0.22, 64, dtype=np.float32), (16, 1))
+    terraced = np.round(ramp * 255) / 255
+    terraced[:, 48:] += 0.5  # a real cliff
+    smooth = deband_heights(terraced.astype(np.float32).copy())
+
+    interior = slice(8, 40)
+    error = np.abs(smooth - ramp)[:, interior].mean()
+    assert error < 0.6 * np.abs(terraced - ramp)[:, interior].mean()
+    assert smooth[8, 50] - smooth[8, 45] > 0.45
@@ -0,0 +1,175 @@
+import threading
+import time
+
+import pytest
+
+from cancellation import CancelToken, JobCancelled
+from job_manager import CANCELLED, DONE, FAILED, FINISHED, QUEUED, RUNNING, JobManager
+
+
+@pytest.fixture
+def manager():
+    logs = []
+    manager = JobManager(workers=2, log_callback=logs.append)
+    manager.logs = logs
+    yield manager
+    manager.shutdown()
+
+
+def wait_for(job, states=FINISHED, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.state not in states:
+        assert time.monotonic() < deadline, f"job stuck in {job.state}"
+        time.sleep(0.005)
+    return job
+
+
+def blocker():
+    """A job that runs until its token is cancelled or ``release`` is set, checking every few ms."""
+    started, release = threading.Event(), threading.Event()
+
+    def job(token):
+        started.set()
+        while not release.wait(0.005):
+            token.check()
+        return "released"
+
+    return job, started, release
+
+
+def test_cancel_running_job(manager):
+    fn, started, _ = blocker()
+    job = manager.submit(fn)
+    assert started.wait(5)
+    assert job.state == RUNNING
+
+    assert manager.cancel(job.id)
+
+    assert wait_for(job).state == CANCELLED
+    assert job.error is None and job.result is None
+    assert manager.logs == []
+
+
+def test_cancel_queued_job_never_runs(manager):
+    blockers = [blocker() for _ in range(2)]
+    for fn, started, _ in blockers:
+        manager.submit(fn)
+        assert started.wait(5)
+    ran = []
+    queued = manager.submit(lambda token: ran.append(1))
+
+    assert manager.cancel(queued.id)
+    assert queued.state == CANCELLED and queued.token.cancelled
+    for _, _, release in blockers:
+        release.set()
+    # Submitted after it, so done only once a worker has dequeued (and skipped) the cancelled job
+    wait_for(manager.submit(lambda token: None))
+
+    assert ran == []
+    assert queued.started is None
+
+
+def test_cancelled_serial_job_is_skipped(manager):
+    fn, started, release = blocker()
+    first = manager.submit(fn, serial="terragen")
+    assert started.wait(5)
+    order = []
+    skipped = manager.submit(lambda token: order.append("skipped"), serial="terragen")
+    last = manager.submit(lambda token: order.append("last"), serial="terragen")
+    assert skipped.state == last.state == QUEUED
+
+    manager.cancel(skipped.id)
+    release.set()
+
+    assert wait_for(last).state == DONE
+    assert wait_for(first).state == DONE and first.result == "released"
+    assert order == ["last"]
+    # The serial slot is free again once the queue drains
+    assert wait_for(manager.submit(lambda token: "again", serial="terragen")).result == "again"
+
+
+def test_cancel_interrupts_blocking_waits(manager):
+    aborted = threading.Event()
+    entered = threading.Event()
+
+    def job(token):
+        unregister = token.on_cancel(aborted.set)
+        try:
+            entered.set()
+            aborted.wait(5)
+            token.check()
+        finally:
+            unregister()
+
+    running = manager.submit(job)
+    assert entered.wait(5)
+    started = time.monotonic()
+    manager.cancel(running.id)
+
+    assert wait_for(running).state == CANCELLED
+    assert time.monotonic() - started < 1
+
+
+def test_errors_after_cancel_count_as_cancelled(manager):
+    fn_started = threading.Event()
+
+    def job(token):
+        fn_started.set()
+        token.wait(5)
+        raise ConnectionError("socket shut down by cancel")
+
+    cancelled = manager.submit(job)
+    assert fn_started.wait(5)
+    manager.cancel(cancelled.id)
+
+    assert wait_for(cancelled).state == CANCELLED
+    assert isinstance(cancelled.error, ConnectionError)
+    assert manager.logs == []
+
+    failed = manager.submit(lambda token: 1 / 0, label="divide")
+    assert wait_for(failed).state == FAILED
+    assert manager.logs == ["Job 'divide' failed: division by zero"]
+
+
+def test_cancel_finished_or_unknown_job(manager):
+    job = wait_for(manager.submit(lambda token: 42))
+    assert job.state == DONE and job.result == 42
+    assert manager.cancel(job.id) is False
+    assert manager.cancel(9999) is False
+    assert job.state == DONE
+
+
+def test_cancel_all_and_shutdown():
+    changes = []
+    manager = JobManager(workers=1, on_change=changes.append, log_callback=lambda msg: None)
+    fn, started, _ = blocker()
+    running = manager.submit(fn)
+    assert started.wait(5)
+    queued = manager.submit(lambda token: None)
+
+    manager.shutdown()
+
+    assert wait_for(running).state == CANCELLED
+    assert queued.state == CANCELLED and queued.started is None
+    assert not manager.active()
+    assert {job.state for job in changes} == {CANCELLED}
+    with pytest.raises(RuntimeError):
+        manager.submit(lambda token: None)
+
+
+def test_token_check_raises_once_cancelled():
+    token = CancelToken()
+    token.check()
+    calls = []
+    unregister = token.on_cancel(lambda: calls.append("first"))
+    token.on_cancel(lambda: calls.append("second"))
+    unregister()
+
+    token.cancel()
+    token.cancel()
+
+    assert calls == ["second"]
+    with pytest.raises(JobCancelled):
+        token.check()
+    token.on_cancel(lambda: calls.append("late"))
+    assert calls == ["second", "late"]
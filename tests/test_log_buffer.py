@@ -0,0 +1,89 @@
+import logging
+
+import pytest
+
+from log_buffer import LEVELS, LogBuffer, LogEntry, file_logger, guess_level
+
+
+def entry(level, text=""):
+    return LogEntry("12:00:00", level, text or level.lower())
+
+
+def texts(view, start=0, stop=None):
+    return [e.text for e in view.rows(start, len(view) if stop is None else stop)]
+
+
+def test_views_hold_entries_at_or_above_their_level():
+    buffer = LogBuffer(capacity=10)
+    for level in ("DEBUG", "INFO", "WARNING", "ERROR", "INFO", "DEBUG"):
+        buffer.append(entry(level))
+
+    assert texts(buffer.view("DEBUG")) == ["debug", "info", "warning", "error", "info", "debug"]
+    assert texts(buffer.view("INFO")) == ["info", "warning", "error", "info"]
+    assert texts(buffer.view("WARNING")) == ["warning", "error"]
+    assert texts(buffer.view("ERROR")) == ["error"]
+    assert buffer.view() is buffer.view("DEBUG")
+    assert buffer.total == 6
+
+
+def test_each_view_keeps_its_own_last_capacity_entries():
+    buffer = LogBuffer(capacity=3)
+    buffer.append(entry("ERROR", "old error"))
+    for i in range(5):
+        buffer.append(entry("DEBUG", f"debug {i}"))
+
+    # Chatty debug output pushes the error out of the full view only
+    assert texts(buffer.view("DEBUG")) == ["debug 2", "debug 3", "debug 4"]
+    assert texts(buffer.view("ERROR")) == ["old error"]
+    assert buffer.total == 6
+
+
+def test_rows_are_clamped_to_the_ring():
+    buffer = LogBuffer(capacity=4)
+    for i in range(6):
+        buffer.append(entry("INFO", str(i)))
+    view = buffer.view("INFO")
+
+    assert len(view) == 4
+    assert texts(view, 1, 3) == ["3", "4"]
+    assert texts(view, -2, 100) == ["2", "3", "4", "5"]
+    assert view.rows(4, 10) == []
+
+
+def test_empty_views():
+    buffer = LogBuffer(capacity=2)
+    assert all(len(buffer.view(level)) == 0 for level in LEVELS)
+    assert buffer.total == 0
+
+
+@pytest.mark.parametrize("message, level", [
+    ("Error: bad response", "ERROR"),
+    ("CRITICAL ERROR in worker", "ERROR"),
+    ("Deploy failed: no project", "ERROR"),
+    ("Warning: texture missing", "WARNING"),
+    ("Verify: 2 mismatches", "WARNING"),
+    ("Could not reach Terragen", "WARNING"),
+    ("Set filename on Heightfield 01", "DEBUG"),
+    ("  - heading = 120", "DEBUG"),
+    ("Heightmap generated successfully.", "INFO"),
+])
+def test_guess_level(message, level):
+    assert guess_level(message) == level
+
+
+def test_file_logger_writes_levels(tmp_path):
+    logger = logging.getLogger("terrain_ai")
+    saved = logger.handlers[:]
+    logger.handlers.clear()
+    try:
+        path = tmp_path / "logs" / "app.log"
+        log = file_logger(str(path))
+        assert file_logger(str(tmp_path / "other.log")) is log
+        log.warning("texture missing")
+        for handler in log.handlers:
+            handler.flush()
+        assert "WARNING texture missing" in path.read_text(encoding="utf-8")
+    finally:
+        for handler in logger.handlers:
+            handler.close()
+        logger.handlers[:] = saved
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import Stage, StagedPipeline
+
+
+def pipeline_threads():
+    return [t for t in threading.enumerate() if t.name.startswith(("double-", "fail-", "slow-", "fast-"))]
+
+
+def run(stages, items, **kwargs):
+    logs = []
+    results = StagedPipeline(stages, log_callback=logs.append).run(items, **kwargs)
+    return results, logs
+
+
+def test_results_come_back_in_input_order():
+    def double(x):
+        time.sleep(0.001 * (10 - x))  # later items finish first
+        return x * 2
+
+    results, _ = run([Stage("double", double, workers=4), Stage("fast", str, workers=2)], range(10))
+
+    assert [r.value for r in results] == [str(x * 2) for x in range(10)]
+    assert [r.index for r in results] == list(range(10))
+    assert not pipeline_threads()
+
+
+def test_failed_item_skips_later_stages_and_keeps_its_key():
+    reached = []
+
+    def fail(x):
+        if x == "b":
+            raise ValueError("bad input")
+        return x
+
+    results, logs = run([Stage("fail", fail), Stage("fast", reached.append)], ["a", "b", "c"], key=str.upper)
+
+    failed = results[1]
+    assert (failed.key, failed.failed_stage, str(failed.error)) == ("B", "fail", "bad input")
+    assert reached == ["a", "c"]
+    assert logs == ["[B] fail failed: bad input"]
+
+
+def test_stages_overlap():
+    def slow(x):
+        time.sleep(0.05)
+        return x
+
+    started = time.monotonic()
+    run([Stage("slow", slow), Stage("fast", slow)], range(6))
+
+    # Sequential stages would take 12 * 0.05s; overlapped, about 7 * 0.05s
+    assert time.monotonic() - started < 0.5
+
+
+def test_on_result_errors_are_logged_not_raised():
+    def on_result(item):
+        raise RuntimeError("results log is full")
+
+    results, logs = run([Stage("double", lambda x: x * 2)], [1, 2], on_result=on_result)
+
+    assert [r.value for r in results] == [2, 4]
+    assert logs == ["Pipeline result callback failed: results log is full"] * 2
+
+
+def test_workers_stop_when_the_input_raises():
+    def items():
+        yield 1
+        raise OSError("manifest went away")
+
+    with pytest.raises(OSError):
+        run([Stage("double", lambda x: x * 2, workers=3), Stage("fast", str, workers=2)], items())
+
+    assert not pipeline_threads()
+
+
+def test_workers_stop_when_key_raises():
+    with pytest.raises(KeyError):
+        run([Stage("double", lambda x: x, workers=2)], [{"id": "a"}, {}], key=lambda s: s["id"])
+
+    assert not pipeline_threads()
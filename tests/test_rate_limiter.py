@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+from cancellation import CancelToken, JobCancelled
+from rate_limiter import RequestScheduler, TokenBucket, _parse_retry_after
+
+MODEL = "gemini-3-pro-image-preview"
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body
+        self.closed = False
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("no body")
+        return self.body
+
+    def close(self):
+        self.closed = True
+
+
+def sender(*responses):
+    """A ``send_fn`` returning ``responses`` in turn; ``sender.sent`` counts the calls."""
+    queue = list(responses)
+
+    def send():
+        send.sent += 1
+        return queue.pop(0)
+
+    send.sent = 0
+    return send
+
+
+def test_bucket_hands_out_capacity_then_refills_at_its_rate():
+    bucket = TokenBucket(600)  # 10 per second
+    for _ in range(600):
+        assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.1, abs=0.02)
+    assert bucket.acquire() == pytest.approx(0.1, abs=0.05)
+
+
+def test_oversized_request_waits_for_a_full_bucket_instead_of_forever():
+    bucket = TokenBucket(60, capacity=10)
+    assert bucket.try_acquire(1000) == 0.0
+    assert bucket.tokens == 0
+
+
+def test_pause_holds_every_caller_then_allows_one_probe():
+    bucket = TokenBucket(60)
+    bucket.pause(0.2)
+    assert bucket.try_acquire() == pytest.approx(0.2, abs=0.05)
+    time.sleep(0.25)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() > 0
+
+
+def test_cancelled_acquire_stops_waiting(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "CANCEL_POLL_SECONDS", 0.02)
+    bucket = TokenBucket(1)
+    bucket.try_acquire()
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        bucket.acquire(cancel_token=token)
+    assert time.monotonic() - started < 1.0
+
+
+@pytest.mark.parametrize("headers, body, expected", [
+    ({"Retry-After": "7"}, None, 7.0),
+    ({}, {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "2.5s"}]}}, 2.5),
+    ({}, {"error": {"message": "quota"}}, None),
+    ({"Retry-After": "soon"}, None, None),
+])
+def test_retry_after_sources(headers, body, expected):
+    assert _parse_retry_after(FakeResponse(429, headers, body)) == expected
+
+
+def test_throttled_request_is_retried_after_the_server_delay():
+    scheduler = RequestScheduler(limits={MODEL: {"rpm": 6000}})
+    throttled = FakeResponse(429, {"Retry-After": "0"})
+    send = sender(throttled, FakeResponse(200))
+    logs = []
+
+    started = time.monotonic()
+    response = scheduler.submit(MODEL, send, log_callback=logs.append)
+
+    assert response.status_code == 200 and send.sent == 2
+    assert throttled.closed
+    assert time.monotonic() - started < 1.5  # Retry-After plus at most a second of jitter
+    assert logs and "returned 429" in logs[0]
+
+
+def test_429_pauses_the_model_for_other_callers():
+    scheduler = RequestScheduler(limits={MODEL: {"rpm": 6000}})
+    started = time.monotonic()
+    other_sent = []
+
+    def other_caller():
+        scheduler.submit(MODEL, lambda: other_sent.append(time.monotonic() - started) or FakeResponse(200),
+                         log_callback=lambda msg: None)
+
+    def throttled_then_ok():
+        if throttled_then_ok.calls == 0:
+            # Another job asks for the same model just after this one is told to back off
+            threading.Timer(0.05, other_caller).start()
+        throttled_then_ok.calls += 1
+        return FakeResponse(429, {"Retry-After": "0.3"}) if throttled_then_ok.calls == 1 else FakeResponse(200)
+
+    throttled_then_ok.calls = 0
+    scheduler.submit(MODEL, throttled_then_ok, log_callback=lambda msg: None)
+    deadline = time.monotonic() + 2
+    while not other_sent and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert other_sent and other_sent[0] >= 0.3
+
+
+def test_gives_up_after_max_attempts_and_returns_the_last_response():
+    scheduler = RequestScheduler(limits={MODEL: {"rpm": 6000}}, max_attempts=3, base_delay=0.001)
+    send = sender(*(FakeResponse(503) for _ in range(3)))
+
+    response = scheduler.submit(MODEL, send, log_callback=lambda msg: None)
+
+    assert response.status_code == 503 and send.sent == 3
+    assert not response.closed
+
+
+def test_other_errors_are_not_retried():
+    scheduler = RequestScheduler(limits={MODEL: {"rpm": 6000}})
+    send = sender(FakeResponse(400))
+    assert scheduler.submit(MODEL, send, log_callback=lambda msg: None).status_code == 400
+    assert send.sent == 1
+
+
+def test_cancel_ends_a_backoff_sleep():
+    scheduler = RequestScheduler(limits={MODEL: {"rpm": 6000}}, base_delay=60, max_delay=60)
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        scheduler.submit(MODEL, sender(FakeResponse(503, {"Retry-After": "30"})), log_callback=lambda msg: None,
+                         cancel_token=token)
+    assert time.monotonic() - started < 1.0
@@ -0,0 +1,128 @@
+import socket
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from fake_terragen import FakeTerragenServer
+from render_farm import NoHealthyInstance, TerragenFarm
+
+
+@pytest.fixture
+def endpoints():
+    with FakeTerragenServer() as a, FakeTerragenServer() as b:
+        yield [f"127.0.0.1:{a.port}", f"127.0.0.1:{b.port}"]
+
+
+def run_on(delay=0.0):
+    def job(client, *args):
+        time.sleep(delay)
+        return client.endpoint
+    return job
+
+
+def test_idle_instances_take_queued_work(endpoints):
+    farm = TerragenFarm(endpoints, log_callback=lambda msg: None)
+    started = time.monotonic()
+    long_job = farm.submit(run_on(0.6))
+    time.sleep(0.05)
+    short_jobs = [farm.submit(run_on(0.05)) for _ in range(6)]
+
+    busy = long_job.result(timeout=5)
+    ran_on = {f.result(timeout=5) for f in short_jobs}
+    farm.close()
+
+    # The free instance drains the backlog while the other is still on the long job
+    assert ran_on == set(endpoints) - {busy}
+    assert time.monotonic() - started < 1.0
+
+
+def test_job_moves_on_when_an_instance_dies(endpoints):
+    logs = []
+    farm = TerragenFarm(endpoints, log_callback=logs.append)
+
+    def job(client):
+        if client.endpoint == endpoints[0]:
+            raise ConnectionResetError("Terragen crashed")
+        return client.endpoint
+
+    results = [farm.submit(job) for _ in range(4)]
+    assert {f.result(timeout=5) for f in results} == {endpoints[1]}
+    farm.close()
+    assert any("stopped answering" in msg for msg in logs)
+
+
+def test_job_fails_once_every_instance_has_failed_it(endpoints):
+    farm = TerragenFarm(endpoints, log_callback=lambda msg: None)
+
+    def job(client):
+        raise ConnectionResetError("Terragen crashed")
+
+    with pytest.raises(NoHealthyInstance):
+        farm.submit(job).result(timeout=5)
+    farm.close()
+
+
+def test_other_errors_fail_the_job_without_moving_it(endpoints):
+    farm = TerragenFarm(endpoints, log_callback=lambda msg: None)
+    calls = []
+
+    def job(client):
+        calls.append(client.endpoint)
+        raise ValueError("bad heightfield")
+
+    with pytest.raises(ValueError):
+        farm.submit(job).result(timeout=5)
+    farm.close()
+    assert len(calls) == 1
+
+
+def test_no_healthy_instance_fails_at_submit():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    farm = TerragenFarm([f"127.0.0.1:{port}"], log_callback=lambda msg: None)
+
+    with pytest.raises(NoHealthyInstance):
+        farm.submit(run_on()).result(timeout=5)
+    farm.close()
+
+
+def test_close_finishes_queued_jobs(endpoints):
+    farm = TerragenFarm(endpoints[:1], log_callback=lambda msg: None)
+    futures = [farm.submit(run_on(0.02)) for _ in range(5)]
+
+    farm.close()
+
+    assert all(f.done() and f.result() == endpoints[0] for f in futures)
+    with pytest.raises(RuntimeError):
+        farm.submit(run_on())
+
+
+def test_close_can_cancel_queued_jobs(endpoints):
+    farm = TerragenFarm(endpoints[:1], log_callback=lambda msg: None)
+    release = threading.Event()
+    running = farm.submit(lambda client: release.wait(5) and client.endpoint)
+    queued = [farm.submit(run_on()) for _ in range(3)]
+    time.sleep(0.05)
+
+    threading.Timer(0.1, release.set).start()
+    farm.close(cancel_pending=True)
+
+    assert running.result() == endpoints[0]
+    for future in queued:
+        with pytest.raises(CancelledError):
+            future.result()
+
+
+def test_status_reports_each_instance(endpoints):
+    farm = TerragenFarm(endpoints, log_callback=lambda msg: None)
+    for future in [farm.submit(run_on()) for _ in range(4)]:
+        future.result(timeout=5)
+    farm.close()
+
+    rows = farm.status()
+    assert [row["endpoint"] for row in rows] == endpoints
+    assert sum(row["done"] for row in rows) == 4
+    assert all(row["healthy"] and row["running"] is None and row["queued"] == 0 for row in rows)
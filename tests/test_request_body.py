@@ -0,0 +1,43 @@
+import base64
+import json
+
+import pytest
+
+from request_body import StreamingJSONBody
+
+IMAGE = bytes(range(256)) * 41 + b"\x01\x02"
+
+
+def payload(data):
+    return {
+        "contents": [{"parts": [
+            {"text": "Ridged mountains, érosion \"quoted\"\n"},
+            {"inline_data": {"mime_type": "image/jpeg", "data": data}},
+        ]}],
+        "generationConfig": {"temperature": 0.4, "candidateCount": 1, "stop": None, "flags": [True, False]},
+    }
+
+
+def expected(data):
+    return payload(base64.b64encode(bytes(data)).decode("ascii"))
+
+
+@pytest.mark.parametrize("chunk_size", [3, 48, 1000, 48 * 1024])
+@pytest.mark.parametrize("data", [b"", b"x", b"xy", IMAGE, bytearray(IMAGE), memoryview(IMAGE)],
+                         ids=["empty", "one", "two", "bytes", "bytearray", "memoryview"])
+def test_streamed_body_matches_json_dumps(data, chunk_size):
+    body = StreamingJSONBody(payload(data), chunk_size=chunk_size)
+    raw = b"".join(body)
+
+    assert json.loads(raw) == expected(data)
+    assert len(body) == len(raw)
+
+
+def test_body_can_be_replayed():
+    body = StreamingJSONBody(payload(IMAGE))
+    assert b"".join(body) == b"".join(body)
+
+
+def test_chunk_size_is_rounded_to_whole_base64_groups():
+    assert StreamingJSONBody({}, chunk_size=100).chunk_size == 99
+    assert StreamingJSONBody({}, chunk_size=2).chunk_size == 3
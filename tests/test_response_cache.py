@@ -0,0 +1,74 @@
+import os
+import time
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+
+def payload(text, image=b"\x89PNG"):
+    return {"contents": [{"parts": [{"text": text}, {"inline_data": {"mime_type": "image/png", "data": image}}]}]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(cache_dir=str(tmp_path / "responses"))
+
+
+def test_key_covers_model_prompt_and_image_bytes():
+    key = ResponseCache.make_key("model-a", payload("ridges"))
+    assert key == ResponseCache.make_key("model-a", payload("ridges"))
+    assert key != ResponseCache.make_key("model-b", payload("ridges"))
+    assert key != ResponseCache.make_key("model-a", payload("valleys"))
+    assert key != ResponseCache.make_key("model-a", payload("ridges", image=b"\x89PNG\x00"))
+
+
+def test_round_trip(cache):
+    cache.put("ab" * 32, {"candidates": [1]}, model_name="model-a")
+    assert cache.get("ab" * 32) == {"candidates": [1]}
+    assert cache.get("cd" * 32) is None
+
+
+def test_expired_entries_are_dropped(cache, monkeypatch):
+    cache.put("ab" * 32, {"candidates": [1]})
+    path = cache._path_for("ab" * 32)
+    now = time.time()
+    monkeypatch.setattr(response_cache.time, "time", lambda: now + cache.ttl_seconds + 1)
+    assert cache.get("ab" * 32) is None
+    assert not os.path.exists(path)
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path / "responses"), enabled=False)
+    cache.put("ab" * 32, {"candidates": [1]})
+    assert cache.get("ab" * 32) is None
+    assert not os.path.exists(cache.cache_dir)
+
+
+def test_eviction_drops_least_recently_used(cache):
+    keys = [f"{i:02x}" * 32 for i in range(4)]
+    body = {"text": "x" * 1000}
+    for key in keys[:3]:
+        cache.put(key, body)
+    size = os.path.getsize(cache._path_for(keys[0]))
+    # Three entries fit, a fourth does not
+    cache.max_bytes = int(size * 3.5)
+    now = time.time()
+    for age, key in zip((300, 200, 100), keys[:3]):
+        os.utime(cache._path_for(key), (now - age, now - age))
+    # A hit makes the oldest entry the most recently used
+    assert cache.get(keys[0]) == body
+
+    cache.put(keys[3], body)
+
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) == body for key in (keys[0], keys[2], keys[3]))
+    on_disk = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(cache.cache_dir) for name in names)
+    assert on_disk <= cache.max_bytes
+
+
+def test_clear_removes_everything(cache):
+    cache.put("ab" * 32, {"candidates": [1]})
+    cache.clear()
+    assert cache.get("ab" * 32) is None
@@ -0,0 +1,146 @@
+import re
+
+import pytest
+from PIL import Image
+
+from fake_terragen import FakeTerragenServer
+from param_schema import ParamSchema
+from terragen_client import TerragenClient
+from terragen_deploy import AppliedGraphs, deploy_heightfield
+from terragen_session import RPCSession
+
+# Most RPC round trips a deploy into a fresh project may take (currently 71 plain, 102 append)
+ROUND_TRIP_BUDGET = {False: 88, True: 113}
+
+
+def round_trips(summary):
+    return int(re.match(r"(\d+) RPC round trips", summary).group(1))
+
+
+@pytest.fixture
+def server():
+    with FakeTerragenServer() as server:
+        yield server
+
+
+@pytest.fixture
+def paths(tmp_path):
+    tex_path = str(tmp_path / "texture.png")
+    Image.new("RGB", (64, 32)).save(tex_path)
+    return str(tmp_path / "heightfield.png"), tex_path
+
+
+def deploy(server, paths, append_mode, schema=None, applied_graphs=None):
+    hf_path, tex_path = paths
+    client = TerragenClient("127.0.0.1", server.port)
+    before = server.fake.calls
+    result = deploy_heightfield(client, hf_path, tex_path, append_mode=append_mode, schema=schema,
+                                log_callback=lambda msg: None, applied_graphs=applied_graphs)
+    return result, server.fake.calls - before
+
+
+@pytest.mark.parametrize("append_mode", [False, True], ids=["plain", "append"])
+def test_deploy_round_trips(server, paths, append_mode):
+    result, calls = deploy(server, paths, append_mode)
+
+    assert result["mismatches"] == []
+    assert round_trips(result["summary"]) == calls
+    assert calls <= ROUND_TRIP_BUDGET[append_mode]
+    hf_node = server.fake.nodes_of_class("heightfield_load")[-1]
+    assert hf_node["params"]["filename"] == paths[0]
+    assert server.fake.nodes_of_class("image_map_shader")[-1]["params"]["image_filename"] == paths[1]
+
+
+@pytest.mark.parametrize("append_mode", [False, True], ids=["plain", "append"])
+def test_redeploy_writes_nothing(server, paths, append_mode):
+    first, first_calls = deploy(server, paths, append_mode)
+    second, second_calls = deploy(server, paths, append_mode)
+
+    assert second["changes"] == 0
+    assert "(0 writes" in second["summary"]
+    assert round_trips(second["summary"]) == second_calls < first_calls
+
+
+def test_schema_skips_param_names(server, paths, tmp_path):
+    schema = ParamSchema(str(tmp_path / "params.json"), version="test")
+    # Without the applied-graph cache, so the second deploy has to look parameter names up
+    first, first_calls = deploy(server, paths, False, schema=schema)
+    second, second_calls = deploy(server, paths, False, schema=ParamSchema(schema.path, version="test"))
+
+    assert "0 schema hits" in first["summary"]
+    assert "0 schema hits" not in second["summary"]
+    assert round_trips(second["summary"]) == second_calls
+
+
+@pytest.mark.parametrize("append_mode", [False, True], ids=["plain", "append"])
+def test_redeploy_diffs_against_the_applied_graph(server, paths, append_mode, tmp_path):
+    applied = AppliedGraphs()
+    deploy(server, paths, append_mode, applied_graphs=applied)
+    # Parameters a new node was left at its default for are read once, on the first redeploy
+    _, warm_calls = deploy(server, paths, append_mode, applied_graphs=applied)
+    assert warm_calls <= 4
+
+    same, same_calls = deploy(server, paths, append_mode, applied_graphs=applied)
+    # root, project_filepath and children (the drift check)
+    assert same["changes"] == 0 and same_calls == 3
+
+    new_paths = (str(tmp_path / "heightfield_2.png"), paths[1])
+    changed, changed_calls = deploy(server, new_paths, append_mode, applied_graphs=applied)
+    # ... plus the one write and its verify read
+    assert changed["changes"] == 1 and changed_calls == 5
+    assert changed["mismatches"] == []
+    assert server.fake.nodes_of_class("heightfield_load")[-1]["params"]["filename"] == new_paths[0]
+
+
+def test_added_nodes_force_a_full_reread(server, paths):
+    applied = AppliedGraphs()
+    _, first_calls = deploy(server, paths, False, applied_graphs=applied)
+    server.fake.add_node("Hand made shader", "power_fractal_shader_v3")
+
+    result, calls = deploy(server, paths, False, applied_graphs=applied)
+
+    assert result["changes"] == 0
+    assert calls > 10
+
+
+def test_projects_and_endpoints_are_cached_separately(server, paths):
+    applied = AppliedGraphs()
+    deploy(server, paths, False, applied_graphs=applied)
+    server.fake.project_path = "C:/projects/other.tgd"
+
+    _, calls = deploy(server, paths, False, applied_graphs=applied)
+    assert calls > 10
+
+    with FakeTerragenServer() as other:
+        _, other_calls = deploy(other, paths, False, applied_graphs=applied)
+    assert other_calls > 10
+
+
+def test_saved_project_keeps_its_entry(server, paths):
+    applied = AppliedGraphs()
+    first, _ = deploy(server, paths, False, applied_graphs=applied)
+    TerragenClient("127.0.0.1", server.port).save_project("C:/projects/set1.tgd")
+    applied.moved(first["endpoint"], first["project_path"], "C:/projects/set1.tgd")
+
+    result, calls = deploy(server, paths, False, applied_graphs=applied)
+    assert result["project_path"] == "C:/projects/set1.tgd"
+    assert calls <= 4
+
+
+def test_interrupted_deploy_is_not_trusted_next_time(server, paths, tmp_path, monkeypatch):
+    applied = AppliedGraphs()
+    deploy(server, paths, False, applied_graphs=applied)
+
+    def lost_connection(session):
+        session.flush()
+        raise ConnectionError("Terragen went away")
+
+    # The new filename is written, then the deploy dies before it could record anything
+    with monkeypatch.context() as m:
+        m.setattr(RPCSession, "verify", lost_connection)
+        with pytest.raises(ConnectionError):
+            deploy(server, (str(tmp_path / "other.png"), paths[1]), False, applied_graphs=applied)
+
+    result, calls = deploy(server, paths, False, applied_graphs=applied)
+    assert result["changes"] == 1
+    assert server.fake.nodes_of_class("heightfield_load")[-1]["params"]["filename"] == paths[0]
@@ -0,0 +1,104 @@
+import os
+import queue
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from thumbnails import ThumbnailService
+
+
+def direct(fn, *args):
+    fn(*args)
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ThumbnailService(direct, cache_dir=str(tmp_path / "thumbnails"))
+    yield service
+    service.close()
+
+
+def noise_image(path, seed, size=256):
+    # Noise keeps every cached PNG close to the same, incompressible size
+    pixels = np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+    return str(path)
+
+
+def thumbnail(service, path, size=(64, 64)):
+    results = queue.Queue()
+    service.request(path, size, results.put, on_error=results.put)
+    result = results.get(timeout=10)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def cached_files(service):
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(service.cache_dir) for name in names)
+
+
+def test_thumbnail_fits_the_hidpi_edge(service, tmp_path):
+    img = thumbnail(service, noise_image(tmp_path / "a.png", 0, size=600), size=(100, 50))
+    assert max(img.size) == 200
+    assert len(cached_files(service)) == 1
+
+
+def test_disk_cache_is_read_after_restart(tmp_path):
+    source = noise_image(tmp_path / "a.png", 0)
+    first = ThumbnailService(direct, cache_dir=str(tmp_path / "thumbnails"))
+    try:
+        expected = thumbnail(first, source).tobytes()
+    finally:
+        first.close()
+    (cached,) = cached_files(first)
+    os.utime(cached, (0, 0))
+
+    second = ThumbnailService(direct, cache_dir=str(tmp_path / "thumbnails"))
+    try:
+        assert thumbnail(second, source).tobytes() == expected
+    finally:
+        second.close()
+    # A hit counts as a use
+    assert os.path.getmtime(cached) > 0
+
+
+def test_disk_cache_drops_least_recently_used(tmp_path):
+    sources = [noise_image(tmp_path / f"{i}.png", i) for i in range(4)]
+    probe = ThumbnailService(direct, cache_dir=str(tmp_path / "probe"))
+    try:
+        thumbnail(probe, sources[0])
+    finally:
+        probe.close()
+    size = os.path.getsize(cached_files(probe)[0])
+
+    # Three thumbnails fit, a fourth does not
+    service = ThumbnailService(direct, cache_dir=str(tmp_path / "thumbnails"), memory_items=0,
+                               max_bytes=int(size * 3.5))
+    try:
+        for source in sources[:3]:
+            thumbnail(service, source)
+        now = time.time()
+        paths = {source: service._path_for(service.make_key(source, 128)) for source in sources}
+        for age, source in zip((300, 200, 100), sources[:3]):
+            os.utime(paths[source], (now - age, now - age))
+        # Reading the oldest thumbnail back from disk makes it the most recently used
+        thumbnail(service, sources[0])
+
+        thumbnail(service, sources[3])
+    finally:
+        service.close()
+
+    assert not os.path.exists(paths[sources[1]])
+    assert all(os.path.exists(paths[source]) for source in (sources[0], sources[2], sources[3]))
+    assert sum(os.path.getsize(p) for p in cached_files(service)) <= service._disk.max_bytes
+
+
+def test_unreadable_source_reports_an_error(service, tmp_path):
+    bad = tmp_path / "bad.png"
+    bad.write_bytes(b"not an image")
+    with pytest.raises(OSError):
+        thumbnail(service, str(bad))
+    assert cached_files(service) == []
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from api_handler import TerrainGeneratorAPI
+from erosion import erode
+from heightfield import deband_heights, image_to_heights, resample_heights
+from response_cache import ResponseCache
+from tiled_heightfield import TiledHeightfield, erode_store
+
+
+@pytest.fixture
+def heights():
+    rng = np.random.default_rng(5)
+    h = np.cumsum(np.cumsum(rng.normal(0, 1, (150, 130)), axis=0), axis=1).astype(np.float32)
+    h -= h.min()
+    h /= h.max()
+    return h
+
+
+def test_banded_import_matches_whole_image_conversion(tmp_path, heights):
+    img = Image.fromarray((heights * 255).astype(np.uint8))
+    store = TiledHeightfield.from_image(str(tmp_path / "store"), img, tile_size=32, overlap=16, deband=True)
+
+    np.testing.assert_allclose(store.data, deband_heights(image_to_heights(img)), atol=1e-6)
+
+
+def test_float_images_are_normalised_over_the_whole_map(tmp_path, heights):
+    path = str(tmp_path / "hf.tif")
+    Image.fromarray(heights * 300 - 100).save(path)
+    store = TiledHeightfield.from_image(str(tmp_path / "store"), path, tile_size=32)
+
+    np.testing.assert_allclose(store.data, heights, atol=1e-5)
+
+
+@pytest.mark.parametrize("rows, cols", [(400, 347), (61, 50)], ids=["up", "down"])
+def test_banded_resample_matches_whole_map_resize(tmp_path, heights, rows, cols):
+    store = TiledHeightfield.from_array(str(tmp_path / "store"), heights, tile_size=32)
+    resized = store.resampled(str(tmp_path / "resized"), rows, cols)
+
+    assert resized.shape == (rows, cols)
+    np.testing.assert_allclose(resized.data, resample_heights(heights, cols, rows), atol=1e-5)
+
+
+def test_erode_store_matches_whole_map_erosion(tmp_path, heights):
+    store = TiledHeightfield.from_array(str(tmp_path / "store"), heights, tile_size=64, overlap=60)
+    eroded = erode_store(store, processes=2)
+
+    np.testing.assert_allclose(eroded.data, erode(heights, talus=4.0 / 150), atol=1e-6)
+    assert not os.path.exists(str(tmp_path / "store.eroding"))
+
+
+def test_save_goes_through_a_scratch_store_and_cleans_it_up(tmp_path, heights):
+    api = TerrainGeneratorAPI(response_cache=ResponseCache(enabled=False))
+    img = Image.fromarray((heights * 255).astype(np.uint8))
+    logs = []
+
+    result = api.save_heightfield_images([img], False, logs.append, output_dir=str(tmp_path), name="set1",
+                                         output_format="r32", upscale_to=300)
+
+    saved = np.fromfile(result["heightfield_path"], dtype="<f4")
+    assert saved.size == 300 * 260 and saved.min() >= 0.0 and saved.max() <= 1.0
+    with Image.open(result["preview_path"]) as preview:
+        assert preview.size == (260, 300)
+    assert sorted(os.listdir(tmp_path)) == ["heightfield_set1.r32", "preview_set1.png"]
+    assert any(msg.startswith("Eroded heightmap") for msg in logs)